@@ -0,0 +1,607 @@
+#!/usr/local/bin/python
+#
+#  genmapbench.py
+###########################################################################
+#
+#  Purpose:
+#
+#      End-to-end benchmark of the genmapload scripts
+#      (makeMGIMapFile.py, makeGenMapFile.py, checkDMit.py)
+#      against synthetic data in a local Postgres database.
+#
+#  Usage:
+#
+#      genmapbench.py [-s scale] [--snps n] [--markers n] [--dmit n]
+#                     [-w workdir] [--stages stage,...] [-e NAME=VALUE]...
+#                     [--tolerance fraction] [--save-baseline] [--seed n]
+#
+#      -s scale        small, medium or large (default small)
+#                        small  :     10,000 SNPs,    50,000 markers
+#                        medium :  1,000,000 SNPs,   500,000 markers
+#                        large  : 10,000,000 SNPs, 5,000,000 markers
+#      --snps, --markers, --dmit
+#                      override the number of SNPs, markers, D*Mit markers
+#      -w workdir      scratch directory (default /tmp/genmapbench)
+#      --stages        stages to run (default: all, in order)
+#                      makeMGIMapFile,makeGenMapFile,checkDMit
+#      -e NAME=VALUE   extra environment for the stages, e.g.
+#                      -e CMOFFSET_UPDATE_MODE=row -e GENMAP_WORKERS=4
+#      --tolerance     allowed slowdown/growth against the baseline
+#                      (default 0.20)
+#      --save-baseline save the results as the baseline of this scale
+#      --seed          random seed (default 1)
+#
+#  Env Vars:
+#
+#      BENCH_PG_DSN     psycopg2 connection string of a local scratch
+#                       database, e.g. "dbname=genmapbench"
+#      BENCH_PG_SCHEMA  schema for the benchmark tables
+#                       (default genmapbench; dropped and recreated)
+#
+#  Inputs:
+#
+#      - bench/baselines/<scale>.json (if it exists)
+#
+#  Outputs:
+#
+#      - synthetic input files in workdir/input:
+#        Revised_HSmap_SNPs.csv, mgi_map.txt, MIT-marker-data.txt
+#      - stage outputs and logs in workdir/output, workdir/logs
+#      - workdir/results.json
+#      - bench/baselines/<scale>.json (--save-baseline)
+#      - report on stdout: wall time, rows/second and peak RSS per stage,
+#        and the change against the baseline
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  A stage failed or regressed against the baseline
+#
+#  Assumes:
+#
+#      psycopg2 is installed and BENCH_PG_DSN names a database the
+#      user may create a schema in.
+#
+#  Implementation:
+#
+#      1) Generate the SNP map, MGI map and MIT map files.
+#      2) Load matching MRK_Marker, ACC_Accession, coordinate and
+#         MRK_Location_Cache tables into BENCH_PG_SCHEMA.
+#      3) Run each stage as a child process with bench/lib first on
+#         PYTHONPATH, so that the scripts use the local "db" stand-in.
+#      4) Report wall time, rows/second and peak RSS (wait4) per stage.
+#      5) Compare against the stored baseline.
+#
+#  Notes:
+#
+#      No baselines are shipped: wall time and peak RSS depend on the
+#      host and the database, so a baseline is only meaningful on the
+#      host that recorded it.  Until one is saved, a run reports
+#      "No baseline" and compares nothing.  To record the baseline of
+#      a scale on a host, run the tree to compare against with
+#      --save-baseline, e.g. before a change:
+#
+#          genmapbench.py -s medium --save-baseline
+#
+#      or from an older tag (which predates bench/, so copy it in):
+#
+#          git worktree add /tmp/genmapload-base <tag>
+#          cp -r bench /tmp/genmapload-base
+#          /tmp/genmapload-base/bench/genmapbench.py -s medium --save-baseline
+#          mkdir -p bench/baselines
+#          cp /tmp/genmapload-base/bench/baselines/medium.json bench/baselines
+#
+#      then run the tree under test without --save-baseline.
+#      See bench/README.
+#
+###########################################################################
+
+import sys
+import os
+import getopt
+import random
+import time
+import subprocess
+import json
+
+import psycopg2
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+binDir = os.path.join(os.path.dirname(benchDir), 'bin')
+libDir = os.path.join(benchDir, 'lib')
+baselineDir = os.path.join(benchDir, 'baselines')
+
+# scale = (SNPs, markers, D*Mit markers)
+SCALES = {
+    'small' : (10000, 50000, 5000),
+    'medium' : (1000000, 500000, 20000),
+    'large' : (10000000, 5000000, 50000),
+    }
+
+# stage name, script, input/output whose lines are the stage's rows
+STAGES = [
+    ('makeMGIMapFile', 'makeMGIMapFile.py', 'MGI_MAP_FILE'),
+    ('makeGenMapFile', 'makeGenMapFile.py', 'MGI_MAP_FILE'),
+    ('checkDMit', 'checkDMit.py', 'MIT_MAP_FILE'),
+    ]
+
+# chromosome, build 37 length (bp), genetic length (cM)
+# chromosome 20 == X
+CHROMOSOMES = [
+    ('1', 197195432, 98.0), ('2', 181748087, 103.0), ('3', 159599783, 82.0),
+    ('4', 155630120, 85.0), ('5', 152537259, 92.0), ('6', 149517037, 75.0),
+    ('7', 152524553, 74.0), ('8', 131738871, 82.0), ('9', 124076172, 79.0),
+    ('10', 129993255, 76.0), ('11', 121843856, 84.0), ('12', 121257530, 61.0),
+    ('13', 120284312, 64.0), ('14', 125194864, 64.0), ('15', 103494974, 56.0),
+    ('16', 98319150, 57.0), ('17', 95272651, 57.0), ('18', 90772031, 55.0),
+    ('19', 61342430, 54.0), ('20', 166650296, 77.0),
+    ]
+
+# marker chromosomes without SNPs
+OTHER_CHROMOSOMES = ['Y', 'MT', 'XY']
+
+TAB = '\t'
+CRT = '\n'
+
+#
+# Purpose: Converts a SNP map chromosome to a marker chromosome
+#
+def markerChromosome(chr):
+    if chr == '20':
+        return 'X'
+    return chr
+
+#
+# Purpose: Writes the synthetic SNP map (Revised_HSmap_SNPs.csv)
+# Returns: Nothing
+#
+def generateSnpMap(fileName, nSnps, rng):
+
+    fp = open(fileName, 'w')
+    fp.write('snpID,chr,build37,fem_cM,mal_cM,ave_cM\n')
+
+    totalBp = float(sum([c[1] for c in CHROMOSOMES]))
+    snpNum = 0
+
+    for (chr, length, cmLength) in CHROMOSOMES:
+
+        n = max(2, int(nSnps * length / totalBp))
+        fcM = mcM = 0.0
+        step = cmLength / n
+
+        fp.write('zero%s,%s,0,0.000,0.000,0.000\n' % (chr, chr))
+
+        for i in range(1, n):
+            bp = int((i + rng.random()) * length / n)
+
+            # flat runs of cM, as in the real map
+            if rng.random() < 0.6:
+                fcM = fcM + rng.random() * 2.2 * step
+                mcM = mcM + rng.random() * 1.8 * step
+            acM = (fcM + mcM) / 2
+
+            snpNum = snpNum + 1
+            fp.write('rs%d,%s,%d,%.3f,%.3f,%.3f\n' % (snpNum, chr, bp, fcM, mcM, acM))
+
+    fp.close()
+
+#
+# Purpose: Writes the synthetic MGI map (mgi_map.txt), MIT map and
+#          the matching database tables (one file per table)
+# Returns: dictionary of table name -> (file name, columns)
+#
+def generateMarkers(inputDir, dbDir, nMarkers, nDMit, rng):
+
+    tables = {
+        'MRK_Marker' : ['_Marker_key', '_Organism_key', '_Marker_Status_key',
+                        'symbol', 'chromosome', 'cmOffset'],
+        'ACC_Accession' : ['_Object_key', 'accID', 'prefixPart', '_MGIType_key',
+                           '_LogicalDB_key', 'preferred'],
+        'MAP_Coord_Feature' : ['_Object_key', '_MGIType_key', '_Map_key',
+                               'startCoordinate'],
+        'SEQ_Marker_Cache' : ['_Marker_key', '_Qualifier_key', '_Sequence_key'],
+        'SEQ_Coord_Cache' : ['_Sequence_key', 'startCoordinate', 'chromosome'],
+        'MRK_Location_Cache' : ['_Marker_key', 'startCoordinate', 'endCoordinate'],
+        }
+
+    fps = {}
+    for t in tables.keys():
+        fps[t] = open(os.path.join(dbDir, t + '.txt'), 'w')
+
+    def write(table, *values):
+        fps[table].write(string_join([str(v) for v in values]) + CRT)
+
+    fpMGIMap = open(os.path.join(inputDir, 'mgi_map.txt'), 'w')
+
+    weights = [c[1] for c in CHROMOSOMES]
+    totalWeight = float(sum(weights))
+
+    for markerKey in range(1, nMarkers + 1):
+
+        if rng.random() < 0.01:
+            chr = rng.choice(OTHER_CHROMOSOMES)
+            length = 20000000
+        else:
+            r = rng.random() * totalWeight
+            for (chr, length, cmLength) in CHROMOSOMES:
+                r = r - length
+                if r <= 0:
+                    break
+            chr = markerChromosome(chr)
+
+        symbol = 'Gene%d' % (markerKey)
+        accid = 'MGI:%d' % (markerKey)
+        cmOffset = rng.choice(['None', '-1.0', '%.2f' % (rng.random() * 90)])
+
+        write('MRK_Marker', markerKey, 1, 1, symbol, chr, cmOffset)
+        write('ACC_Accession', markerKey, accid, 'MGI:', 2, 1, 1)
+
+        # 10% have no coordinate, the rest are split between
+        # MAP_Coord_Feature and the sequence coordinates
+        # 1% of those are on a different genomic chromosome
+
+        r = rng.random()
+        bp = 'None'
+
+        if r >= 0.1:
+            bp = str(rng.randint(1, length))
+            genomicChr = chr
+            if rng.random() < 0.01:
+                genomicChr = '1'
+            if r < 0.5:
+                write('MAP_Coord_Feature', markerKey, 2, mapKey(genomicChr), bp)
+            else:
+                write('SEQ_Marker_Cache', markerKey, 615419, markerKey)
+                write('SEQ_Coord_Cache', markerKey, bp, genomicChr)
+            if genomicChr != chr:
+                bp = 'None'
+
+        if chr == 'X':
+            chr = '20'
+
+        fpMGIMap.write(string_join([str(markerKey), symbol, accid, chr, bp, cmOffset]) + CRT)
+
+    fpMGIMap.close()
+
+    #
+    # D*Mit markers and the MIT map
+    #
+
+    fpMIT = open(os.path.join(inputDir, 'MIT-marker-data.txt'), 'w')
+    fpMIT.write(string_join(['col%d' % (i) for i in range(1, 16)]) + CRT)
+
+    for i in range(1, nDMit + 1):
+
+        markerKey = nMarkers + i
+        (chr, length, cmLength) = rng.choice(CHROMOSOMES)
+        chr = markerChromosome(chr)
+        symbol = 'D%sMit%d' % (chr, i)
+        accid = 'MGI:%d' % (markerKey)
+        startBP = rng.randint(1, length)
+        endBP = startBP + rng.randint(100, 400)
+
+        write('MRK_Marker', markerKey, 1, 1, symbol, chr, 'None')
+        write('ACC_Accession', markerKey, accid, 'MGI:', 2, 1, 1)
+
+        if rng.random() < 0.05:
+            write('MRK_Location_Cache', markerKey, 'None', 'None')
+        else:
+            write('MRK_Location_Cache', markerKey, startBP, endBP)
+
+        # 10% of the MIT coordinates differ from MGI's
+        if rng.random() < 0.1:
+            delta = rng.randint(1, 1000)
+            startBP = startBP + delta
+            endBP = endBP + delta
+
+        status = rng.random() < 0.9 and 'good' or 'bad'
+
+        tokens = [''] * 15
+        tokens[3] = accid
+        tokens[7] = chr
+        tokens[8] = str(startBP)
+        tokens[9] = str(endBP)
+        tokens[11] = status
+        tokens[14] = '%.2f' % (rng.random() * 90)
+        fpMIT.write(string_join(tokens) + CRT)
+
+    fpMIT.close()
+
+    for t in tables.keys():
+        fps[t].close()
+
+    return tables
+
+def mapKey(chr):
+    return ([markerChromosome(c[0]) for c in CHROMOSOMES] + OTHER_CHROMOSOMES).index(chr) + 1
+
+def string_join(values):
+    return TAB.join(values)
+
+#
+# Purpose: Creates the benchmark schema and bulk-loads the tables
+# Returns: Nothing
+#
+def loadDatabase(dbDir, tables):
+
+    schema = os.getenv('BENCH_PG_SCHEMA', 'genmapbench')
+    conn = psycopg2.connect(os.environ['BENCH_PG_DSN'])
+    cursor = conn.cursor()
+
+    cursor.execute('drop schema if exists %s cascade' % (schema))
+    cursor.execute('create schema %s' % (schema))
+    cursor.execute('set search_path to %s' % (schema))
+
+    cursor.execute('''create table MRK_Marker (
+        _Marker_key int primary key, _Organism_key int, _Marker_Status_key int,
+        symbol text, chromosome text, cmOffset numeric)''')
+    cursor.execute('''create table ACC_Accession (
+        _Object_key int, accID text, prefixPart text, _MGIType_key int,
+        _LogicalDB_key int, preferred int)''')
+    cursor.execute('''create table MAP_Coord_Feature (
+        _Object_key int, _MGIType_key int, _Map_key int, startCoordinate numeric)''')
+    cursor.execute('''create table MAP_Coordinate (
+        _Map_key int, _Object_key int, _MGIType_key int)''')
+    cursor.execute('''create table MRK_Chromosome (
+        _Chromosome_key int, chromosome text)''')
+    cursor.execute('''create table SEQ_Marker_Cache (
+        _Marker_key int, _Qualifier_key int, _Sequence_key int)''')
+    cursor.execute('''create table SEQ_Coord_Cache (
+        _Sequence_key int, startCoordinate numeric, chromosome text)''')
+    cursor.execute('''create table MRK_Location_Cache (
+        _Marker_key int, startCoordinate numeric, endCoordinate numeric)''')
+    cursor.execute('''create table MRK_Offset (
+        _Marker_key int, source int, cmOffset numeric)''')
+
+    chromosomes = [markerChromosome(c[0]) for c in CHROMOSOMES] + OTHER_CHROMOSOMES
+    for i in range(len(chromosomes)):
+        cursor.execute('insert into MRK_Chromosome values (%d, %%s)' % (i + 1), (chromosomes[i],))
+        cursor.execute('insert into MAP_Coordinate values (%d, %d, 27)' % (i + 1, i + 1))
+
+    for t in tables.keys():
+        fp = open(os.path.join(dbDir, t + '.txt'), 'r')
+        cursor.copy_from(fp, t, null = 'None', columns = tables[t])
+        fp.close()
+
+    cursor.execute('create index acc_idx1 on ACC_Accession(_Object_key)')
+    cursor.execute('create index acc_idx2 on ACC_Accession(accID)')
+    cursor.execute('create index coord_idx1 on MAP_Coord_Feature(_Object_key)')
+    cursor.execute('create index seqm_idx1 on SEQ_Marker_Cache(_Marker_key)')
+    cursor.execute('create index seqc_idx1 on SEQ_Coord_Cache(_Sequence_key)')
+    cursor.execute('create index loc_idx1 on MRK_Location_Cache(_Marker_key)')
+    cursor.execute('analyze')
+
+    conn.commit()
+    conn.close()
+
+#
+# Purpose: Runs one stage as a child process
+# Returns: (exit status, wall seconds, peak RSS in KB)
+#
+def runStage(script, env, logFile):
+
+    fpLog = open(logFile, 'w')
+    start = time.time()
+    p = subprocess.Popen([sys.executable, os.path.join(binDir, script)],
+                         cwd = binDir, env = env, stdout = fpLog, stderr = subprocess.STDOUT)
+    (pid, status, rusage) = os.wait4(p.pid, 0)
+    wall = time.time() - start
+    p.returncode = status
+    fpLog.close()
+
+    return (status, wall, rusage.ru_maxrss)
+
+def countLines(fileName):
+    n = 0
+    fp = open(fileName, 'r')
+    for line in fp:
+        n = n + 1
+    fp.close()
+    return n
+
+#
+# Purpose: Compares the results against the baseline
+# Returns: list of regression messages
+#
+def compare(results, baseline, tolerance):
+
+    regressions = []
+
+    for (stage, script, rowsVar) in STAGES:
+        if not results.has_key(stage) or not baseline.has_key(stage):
+            continue
+        for (measure, label) in (('wall', 'wall time'), ('peakRssKb', 'peak RSS')):
+            old = baseline[stage][measure]
+            new = results[stage][measure]
+            if old > 0 and new > old * (1 + tolerance):
+                regressions.append('%s: %s %.2f -> %.2f (+%.0f%%)' %
+                    (stage, label, old, new, 100.0 * (new - old) / old))
+
+    return regressions
+
+def usage():
+    print 'Usage: genmapbench.py [-s small|medium|large] [--snps n] [--markers n] [--dmit n]'
+    print '       [-w workdir] [--stages stage,...] [-e NAME=VALUE]...'
+    print '       [--tolerance fraction] [--save-baseline] [--seed n]'
+    sys.exit(1)
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], 's:w:e:',
+            ['snps=', 'markers=', 'dmit=', 'stages=', 'tolerance=', 'save-baseline', 'seed='])
+    except getopt.GetoptError:
+        usage()
+
+    scale = 'small'
+    workDir = '/tmp/genmapbench'
+    stages = [s[0] for s in STAGES]
+    extraEnv = {}
+    tolerance = 0.20
+    saveBaseline = 0
+    seed = 1
+    sizes = {}
+
+    for (opt, value) in opts:
+        if opt == '-s':
+            if not SCALES.has_key(value):
+                usage()
+            scale = value
+        elif opt == '-w':
+            workDir = value
+        elif opt == '-e':
+            (name, value) = value.split('=', 1)
+            extraEnv[name] = value
+        elif opt == '--snps':
+            sizes['snps'] = int(value)
+        elif opt == '--markers':
+            sizes['markers'] = int(value)
+        elif opt == '--dmit':
+            sizes['dmit'] = int(value)
+        elif opt == '--stages':
+            stages = value.split(',')
+        elif opt == '--tolerance':
+            tolerance = float(value)
+        elif opt == '--save-baseline':
+            saveBaseline = 1
+        elif opt == '--seed':
+            seed = int(value)
+
+    if not os.getenv('BENCH_PG_DSN'):
+        print 'Environment variable not set: BENCH_PG_DSN'
+        sys.exit(1)
+
+    (nSnps, nMarkers, nDMit) = SCALES[scale]
+    nSnps = sizes.get('snps', nSnps)
+    nMarkers = sizes.get('markers', nMarkers)
+    nDMit = sizes.get('dmit', nDMit)
+
+    # a custom size is its own baseline
+    if sizes:
+        scale = '%s-%d-%d-%d' % (scale, nSnps, nMarkers, nDMit)
+
+    inputDir = os.path.join(workDir, 'input')
+    outputDir = os.path.join(workDir, 'output')
+    logDir = os.path.join(workDir, 'logs')
+    dbDir = os.path.join(workDir, 'db')
+    for d in (inputDir, outputDir, logDir, dbDir):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+    #
+    # generate and load the synthetic data
+    #
+
+    rng = random.Random(seed)
+
+    print 'Generating %d SNPs, %d markers, %d D*Mit markers (%s)' % (nSnps, nMarkers, nDMit, scale)
+    start = time.time()
+    snpFile = os.path.join(dbDir, 'Revised_HSmap_SNPs.csv')
+    generateSnpMap(snpFile, nSnps, rng)
+    tables = generateMarkers(inputDir, dbDir, nMarkers, nDMit, rng)
+    print 'Generated in %.1fs' % (time.time() - start)
+
+    start = time.time()
+    loadDatabase(dbDir, tables)
+    print 'Loaded database in %.1fs' % (time.time() - start)
+
+    #
+    # run the stages
+    #
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = libDir + os.pathsep + env.get('PYTHONPATH', '')
+    env['INPUTDIR'] = inputDir
+    env['OUTPUTDIR'] = outputDir
+    env['LOGDIR'] = logDir
+    env['SNP_DOWNLOAD_FILE'] = snpFile
+    env['SNP_MAP_FILE'] = os.path.join(inputDir, 'Revised_HSmap_SNPs.csv')
+    env['MIT_MAP_FILE'] = os.path.join(inputDir, 'MIT-marker-data.txt')
+    env['MIT_DIFF_FILE'] = os.path.join(outputDir, 'mit_diff.txt')
+    env['MGD_DBUSER'] = 'bench'
+    env['MGD_DBPASSWORDFILE'] = '/dev/null'
+    env.update(extraEnv)
+
+    results = {}
+    failed = 0
+
+    for (stage, script, rowsVar) in STAGES:
+
+        if stage not in stages:
+            continue
+
+        stageEnv = dict(env)
+
+        # the export is written next to, not over, the generated MGI map
+        if stage == 'makeMGIMapFile':
+            stageEnv['MGI_MAP_FILE'] = os.path.join(outputDir, 'mgi_map.export.txt')
+        else:
+            stageEnv['MGI_MAP_FILE'] = os.path.join(inputDir, 'mgi_map.txt')
+
+        (status, wall, peakRss) = runStage(script, stageEnv, os.path.join(logDir, stage + '.log'))
+
+        rows = countLines(stageEnv[rowsVar])
+        if stage == 'checkDMit':
+            rows = rows - 1
+
+        results[stage] = {
+            'status' : status,
+            'wall' : wall,
+            'rows' : rows,
+            'rowsPerSec' : wall > 0 and rows / wall or 0,
+            'peakRssKb' : peakRss,
+            }
+
+        if status != 0:
+            failed = 1
+
+    #
+    # report
+    #
+
+    print
+    print '%-16s %8s %10s %12s %12s' % ('stage', 'status', 'wall (s)', 'rows/sec', 'peak RSS KB')
+    for (stage, script, rowsVar) in STAGES:
+        if results.has_key(stage):
+            r = results[stage]
+            print '%-16s %8d %10.2f %12.0f %12d' % (stage, r['status'], r['wall'], r['rowsPerSec'], r['peakRssKb'])
+
+    fp = open(os.path.join(workDir, 'results.json'), 'w')
+    json.dump({'scale' : scale, 'env' : extraEnv, 'stages' : results}, fp, indent = 2, sort_keys = True)
+    fp.close()
+
+    baselineFile = os.path.join(baselineDir, scale + '.json')
+    regressions = []
+
+    if os.path.exists(baselineFile):
+        fp = open(baselineFile, 'r')
+        baseline = json.load(fp)
+        fp.close()
+        regressions = compare(results, baseline['stages'], tolerance)
+        print
+        if regressions:
+            print 'Regressions against %s (tolerance %.0f%%):' % (baselineFile, tolerance * 100)
+            for r in regressions:
+                print '    ' + r
+        else:
+            print 'No regressions against %s' % (baselineFile)
+    else:
+        print
+        print 'No baseline: %s (record one with --save-baseline; see Notes)' % (baselineFile)
+
+    if saveBaseline and not failed:
+        if not os.path.isdir(baselineDir):
+            os.makedirs(baselineDir)
+        fp = open(baselineFile, 'w')
+        json.dump({'scale' : scale, 'env' : extraEnv, 'stages' : results}, fp, indent = 2, sort_keys = True)
+        fp.close()
+        print 'Saved baseline: ' + baselineFile
+
+    if failed or regressions:
+        sys.exit(1)
+
+    sys.exit(0)
@@ -0,0 +1,167 @@
+#
+#  db.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Local stand-in for the MGI "db" module (lib_py_postgres/pg_db.py),
+#      used by genmapbench.py to run the genmapload scripts against a
+#      local Postgres database instead of MGD.
+#
+#      Only the parts of the db API that the genmapload scripts use are
+#      provided.  Rows are returned as dictionaries with case-insensitive
+#      keys, as pg_db does.
+#
+#  Env Vars:
+#
+#      BENCH_PG_DSN     psycopg2 connection string of the local database
+#      BENCH_PG_SCHEMA  schema holding the benchmark tables
+#                       (default genmapbench)
+#
+#  Notes:
+#
+#      The genmapload scripts set "db.setTrace = true"; the MGI python
+#      environment provides "true", so it is provided here as well.
+#
+###########################################################################
+
+import os
+import __builtin__
+
+import psycopg2
+
+if not hasattr(__builtin__, 'true'):
+    __builtin__.true = 1
+    __builtin__.false = 0
+
+setTrace = 0
+
+server = None
+database = None
+user = None
+password = None
+
+onlyOneConnection = 0
+sharedConnection = None
+
+class Row(dict):
+    #
+    # result row with case-insensitive keys
+    #
+
+    def __getitem__(self, key):
+        return dict.__getitem__(self, key.lower())
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key.lower(), value)
+
+    def has_key(self, key):
+        return dict.has_key(self, key.lower())
+
+    __contains__ = has_key
+
+    def get(self, key, default = None):
+        return dict.get(self, key.lower(), default)
+
+def set_sqlServer(s):
+    global server
+    server = s
+
+def set_sqlDatabase(d):
+    global database
+    database = d
+
+def set_sqlUser(u):
+    global user
+    user = u
+
+def set_sqlPassword(p):
+    global password
+    password = p
+
+def set_sqlPasswordFromFile(f):
+    pass
+
+def set_sqlLogin(u, p, s, d):
+    set_sqlUser(u)
+    set_sqlPassword(p)
+    set_sqlServer(s)
+    set_sqlDatabase(d)
+
+def get_sqlServer():
+    return server
+
+def get_sqlDatabase():
+    return database
+
+def get_sqlUser():
+    return user
+
+def connect():
+
+    conn = psycopg2.connect(os.environ['BENCH_PG_DSN'])
+    cursor = conn.cursor()
+    cursor.execute('set search_path to %s' % os.getenv('BENCH_PG_SCHEMA', 'genmapbench'))
+    cursor.close()
+    conn.commit()
+
+    return conn
+
+def useOneConnection(singleConnection = 0):
+    global onlyOneConnection, sharedConnection
+
+    if not singleConnection and sharedConnection:
+        sharedConnection.close()
+        sharedConnection = None
+
+    onlyOneConnection = singleConnection
+
+def getConnection():
+    global sharedConnection
+
+    if onlyOneConnection:
+        if not sharedConnection:
+            sharedConnection = connect()
+        return sharedConnection
+
+    return connect()
+
+#
+# Purpose: Runs one or more SQL commands
+# Returns: list of Rows per command if parser == 'auto' and the command
+#          returns rows, else None (a list of these for a list of commands)
+#
+def sql(cmd, parser = 'auto'):
+
+    if type(cmd) == type([]):
+        return [sql(c, parser) for c in cmd]
+
+    conn = getConnection()
+    cursor = conn.cursor()
+    cursor.execute(cmd)
+
+    results = None
+    if parser == 'auto' and cursor.description:
+        columns = [d[0].lower() for d in cursor.description]
+        results = []
+        for r in cursor.fetchall():
+            row = Row()
+            for i in range(len(columns)):
+                dict.__setitem__(row, columns[i], r[i])
+            results.append(row)
+
+    cursor.close()
+
+    if not onlyOneConnection:
+        conn.commit()
+        conn.close()
+
+    return results
+
+def commit():
+    if sharedConnection:
+        sharedConnection.commit()
+
+def rollback():
+    if sharedConnection:
+        sharedConnection.rollback()
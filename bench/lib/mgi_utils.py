@@ -0,0 +1,16 @@
+#
+#  mgi_utils.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Local stand-in for the MGI "mgi_utils" module, used by
+#      genmapbench.py.  The genmapload scripts import it but do not
+#      call into it.
+#
+###########################################################################
+
+import time
+
+def date(format = '%c'):
+    return time.strftime(format, time.localtime(time.time()))
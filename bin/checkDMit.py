@@ -17,6 +17,8 @@
 #      file that is sourced by the wrapper script:
 #
 #	   MIT_MAP_FILE
+#          MIT_DIFF_FILE
+#          CHECKDMIT_MODE (batch|database, default batch)
 #
 #  Inputs:
 #
@@ -33,6 +35,12 @@
 #
 #	- report
 #
+#      - metrics file ($LOGDIR/checkDMit.metrics.json)
+#        (see loadmetrics.py)
+#
+#      - profiles ($LOGDIR/checkDMit.<stage>.prof, $LOGDIR/checkDMit.profile.txt)
+#        GENMAP_PROFILE=yes only (see loadmetrics.py)
+#
 #  Exit Codes:
 #
 #      0:  Successful completion
@@ -47,6 +55,13 @@
 #      1) Initialize variables.
 #      2) Open files.
 #      3) Process data.
+#         batch mode:    the MIT map is read lookupBatchSize "good" rows
+#                        at a time; the MGI coordinates of each batch are
+#                        read with one query and compared here
+#         database mode: the "good" rows of the MIT map are loaded into
+#                        a temp table (multi-row inserts) and compared
+#                        with one join; the differences are read back
+#                        through a server-side cursor
 #      5) Close files.
 #
 #  Notes:  None
@@ -58,7 +73,10 @@
 
 import sys 
 import os
+import string
 import db
+import loadlib
+import loadmetrics
 
 # file name MIT_MAP_FILE
 mitMapFile = None
@@ -66,10 +84,21 @@ mitMapFile = None
 # file name MIT_DIFF_FILE
 mitDiffFile = None
 
+# how the coordinates are compared (CHECKDMIT_MODE)
+mode = None
+
 # file pointer
 fpMITMap = None
 fpMITDiff = None
 
+# number of MIT map rows compared at a time
+# (one database lookup per batch)
+lookupBatchSize = 1000
+
+# buffer size of the report
+writeBufferSize = 1048576
+
+COMMA = ','
 TAB = '\t'
 CRT = '\n'
 
@@ -83,9 +112,11 @@ CRT = '\n'
 def initialize():
     global mitMapFile, fpMITMap
     global mitDiffFile, fpMITDiff
+    global mode
 
     mitMapFile = os.getenv('MIT_MAP_FILE')
     mitDiffFile = os.getenv('MIT_DIFF_FILE')
+    mode = os.getenv('CHECKDMIT_MODE', 'batch')
 
     rc = 0
 
@@ -100,6 +131,10 @@ def initialize():
         print 'Environment variable not set: MIT_DIFF_FILE'
         rc = 1
 
+    if mode not in ('batch', 'database'):
+        print 'Invalid CHECKDMIT_MODE (batch|database): ' + mode
+        rc = 1
+
     #
     # Initialize file pointers.
     #
@@ -130,7 +165,7 @@ def openFiles():
         return 1
 
     try:
-        fpMITDiff = open(mitDiffFile, 'w')
+        fpMITDiff = open(mitDiffFile, 'w', writeBufferSize)
     except:
         print 'Cannot open map file: ' + mitDiffFile
         return 1
@@ -158,108 +193,245 @@ def closeFiles():
     return 0
 
 #
-# Purpose: Generate a report of differences between
-#          MGI Marker/start/end bp coordinates
-#          and MIT/start/end bp coordinates
-# Returns: 0
+# Purpose: Reads the "good" rows of the MIT map file, one line at a time
+# Returns: generator of (MGI ID, chromosome, start bp, end bp, ave_cM)
+#          all as strings, as they are in the file
 # Assumes: Nothing
-# Effects: None
+# Effects: Nothing
 # Throws: Nothing
 #
-def processReport():
+def mitRows():
 
-    #
-    # create a mitMarker lookup
-    # read in all of the DMit markers in the database
-    # key = marker accession id
-    # value = info
-    #
+    # skip header line
+    fpMITMap.readline()
+
+    for line in fpMITMap:
+
+	loadmetrics.count('rowsRead')
+
+        tokens = line.split(TAB)
+
+	markerID = tokens[3]
+	chr = tokens[7]
+	startBP = tokens[8]
+	endBP = tokens[9]
+	mitStatus = tokens[11]
+	acM = tokens[14]
+
+	# skip if status is not "good"
+
+	if mitStatus != "good":
+	    continue
+
+        yield (markerID, chr, startBP, endBP, acM)
+
+#
+# Purpose: Reads the MGI coordinates of a batch of DMit markers
+# Returns: dictionary
+#          key = marker accession id
+#          value = (symbol, chromosome, startBP, endBP)
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+# Args:
+#   markerIDs   list of marker accession ids
+#
+def lookupMarkers(markerIDs):
+
+    if not markerIDs:
+        return {}
+
+    ids = string.join(["'%s'" % (id.replace("'", "''")) for id in markerIDs], COMMA)
 
     results = db.sql('''
-	  select a.accID, c._Marker_key, m.symbol, m.chromosome,
+	  select a.accID, m.symbol, m.chromosome,
 		 c.startCoordinate as startBP, 
 		 c.endCoordinate as endBP
 	  from MRK_Location_Cache c, MRK_Marker m, ACC_Accession a
 	  where c._Marker_key = m._Marker_key
 	  and m._Organism_key = 1
 	  and m._Marker_Status_key = 1
-	  and lower(m.symbol) like 'd%mit%'
+	  and lower(m.symbol) like 'd%%mit%%'
           and m._Marker_key = a._Object_key
           and a._MGIType_key = 2
           and a._LogicalDB_key = 1
           and a.prefixPart = 'MGI:'
-	  ''', 'auto')
+          and a.accID in (%s)
+	  ''' % (ids), 'auto')
+
+    loadmetrics.count('rowsRead', len(results))
 
     mitMarker = {}
     for r in results:
-        key = r['accID']
-	value = r
-	mitMarker[key] = value
+        mitMarker[r['accID']] = (r['symbol'], r['chromosome'], r['startBP'], r['endBP'])
 
-    #
-    # for each DMit marker in the input file
-    #   if status != "good", skip
-    #
-    #   if the marker can be found in the mitMarker lookup
-    #
-    #   and the mitMarker.startBP != MIT.startBP
-    #   or the mitMarker.endBP != MIT.endBP
-    #
-    #   the print the record
-    #
+    return mitMarker
 
-    lineNum = 0
-    for line in fpMITMap.readlines():
+#
+# Purpose: Writes the differences of a batch of MIT map rows
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: writes the report, in one write per batch
+# Throws: Nothing
+#
+# Args:
+#   rows    list of MIT map rows (see mitRows())
+#
+def writeDiffs(rows):
 
-	lineNum = lineNum + 1
+    mitMarker = lookupMarkers(dict.fromkeys([r[0] for r in rows]).keys())
 
-	# skip header line
-	if lineNum == 1:
-	    continue
-	    
-        tokens = line.split(TAB)
+    diffs = []
 
-	markerID = tokens[3]
-	chr = tokens[7]
-	startBP = tokens[8]
-	endBP = tokens[9]
-	mitStatus = tokens[11]
-	acM = tokens[14]
-
-	# skip if status is not "good"
-
-	if mitStatus != "good":
-	    continue
+    for (markerID, chr, startBP, endBP, acM) in rows:
 
 	if not mitMarker.has_key(markerID):
 	    continue
 
-	m = mitMarker[markerID]
+	(symbol, mgiChr, mgiStartBP, mgiEndBP) = mitMarker[markerID]
 
-	if m['startbp'] == None:
+	if mgiStartBP == None:
 	    msb = 0
         else:
-	    msb = int(m['startbp'])
+	    msb = int(mgiStartBP)
 
-	if m['endbp'] == None:
+	if mgiEndBP == None:
 	    csb = 0
         else:
-	    csb = int(m['endbp'])
+	    csb = int(mgiEndBP)
 
 	#
 	# check differences
 	#
 
 	if msb != int(startBP) or csb != int(endBP):
-	    fpMITDiff.write(markerID + TAB)
-	    fpMITDiff.write(m['symbol'] + TAB)
-	    fpMITDiff.write(m['chromosome'] + TAB)
-	    fpMITDiff.write(str(m['startBP']) + TAB)
-	    fpMITDiff.write(str(m['endBP']) + TAB)
-	    fpMITDiff.write(chr + TAB)
-	    fpMITDiff.write(startBP + TAB)
-	    fpMITDiff.write(endBP + TAB)
-	    fpMITDiff.write(str(acM) + CRT)
+	    diffs.append(string.join([markerID, symbol, mgiChr,
+		str(mgiStartBP), str(mgiEndBP), chr, startBP, endBP, str(acM)], TAB) + CRT)
+
+    loadmetrics.count('rowsWritten', len(diffs))
+    fpMITDiff.write(string.join(diffs, ''))
+
+#
+# Purpose: Generate a report of differences between
+#          MGI Marker/start/end bp coordinates
+#          and MIT/start/end bp coordinates
+# Returns: 0
+# Assumes: Nothing
+# Effects: None
+# Throws: Nothing
+#
+def processReport():
+
+    if mode == 'database':
+        return compareInDatabase()
+
+    #
+    # for each DMit marker in the input file
+    #   if status != "good", skip
+    #
+    #   if the marker can be found in the database
+    #
+    #   and the MGI startBP != MIT.startBP
+    #   or the MGI endBP != MIT.endBP
+    #
+    #   the print the record
+    #
+    # the file is read lookupBatchSize "good" rows at a time;
+    # the MGI coordinates are read for just those markers
+    # (one query per batch), so memory stays at one batch
+    # and the report is in file order
+    #
+
+    rows = []
+
+    for row in mitRows():
+        rows.append(row)
+        if len(rows) >= lookupBatchSize:
+            writeDiffs(rows)
+            rows = []
+
+    writeDiffs(rows)
+
+    return 0
+
+#
+# Purpose: Generate the report of differences in the database:
+#          load the "good" rows of the MIT map into a temp table
+#          and compare them with one join
+# Returns: 0
+# Assumes: Nothing
+# Effects: creates/drops the mitMap temp table
+# Throws: Nothing
+#
+def compareInDatabase():
+
+    #
+    # the MIT values are kept as text, so that the report
+    # shows them exactly as they are in the file
+    #
+
+    db.sql('''create temp table mitMap (
+	      seq int not null,
+	      accID text not null,
+	      chromosome text,
+	      startBP text,
+	      endBP text,
+	      acM text)
+	      ''', None)
+
+    def stagedRows():
+        seq = 0
+        for (markerID, chr, startBP, endBP, acM) in mitRows():
+            seq = seq + 1
+            yield (seq, markerID, chr, startBP, endBP, acM)
+
+    loadlib.insertRows('mitMap', stagedRows())
+
+    db.sql('create index mitMap_idx1 on mitMap(accID)', None)
+    db.sql('analyze mitMap', None)
+
+    #
+    # a null MGI coordinate compares as 0
+    # the report is in file order
+    #
+
+    results = loadlib.fetchRows('mitDiffs', '''
+	  select t.accID, m.symbol, m.chromosome,
+		 c.startCoordinate as startBP,
+		 c.endCoordinate as endBP,
+		 t.chromosome as mitChr, t.startBP as mitStartBP,
+		 t.endBP as mitEndBP, t.acM
+	  from mitMap t, ACC_Accession a, MRK_Marker m, MRK_Location_Cache c
+	  where t.accID = a.accID
+          and a._MGIType_key = 2
+          and a._LogicalDB_key = 1
+          and a.prefixPart = 'MGI:'
+          and a._Object_key = m._Marker_key
+	  and m._Organism_key = 1
+	  and m._Marker_Status_key = 1
+	  and lower(m.symbol) like 'd%mit%'
+	  and m._Marker_key = c._Marker_key
+	  and (coalesce(trunc(c.startCoordinate), 0) != t.startBP::numeric
+	       or coalesce(trunc(c.endCoordinate), 0) != t.endBP::numeric)
+	  order by t.seq
+	  ''')
+
+    diffs = []
+
+    for r in results:
+        diffs.append(string.join([r['accID'], r['symbol'], r['chromosome'],
+            str(r['startBP']), str(r['endBP']),
+            r['mitChr'], r['mitStartBP'], r['mitEndBP'], r['acM']], TAB) + CRT)
+        if len(diffs) >= lookupBatchSize:
+            loadmetrics.count('rowsWritten', len(diffs))
+            fpMITDiff.write(string.join(diffs, ''))
+            diffs = []
+
+    loadmetrics.count('rowsWritten', len(diffs))
+    fpMITDiff.write(string.join(diffs, ''))
+
+    db.sql('drop table mitMap', None)
 
     return 0
 
@@ -267,13 +439,15 @@ def processReport():
 #  MAIN
 #
 
-if initialize() != 0:
+loadmetrics.start('checkDMit', db)
+
+if loadmetrics.run('initialize', initialize) != 0:
     sys.exit(1)
 
-if openFiles() != 0:
+if loadmetrics.run('openFiles', openFiles) != 0:
     sys.exit(1)
 
-if processReport() != 0:
+if loadmetrics.run('processReport', processReport) != 0:
     closeFiles()
     sys.exit(1)
 
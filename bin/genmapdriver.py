@@ -0,0 +1,554 @@
+#!/usr/local/bin/python
+#
+#  genmapdriver.py
+###########################################################################
+#
+#  Purpose:
+#
+#      This script will run the stages of the Genetic Map load
+#      (GENMAP_DRIVER=yes; see genmapload.sh) as a graph of stages
+#      with declared inputs, in one process:
+#
+#        checkDMit    : checkDMit.py (command)
+#        mgiExport    : makeMGIMapFile.py (in-process)
+#                       (not in pipeline mode)
+#        genMap       : makeGenMapFile.py (in-process)
+#                       after mgiExport
+#        loadGenMap   : loadGenMapFile.py (in-process)
+#                       after genMap, if CMOFFSET_UPDATE_MODE=file
+#        cacheRefresh : refreshLocations.py (command)
+#                       after genMap/loadGenMap
+#
+#      A stage is started as soon as the stages it depends on have
+#      finished; if one of them failed, it is not run (blocked), but
+#      the stages that do not depend on the failed stage still run and
+#      the failures are reported at the end.  Commands run concurrently
+#      with the other stages
+#      (checkDMit runs while the MGI map is exported); the in-process
+#      stages run one at a time over one database connection.
+#
+#      A stage is skipped if the checksums of its input files and its
+#      settings are the same as at its last successful run, or if all
+#      of the stages it depends on were skipped and its own last run
+#      succeeded.  Stages that read the database are never skipped on
+#      their checksums.
+#
+#  Usage:
+#
+#      genmapdriver.py
+#
+#  Env Vars:
+#
+#      The following environment variables are set by the configuration
+#      file that is sourced by the wrapper script:
+#
+#          GENMAP_DRIVER_STATE
+#          MRKCACHELOAD
+#          GENMAP_PIPELINE, CMOFFSET_UPDATE_MODE, MGI_MAP_FORMAT,
+#          GENMAP_WORKERS, GENMAP_DB_CONNECTIONS, GENMAP_SNP_MAPS
+#          (and those of the scripts of each stage)
+#
+#  Inputs:
+#
+#      - state of the last run ($GENMAP_DRIVER_STATE)
+#        JSON: stage -> signature (md5 of the checksums of its input
+#        files and of its settings) of its last successful run,
+#        or "succeeded" for a stage without a signature;
+#        a stage that is started is removed until it succeeds
+#
+#      - the inputs of each stage
+#
+#  Outputs:
+#
+#      - state of this run ($GENMAP_DRIVER_STATE), saved after each stage
+#
+#      - metrics file ($LOGDIR/genmapdriver.metrics.json)
+#        the steps of the in-process stages (<stage>.initialize, ...),
+#        the commands and the skipped stages (see loadmetrics.py);
+#        commands that are Python scripts write their own metrics file
+#
+#      - the outputs of each stage
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  An exception occurred, or a stage failed
+#
+#  Assumes:  Nothing
+#
+#  Implementation:
+#
+#      This script will perform following steps:
+#
+#      1) Initialize variables; declare the stages.
+#      2) Run the stages.
+#         after a stage fails, the stages that depend on it are not
+#         started (blocked); the other stages still run
+#
+#  Notes:
+#
+#      genMap is run as a command (makeGenMapFile.py) in parallel mode
+#      (GENMAP_WORKERS or GENMAP_DB_CONNECTIONS > 1), so that its worker
+#      processes do not inherit the shared database connection.
+#
+#      A skipped stage does not rewrite its output files.
+#
+###########################################################################
+
+import sys
+import os
+import time
+import json
+import string
+import hashlib
+import subprocess
+import traceback
+import db
+import loadmetrics
+import snpmaplib
+import makeMGIMapFile
+import makeGenMapFile
+import loadGenMapFile
+
+# file name GENMAP_DRIVER_STATE
+stateFile = None
+
+# signatures of the last successful run of each stage
+# key = stage name
+# value = signature (or SUCCEEDED)
+state = {}
+
+# the stages, in the order they were declared
+stages = []
+
+# key = stage name
+# value = Stage
+stageByName = {}
+
+# seconds between checks of the running commands
+pollInterval = 1
+
+# an input that is never unchanged: the stage reads the database
+DATABASE = 'database'
+
+# the state of a stage without a signature whose last run succeeded
+SUCCEEDED = 'succeeded'
+
+# the settings of makeGenMapFile.py that change its outputs
+# (not the ones that only tune how it runs: GENMAP_THREADED,
+# GENMAP_QUEUE_SIZE, GENMAP_WORKERS, GENMAP_DB_CONNECTIONS,
+# SNP_CACHE_FILE, CMOFFSET_COMMIT_SIZE, GENMAP_CHECKPOINT)
+GENMAP_SETTINGS = ['CMOFFSET_TOLERANCE', 'CMOFFSET_UPDATE_MODE',
+                   'SNP_MAP_FILE', 'MGI_MAP_FORMAT', 'MGI_MAP_FILE',
+                   'MGI_MAP_BINARY_FILE', 'MGI_MAP_DEBUG_TAP',
+                   'GENMAP_INCREMENTAL', 'MGI_MAP_SNAPSHOT',
+                   'GENMAP_ALL_MAPS_FILE', 'NEW_MAP_FILE',
+                   'GENMAP_CHANGED_KEYS_FILE']
+
+# directory of the scripts
+BINDIR = os.path.dirname(os.path.abspath(__file__))
+
+class Stage:
+    #
+    # One stage of the load
+    #
+
+    def __init__(self, name, run = None, command = None, deps = [], inputs = [], settings = []):
+        self.name = name
+
+        # function (in-process stage) or command line (command)
+        self.run = run
+        self.command = command
+
+        # names of the stages this stage runs after
+        self.deps = deps
+
+        # names of the environment variables of its input files
+        # (or DATABASE), and of its settings
+        self.inputs = inputs
+        self.settings = settings
+
+        # None (not started), 'running', 'done', 'skipped', 'failed'
+        self.status = None
+
+        self.process = None
+        self.start = None
+        self.signature = None
+
+#
+# Purpose: Declares a stage
+# Returns: Nothing
+#
+def addStage(stage):
+
+    stages.append(stage)
+    stageByName[stage.name] = stage
+
+#
+# Purpose: Initialization
+# Returns: 1 if an environment variable is not set, else 0
+# Assumes: Nothing
+# Effects: reads the state of the last run, declares the stages
+# Throws: Nothing
+#
+def initialize():
+    global stateFile, state
+
+    stateFile = os.getenv('GENMAP_DRIVER_STATE')
+    mrkCacheLoad = os.getenv('MRKCACHELOAD')
+
+    rc = 0
+
+    #
+    # Make sure the environment variables are set.
+    #
+    if not stateFile:
+        print 'Environment variable not set: GENMAP_DRIVER_STATE'
+        rc = 1
+
+    if not mrkCacheLoad:
+        print 'Environment variable not set: MRKCACHELOAD'
+        rc = 1
+
+    if rc != 0:
+        return rc
+
+    try:
+        fp = open(stateFile, 'r')
+        state = json.load(fp)
+        fp.close()
+    except (IOError, ValueError):
+        state = {}
+
+    pipeline = os.getenv('GENMAP_PIPELINE', 'no') == 'yes'
+    fileMode = os.getenv('CMOFFSET_UPDATE_MODE', 'bulk') == 'file'
+
+    try:
+        parallel = int(os.getenv('GENMAP_WORKERS', '1')) > 1 or \
+                   int(os.getenv('GENMAP_DB_CONNECTIONS', '1')) > 1
+    except ValueError:
+        # makeGenMapFile.py reports it
+        parallel = False
+
+    if os.getenv('MGI_MAP_FORMAT', 'text') == 'binary':
+        mgiMapInput = 'MGI_MAP_BINARY_FILE'
+    else:
+        mgiMapInput = 'MGI_MAP_FILE'
+
+    #
+    # declare the stages
+    #
+
+    addStage(Stage('checkDMit',
+                   command = [os.path.join(BINDIR, 'checkDMit.py')],
+                   inputs = ['MIT_MAP_FILE', DATABASE]))
+
+    if pipeline:
+        genMapDeps = []
+        genMapInputs = ['SNP_DOWNLOAD_FILE', DATABASE]
+    else:
+        addStage(Stage('mgiExport', run = mgiExport, inputs = [DATABASE]))
+        genMapDeps = ['mgiExport']
+        genMapInputs = ['SNP_DOWNLOAD_FILE', mgiMapInput]
+
+    if parallel:
+        genMapStage = Stage('genMap', command = [os.path.join(BINDIR, 'makeGenMapFile.py')])
+    else:
+        genMapStage = Stage('genMap', run = genMap)
+
+    #
+    # the other SNP maps (GENMAP_SNP_MAPS): each map file is an input,
+    # each output file a setting
+    #
+    genMapSettings = GENMAP_SETTINGS + ['GENMAP_SNP_MAPS']
+
+    for name in os.getenv('GENMAP_SNP_MAPS', '').split():
+        genMapInputs.append('SNP_MAP_FILE_' + name)
+        genMapSettings.append('GENMAP_MAP_FILE_' + name)
+
+    genMapStage.deps = genMapDeps
+    genMapStage.inputs = genMapInputs
+    genMapStage.settings = genMapSettings
+    addStage(genMapStage)
+
+    if fileMode:
+        addStage(Stage('loadGenMap', run = loadGenMap, deps = ['genMap']))
+        cacheDeps = ['loadGenMap']
+    else:
+        cacheDeps = ['genMap']
+
+    addStage(Stage('cacheRefresh',
+                   command = [os.path.join(BINDIR, 'refreshLocations.py')],
+                   deps = cacheDeps))
+
+    return 0
+
+#
+# Purpose: Keeps one database connection open for all of the
+#          in-process stages
+# Returns: the db.useOneConnection() that closes it
+# Assumes: Nothing
+# Effects: the stages' own db.useOneConnection() calls do nothing
+# Throws: Nothing
+#
+def shareConnection():
+
+    useOneConnection = db.useOneConnection
+    useOneConnection(1)
+
+    def keepConnection(value):
+        pass
+
+    db.useOneConnection = keepConnection
+
+    return useOneConnection
+
+#
+# Purpose: Runs the steps of a stage's script
+# Returns: 0, or the status of the step that failed
+# Assumes: Nothing
+# Effects: runs each step as a metrics stage (<stage>.<step>),
+#          then the script's closeFiles()
+# Throws: Nothing
+#
+# Args:
+#   stage     stage name
+#   module    the stage's script
+#   steps     names of the functions to run, in order
+#
+def runScript(stage, module, steps):
+
+    rc = 0
+
+    for step in steps:
+        rc = loadmetrics.run(stage + '.' + step, getattr(module, step))
+        if rc != 0:
+            break
+
+    module.closeFiles()
+
+    return rc
+
+def mgiExport():
+    return runScript('mgiExport', makeMGIMapFile, ('initialize', 'openFiles', 'getMap'))
+
+def genMap():
+    return runScript('genMap', makeGenMapFile, ('initialize', 'openFiles', 'genMap'))
+
+def loadGenMap():
+    return runScript('loadGenMap', loadGenMapFile, ('initialize', 'openFiles', 'loadMap'))
+
+#
+# Purpose: Computes the signature of a stage's inputs
+# Returns: md5 of the checksums of its input files and of its settings,
+#          or None if it reads the database or has no inputs
+# Assumes: the stages it depends on have finished
+# Effects: Nothing
+# Throws: Nothing
+#
+def signature(stage):
+
+    if not stage.inputs or DATABASE in stage.inputs:
+        return None
+
+    md5 = hashlib.md5()
+
+    for name in stage.inputs:
+        try:
+            sum = snpmaplib.checksum(os.getenv(name))
+        except (IOError, TypeError):
+            sum = 'missing'
+        md5.update('%s=%s\n' % (name, sum))
+
+    for name in stage.settings:
+        md5.update('%s=%s\n' % (name, os.getenv(name)))
+
+    return md5.hexdigest()
+
+#
+# Purpose: Saves the state of this run
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: replaces the state file atomically
+# Throws: Nothing
+#
+def saveState():
+
+    tmpFile = stateFile + '.tmp'
+
+    try:
+        fp = open(tmpFile, 'w')
+        json.dump(state, fp, indent = 2, sort_keys = True)
+        fp.close()
+        os.rename(tmpFile, stateFile)
+    except (IOError, OSError), e:
+        print 'Cannot write state file: ' + stateFile + ': ' + str(e)
+
+#
+# Purpose: Checks whether a stage can be skipped
+# Returns: why it is skipped: all of the stages it depends on were
+#          skipped and its own last run succeeded, or its inputs are
+#          unchanged since its last successful run; else None
+#
+def isSkipped(stage):
+
+    if stage.deps and not [d for d in stage.deps if stageByName[d].status != 'skipped'] and \
+       state.get(stage.name) == (stage.signature or SUCCEEDED):
+        return 'dependencies skipped'
+
+    if stage.signature is not None and state.get(stage.name) == stage.signature:
+        return 'inputs unchanged'
+
+    return None
+
+#
+# Purpose: Starts (or skips) a stage
+# Returns: Nothing
+# Assumes: the stages it depends on have finished
+# Effects: runs an in-process stage to completion;
+#          starts a command
+# Throws: Nothing
+#
+def startStage(stage):
+
+    stage.signature = signature(stage)
+    stage.start = time.time()
+
+    reason = isSkipped(stage)
+
+    if reason:
+        stage.status = 'skipped'
+        print 'Skip stage: %s (%s)' % (stage.name, reason)
+        loadmetrics.record(stage.name, stage.start, stage.start, 0, True)
+        return
+
+    print 'Start stage: %s (%s)' % (stage.name, time.ctime(stage.start))
+    sys.stdout.flush()
+
+    #
+    # until it succeeds, the stage's last run did not
+    #
+    if state.has_key(stage.name):
+        del state[stage.name]
+        saveState()
+
+    if stage.command:
+        try:
+            stage.process = subprocess.Popen(stage.command, close_fds = True)
+            stage.status = 'running'
+        except OSError, e:
+            print 'Cannot run: ' + stage.command[0] + ': ' + str(e)
+            endStage(stage, 1)
+        return
+
+    try:
+        rc = stage.run()
+    except:
+        traceback.print_exc()
+        rc = 1
+
+    endStage(stage, rc)
+
+#
+# Purpose: Ends a stage
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: saves the stage's signature (or SUCCEEDED) if it succeeded
+# Throws: Nothing
+#
+def endStage(stage, rc):
+
+    end = time.time()
+
+    if stage.command:
+        loadmetrics.record(stage.name, stage.start, end, rc)
+
+    if rc == 0:
+        stage.status = 'done'
+        state[stage.name] = stage.signature or SUCCEEDED
+        saveState()
+    else:
+        stage.status = 'failed'
+
+    print 'End stage: %s status %d (%.1f seconds)' % (stage.name, rc, end - stage.start)
+    sys.stdout.flush()
+
+#
+# Purpose: Runs the stages
+# Returns: 0 if every stage was run or skipped, else 1
+# Assumes: initialize() has declared the stages
+# Effects: runs the stages
+# Throws: Nothing
+#
+def runStages():
+
+    while 1:
+
+        progress = 0
+
+        for stage in stages:
+            if stage.status == 'running' and stage.process.poll() is not None:
+                endStage(stage, stage.process.returncode)
+                progress = 1
+
+        #
+        # a stage that depends on a failed (or blocked) stage is not run;
+        # the other stages go on (e.g. the load after a failed checkDMit)
+        #
+
+        for stage in stages:
+            if stage.status is None and \
+               [d for d in stage.deps if stageByName[d].status in ('failed', 'blocked')]:
+                stage.status = 'blocked'
+                print 'Block stage: %s (a stage it depends on failed)' % (stage.name)
+
+        #
+        # start the next stage whose dependencies have finished;
+        # commands first, so that they run during the in-process stages
+        #
+
+        ready = [s for s in stages if s.status is None and
+                 not [d for d in s.deps if stageByName[d].status not in ('done', 'skipped')]]
+        ready.sort(lambda x, y: cmp(x.command is None, y.command is None))
+
+        if ready:
+            startStage(ready[0])
+            progress = 1
+
+        running = [s for s in stages if s.status == 'running']
+
+        if not running and not ready:
+            break
+
+        if not progress:
+            time.sleep(pollInterval)
+
+    for stage in stages:
+        print 'Stage %s: %s' % (stage.name, stage.status or 'not run')
+
+    failed = [s.name for s in stages if s.status not in ('done', 'skipped')]
+
+    if failed:
+        print 'Stages failed or not run: ' + string.join(failed, ', ')
+        return 1
+
+    return 0
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+
+    loadmetrics.start('genmapdriver', db)
+
+    if loadmetrics.run('initialize', initialize) != 0:
+        sys.exit(1)
+
+    closeConnection = shareConnection()
+
+    rc = runStages()
+
+    closeConnection(0)
+
+    sys.exit(rc)
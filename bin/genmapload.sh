@@ -9,7 +9,13 @@
 #
 #  Usage:
 #
-#      genmapload.sh
+#      genmapload.sh [-i | -f]
+#
+#      -i  incremental load (GENMAP_INCREMENTAL=yes): only the markers
+#          added/moved since the last load are re-interpolated
+#      -f  full load (GENMAP_INCREMENTAL=no)
+#
+#      default: GENMAP_INCREMENTAL from the configuration file
 #
 #  Env Vars:
 #
@@ -20,6 +26,7 @@
 #  Outputs:
 #
 #      - Log file (${LOG_DIAG})
+#      - Run summary (${GENMAP_METRICS_FILE})
 #
 #  Exit Codes:
 #
@@ -35,9 +42,21 @@
 #      1) Source the configuration file to establish the environment.
 #      2) Establish the log file.
 #      3) Call makeMGIMapFile.sh to create the MGI map file.
+#         (skipped if GENMAP_PIPELINE=yes; makeGenMapFile.py reads the
+#         MGI markers in-process)
 #      4) Call makeGenMapFile.sh to create/run SQL to update MRK_Marker.cmOffset
-#      5) Call ${MRKCACHELOAD/mrklocation.csh to refresh the marker location cache.
+#         if CMOFFSET_UPDATE_MODE=file, makeGenMapFile.sh only writes
+#         ${NEW_MAP_FILE}; call loadGenMapFile.sh to apply it
+#      5) Call refreshLocations.py to refresh the marker location cache
+#         of the markers in ${GENMAP_CHANGED_KEYS_FILE}, or all of it
+#         (${MRKCACHELOAD}/mrklocation.csh) if more than
+#         GENMAP_REFRESH_THRESHOLD markers changed
+#         if GENMAP_DRIVER=yes, steps 3-5 (and checkDMit.py) are run
+#         by genmapdriver.py instead (see genmapdriver.py)
 #      6) Run ${QCRPTS}/genmapload/runQC.csh
+#      7) Call mergeMetrics.py to merge the metrics of each stage
+#         into the run summary (also when a stage fails, before
+#         checkStatus exits)
 #
 #  Notes:  None
 #
@@ -46,6 +65,7 @@
 cd `dirname $0`
 
 CONFIG=genmapload.config
+Usage="Usage: genmapload.sh [-i | -f]"
 
 #
 # Make sure the configuration file exists and source it.
@@ -58,6 +78,19 @@ else
     exit 1
 fi
 
+#
+# Incremental (-i) or full (-f) load
+#
+while getopts if opt
+do
+    case ${opt} in
+        i) GENMAP_INCREMENTAL=yes;;
+        f) GENMAP_INCREMENTAL=no;;
+        *) echo "${Usage}"; exit 1;;
+    esac
+done
+export GENMAP_INCREMENTAL
+
 #
 #  Source the DLA library functions.
 #
@@ -89,34 +122,102 @@ rm -rf ${LOG}
 touch ${LOG}
 
 #
-# Create the MGI map file.
+# Remove the metrics of the last run.
+#
+RUN_START=`date +%s`
+SHELL_STAGES=""
+rm -f ${LOGDIR}/*.metrics.json
+
 #
-echo "" >> ${LOG}
-date >> ${LOG}
-echo "Call makeMGIMapFile.sh (genmapload.sh)" | tee -a ${LOG}
-./makeMGIMapFile.sh 2>&1 >> ${LOG}
-STAT=$?
-checkStatus ${STAT} "makeMGIMapFile.sh (genmapload.sh)"
+# Merge the metrics of each stage into the run summary
+#
+mergeMetrics()
+{
+    echo "" >> ${LOG}
+    date >> ${LOG}
+    echo "Call mergeMetrics.py (genmapload.sh)" | tee -a ${LOG}
+    ./mergeMetrics.py -r ${RUN_START} ${SHELL_STAGES} 2>&1 >> ${LOG}
+}
+
+#
+# checkStatus exits on a failed stage: write the run summary first
+#
+checkStage()
+{
+    if [ $1 -ne 0 ]
+    then
+        mergeMetrics
+    fi
+    checkStatus $1 "$2"
+}
 
 #
-# Create the new map sql file and run
+# Run the stages with the stage driver
+# (it records the cache refresh in its own metrics)
 #
-echo "" >> ${LOG}
-date >> ${LOG}
-echo "Call makeGenMapFile.sh (genmapload.sh)" | tee -a ${LOG}
-./makeGenMapFile.sh 2>&1 >> ${LOG}
-STAT=$?
-checkStatus ${STAT} "makeGenMapFile.sh (genmapload.sh)"
+if [ "${GENMAP_DRIVER}" = "yes" ]
+then
+    echo "" >> ${LOG}
+    date >> ${LOG}
+    echo "Call genmapdriver.py (genmapload.sh) incremental=${GENMAP_INCREMENTAL}" | tee -a ${LOG}
+    ./genmapdriver.py 2>&1 >> ${LOG}
+    STAT=$?
+    checkStage ${STAT} "genmapdriver.py (genmapload.sh)"
+else
+    #
+    # Create the MGI map file.
+    #
+    if [ "${GENMAP_PIPELINE}" != "yes" ]
+    then
+        echo "" >> ${LOG}
+        date >> ${LOG}
+        echo "Call makeMGIMapFile.sh (genmapload.sh)" | tee -a ${LOG}
+        ./makeMGIMapFile.sh 2>&1 >> ${LOG}
+        STAT=$?
+        checkStage ${STAT} "makeMGIMapFile.sh (genmapload.sh)"
+    fi
+
+    #
+    # Create the new map sql file and run
+    #
+    echo "" >> ${LOG}
+    date >> ${LOG}
+    echo "Call makeGenMapFile.sh (genmapload.sh) incremental=${GENMAP_INCREMENTAL}" | tee -a ${LOG}
+    ./makeGenMapFile.sh 2>&1 >> ${LOG}
+    STAT=$?
+    checkStage ${STAT} "makeGenMapFile.sh (genmapload.sh)"
+
+    #
+    # Apply the new map positions file
+    #
+    if [ "${CMOFFSET_UPDATE_MODE}" = "file" ]
+    then
+        echo "" >> ${LOG}
+        date >> ${LOG}
+        echo "Call loadGenMapFile.sh (genmapload.sh)" | tee -a ${LOG}
+        ./loadGenMapFile.sh 2>&1 >> ${LOG}
+        STAT=$?
+        checkStage ${STAT} "loadGenMapFile.sh (genmapload.sh)"
+    fi
+
+    #
+    # Refresh the Marker Location cache
+    #
+    echo "" >> ${LOG}
+    date >> ${LOG}
+    echo "Call refreshLocations.py (genmapload.sh) ${GENMAP_CHANGED_KEYS_FILE}" | tee -a ${LOG}
+    CACHE_START=`date +%s`
+    ./refreshLocations.py ${GENMAP_CHANGED_KEYS_FILE} 2>&1 >> ${LOG}
+    STAT=$?
+    CACHE_END=`date +%s`
+    SHELL_STAGES="-s cacheRefresh:${CACHE_START}:${CACHE_END}:${STAT}"
+    checkStage ${STAT} "refreshLocations.py (genmapload.sh)"
+fi
 
 #
-# Refresh the Marker Location cache
+# Merge the metrics of each stage into the run summary
 #
-echo "" >> ${LOG}
-date >> ${LOG}
-echo "Call ${MRKCACHELOAD}/mrklocation.csh (genmapload.sh)" | tee -a ${LOG}
-${MRKCACHELOAD}/mrklocation.csh 2>&1 >> ${LOG}
-STAT=$?
-checkStatus ${STAT} "mrklocation.csh (genmapload.sh)"
+mergeMetrics
 
 #
 # run postload cleanup and email logs
@@ -0,0 +1,442 @@
+#!/usr/local/bin/python
+#
+#  genmapserver.py
+###########################################################################
+#
+#  Purpose:
+#
+#      This script is a long-running local service that converts
+#      genome coordinates to map positions (and back) from the SNP map
+#      held in memory, for other loads and curator tools that need
+#      ad-hoc conversions without running makeGenMapFile.py.
+#
+#  Usage:
+#
+#      genmapserver.py
+#
+#      Listens on http://127.0.0.1:${GENMAP_SERVER_PORT}/ only.
+#
+#      GET  /convert?chr=1&pos=3187481[&from=bp][&to=fcM,mcM,acM]
+#
+#           {"chr": "1", "pos": 3187481.0, "from": "bp",
+#            "fcM": 1.663, "mcM": 1.521, "acM": 1.593}
+#
+#      POST /convert
+#           {"from": "bp", "to": ["acM"],
+#            "positions": [["1", 3187481], ["X", 5000000], ...]}
+#
+#           {"from": "bp", "to": ["acM"],
+#            "results": [[1.593], [2.1], ...]}
+#
+#      GET  /status
+#
+#           the SNP map file, its checksum, when it was loaded,
+#           the number of SNPs and the result cache hits/misses
+#
+#      from: bp, fcM, mcM or acM (default bp)
+#      to:   one or more of bp, fcM, mcM, acM (default acM)
+#
+#      bp -> cM is interpolated as makeGenMapFile.py does (SnpMap.convert);
+#      cM -> bp uses the reverse index (SnpMap.reverse).
+#      chromosome "X" is the SNP map's chromosome "20".
+#      A position that cannot be converted (chromosome not in the SNP map,
+#      bp <= 0) gives null.
+#
+#  Env Vars:
+#
+#      The following environment variables are set by the configuration
+#      file that is sourced by the wrapper script:
+#
+#          SNP_MAP_FILE
+#          SNP_CACHE_FILE (optional)
+#          GENMAP_SERVER_PORT
+#          GENMAP_SERVER_CACHE_SIZE (default 100000)
+#          GENMAP_SERVER_POLL (default 60)
+#
+#  Inputs:
+#
+#      - SNP/baseline map ($SNP_MAP_FILE)
+#        see makeGenMapFile.py
+#
+#      - SNP map cache ($SNP_CACHE_FILE)
+#        used instead of parsing $SNP_MAP_FILE if it was built from
+#        the same file (see snpmaplib.py)
+#
+#  Outputs:
+#
+#      - request log on stderr
+#
+#  Exit Codes:
+#
+#      1:  the SNP map could not be loaded or the port could not be opened
+#
+#  Assumes:  Nothing
+#
+#  Implementation:
+#
+#      1) Load the SNP map (from the cache if it matches).
+#      2) Every GENMAP_SERVER_POLL seconds, check the size and modification
+#         time of $SNP_MAP_FILE; if either changed, load the new map and
+#         swap it in (the old map keeps serving until then, and stays if
+#         the new file cannot be parsed), then empty the result cache.
+#      3) Answer requests; each (chromosome, position, from, to) result is
+#         kept in an LRU cache of GENMAP_SERVER_CACHE_SIZE entries.
+#
+#  Notes:  None
+#
+###########################################################################
+
+import sys
+import os
+import time
+import json
+import threading
+import urlparse
+import collections
+import BaseHTTPServer
+import SocketServer
+import snpmaplib
+
+# file name SNP_MAP_FILE, SNP_CACHE_FILE
+snpMapFile = None
+snpCacheFile = None
+
+# the SNP map being served (snpmaplib.SnpMap), and what it was loaded from:
+# checksum, (size, modification time) of snpMapFile, load time
+snpMap = None
+snpChecksum = None
+snpStat = None
+loadedAt = None
+
+# seconds between checks of snpMapFile
+pollInterval = 60
+
+# LRU result cache
+# key = (chromosome, position, from, to)
+# value = converted position (or None)
+cache = collections.OrderedDict()
+cacheSize = 100000
+cacheHits = 0
+cacheMisses = 0
+cacheLock = threading.Lock()
+
+COORDS = {
+    'bp' : snpmaplib.I_BP,
+    'fcM' : snpmaplib.I_FCM,
+    'mcM' : snpmaplib.I_MCM,
+    'acM' : snpmaplib.I_ACM,
+    }
+
+#
+# Purpose: Loads the SNP map
+# Returns: (SnpMap, checksum, (size, modification time))
+# Assumes: Nothing
+# Effects: rebuilds the SNP map cache if it was built from another file
+# Throws: IOError, OSError, ValueError
+#
+def loadSnpMap():
+
+    st = os.stat(snpMapFile)
+    sum = snpmaplib.checksum(snpMapFile)
+    s = None
+
+    if snpCacheFile:
+        s = snpmaplib.readCache(snpCacheFile, sum)
+
+    if not s:
+        fp = open(snpMapFile, 'r')
+        try:
+            s = snpmaplib.readSnpMap(fp)
+        finally:
+            fp.close()
+        s.validate()
+
+        if snpCacheFile:
+            try:
+                snpmaplib.writeCache(s, snpCacheFile, sum)
+            except (IOError, OSError), e:
+                print >> sys.stderr, 'Cannot write SNP map cache: ' + snpCacheFile + ': ' + str(e)
+
+    return (s, sum, (st.st_size, st.st_mtime))
+
+#
+# Purpose: Reloads the SNP map whenever snpMapFile changes
+# Returns: Nothing (runs forever in its own thread)
+# Assumes: Nothing
+# Effects: swaps in the new SNP map, empties the result cache
+# Throws: Nothing
+#
+def watchSnpMap():
+    global snpMap, snpChecksum, snpStat, loadedAt
+
+    while 1:
+
+        time.sleep(pollInterval)
+
+        try:
+            st = os.stat(snpMapFile)
+        except OSError:
+            continue
+
+        if (st.st_size, st.st_mtime) == snpStat:
+            continue
+
+        try:
+            (s, sum, stat) = loadSnpMap()
+        except (IOError, OSError, ValueError), e:
+            print >> sys.stderr, 'Cannot reload SNP map: ' + snpMapFile + ': ' + str(e)
+            # do not retry until the file changes again
+            snpStat = (st.st_size, st.st_mtime)
+            continue
+
+        cacheLock.acquire()
+        try:
+            (snpMap, snpChecksum, snpStat, loadedAt) = (s, sum, stat, time.time())
+            cache.clear()
+        finally:
+            cacheLock.release()
+
+        print >> sys.stderr, 'Reloaded SNP map: %s (%s)' % (snpMapFile, sum)
+
+#
+# Purpose: Converts a list of positions
+# Returns: list of tuples of converted positions, one per toCoords
+#          (None if a position cannot be converted)
+# Assumes: Nothing
+# Effects: adds the results to the result cache
+# Throws: ValueError if a chromosome's cM column cannot be indexed
+#
+# Args:
+#   positions list of (chromosome, position)
+#   fromName  'bp', 'fcM', 'mcM' or 'acM'
+#   toNames   list of 'bp', 'fcM', 'mcM' or 'acM'
+#
+def convertPositions(positions, fromName, toNames):
+    global cacheHits, cacheMisses
+
+    s = snpMap
+    fromCoord = COORDS[fromName]
+    results = [None] * len(positions)
+
+    #
+    # look up the result cache
+    # the rest is converted one batch per chromosome
+    #
+    # key = chromosome
+    # value = [index into positions, ...]
+    #
+
+    byChromosome = {}
+
+    cacheLock.acquire()
+    try:
+        for i in range(len(positions)):
+            (chr, pos) = positions[i]
+            key = (chr, pos, fromName, tuple(toNames))
+            if cache.has_key(key):
+                results[i] = cache.pop(key)
+                cache[key] = results[i]
+                cacheHits = cacheHits + 1
+            else:
+                cacheMisses = cacheMisses + 1
+                if not byChromosome.has_key(chr):
+                    byChromosome[chr] = []
+                byChromosome[chr].append(i)
+    finally:
+        cacheLock.release()
+
+    for chr in byChromosome.keys():
+
+        indexes = byChromosome[chr]
+
+        if not s.has_key(chr):
+            for i in indexes:
+                results[i] = (None,) * len(toNames)
+            continue
+
+        toConvert = [i for i in indexes if fromCoord != snpmaplib.I_BP or positions[i][1] > 0]
+        pos = [positions[i][1] for i in toConvert]
+        columns = {}
+
+        # bp -> cM, cM -> cM: one interval search for all of toNames
+        forward = [n for n in toNames if fromCoord == snpmaplib.I_BP or COORDS[n] != snpmaplib.I_BP]
+        if forward:
+            converted = s.convertBatchMulti(chr, pos, fromCoord, [COORDS[n] for n in forward])
+            for j in range(len(forward)):
+                columns[forward[j]] = converted[j]
+
+        # cM -> bp: the reverse index
+        if fromCoord != snpmaplib.I_BP and 'bp' in toNames:
+            columns['bp'] = s.reverseBatch(chr, pos, fromCoord)
+
+        for i in indexes:
+            results[i] = (None,) * len(toNames)
+        for j in range(len(toConvert)):
+            results[toConvert[j]] = tuple([columns[n][j] for n in toNames])
+
+    #
+    # add the new results to the result cache (unless the map was swapped)
+    #
+
+    cacheLock.acquire()
+    try:
+        if s is snpMap:
+            for chr in byChromosome.keys():
+                for i in byChromosome[chr]:
+                    cache[(chr, positions[i][1], fromName, tuple(toNames))] = results[i]
+            while len(cache) > cacheSize:
+                cache.popitem(last = False)
+    finally:
+        cacheLock.release()
+
+    return results
+
+#
+# Purpose: Parses a (chromosome, position) pair
+# Returns: (SNP map chromosome, float)
+# Throws: ValueError
+#
+def parsePosition(chr, pos):
+
+    chr = str(chr)
+    if chr == 'X':
+        chr = '20'
+
+    return (chr, float(pos))
+
+def parseCoords(fromName, toNames):
+
+    if fromName not in COORDS:
+        raise ValueError('invalid from: %s' % (fromName))
+
+    for n in toNames:
+        if n not in COORDS:
+            raise ValueError('invalid to: %s' % (n))
+
+    return (fromName, toNames)
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    #
+    # /convert (GET: single, POST: batch) and /status
+    #
+
+    def reply(self, code, body):
+
+        data = json.dumps(body)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+
+        url = urlparse.urlparse(self.path)
+
+        if url.path == '/status':
+            cacheLock.acquire()
+            try:
+                status = {
+                    'snpMapFile' : snpMapFile,
+                    'snpChecksum' : snpChecksum,
+                    'loadedAt' : loadedAt,
+                    'snps' : sum([snpMap.size(c) for c in snpMap.chromosomes()]),
+                    'cacheEntries' : len(cache),
+                    'cacheHits' : cacheHits,
+                    'cacheMisses' : cacheMisses,
+                    }
+            finally:
+                cacheLock.release()
+            self.reply(200, status)
+            return
+
+        if url.path != '/convert':
+            self.reply(404, {'error' : 'not found: ' + url.path})
+            return
+
+        try:
+            query = urlparse.parse_qs(url.query)
+            (fromName, toNames) = parseCoords(query.get('from', ['bp'])[0],
+                                              query.get('to', ['acM'])[0].split(','))
+            (chr, pos) = parsePosition(query['chr'][0], query['pos'][0])
+            result = convertPositions([(chr, pos)], fromName, toNames)[0]
+        except (KeyError, ValueError), e:
+            self.reply(400, {'error' : 'invalid request: ' + str(e)})
+            return
+
+        body = {'chr' : query['chr'][0], 'pos' : pos, 'from' : fromName}
+        for j in range(len(toNames)):
+            body[toNames[j]] = result[j]
+
+        self.reply(200, body)
+
+    def do_POST(self):
+
+        if urlparse.urlparse(self.path).path != '/convert':
+            self.reply(404, {'error' : 'not found: ' + self.path})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+            toNames = request.get('to', ['acM'])
+            if isinstance(toNames, basestring):
+                toNames = toNames.split(',')
+            (fromName, toNames) = parseCoords(request.get('from', 'bp'), toNames)
+            positions = [parsePosition(chr, pos) for (chr, pos) in request['positions']]
+            results = convertPositions(positions, fromName, toNames)
+        except (KeyError, TypeError, ValueError), e:
+            self.reply(400, {'error' : 'invalid request: ' + str(e)})
+            return
+
+        self.reply(200, {'from' : fromName, 'to' : toNames, 'results' : results})
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+
+    snpMapFile = os.getenv('SNP_MAP_FILE')
+    snpCacheFile = os.getenv('SNP_CACHE_FILE')
+
+    if not snpMapFile:
+        print 'Environment variable not set: SNP_MAP_FILE'
+        sys.exit(1)
+
+    try:
+        port = int(os.getenv('GENMAP_SERVER_PORT', ''))
+        cacheSize = int(os.getenv('GENMAP_SERVER_CACHE_SIZE', '100000'))
+        pollInterval = int(os.getenv('GENMAP_SERVER_POLL', '60'))
+    except ValueError:
+        print 'Invalid GENMAP_SERVER_PORT/GENMAP_SERVER_CACHE_SIZE/GENMAP_SERVER_POLL'
+        sys.exit(1)
+
+    try:
+        (snpMap, snpChecksum, snpStat) = loadSnpMap()
+        loadedAt = time.time()
+    except (IOError, OSError, ValueError), e:
+        print 'Cannot load SNP map: ' + snpMapFile + ': ' + str(e)
+        sys.exit(1)
+
+    try:
+        server = Server(('127.0.0.1', port), RequestHandler)
+    except IOError, e:
+        print 'Cannot listen on port %d: %s' % (port, str(e))
+        sys.exit(1)
+
+    watcher = threading.Thread(target = watchSnpMap)
+    watcher.setDaemon(True)
+    watcher.start()
+
+    print >> sys.stderr, 'Serving %s on http://127.0.0.1:%d/' % (snpMapFile, port)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    sys.exit(0)
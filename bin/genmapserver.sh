@@ -0,0 +1,74 @@
+#!/bin/sh
+#
+#  genmapserver.sh
+###########################################################################
+#
+#  Purpose:
+#
+#      This script is a wrapper around the local map conversion
+#      service (genmapserver.py).
+#
+#  Usage:
+#
+#      genmapserver.sh
+#
+#  Env Vars:
+#
+#      See the configuration file (genmapload.config)
+#
+#  Inputs:  None
+#
+#  Outputs:
+#
+#      - Log file (${GENMAP_SERVER_LOG})
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  Fatal error occurred
+#
+#  Assumes:  Nothing
+#
+#  Implementation:
+#
+#      This script will perform following steps:
+#
+#      1) Source the configuration file to establish the environment.
+#      2) Call genmapserver.py; it runs until it is stopped.
+#
+#  Notes:  None
+#
+###########################################################################
+
+cd `dirname $0`
+
+CONFIG=genmapload.config
+
+#
+# Make sure the configuration file exists and source it.
+#
+if [ -f ../${CONFIG} ]
+then
+    . ../${CONFIG}
+else
+    echo "Missing configuration file: ${CONFIG}"
+    exit 1
+fi
+
+#
+# Establish the log file.
+#
+LOG=${GENMAP_SERVER_LOG}
+
+echo "" >> ${LOG}
+date >> ${LOG}
+echo "Start the map conversion service (genmapserver.sh)" | tee -a ${LOG}
+./genmapserver.py >> ${LOG} 2>&1
+STAT=$?
+if [ ${STAT} -ne 0 ]
+then
+    echo "Error: Start the map conversion service (genmapserver.sh)" | tee -a ${LOG}
+    exit 1
+fi
+
+exit 0
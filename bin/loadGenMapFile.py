@@ -0,0 +1,202 @@
+#!/usr/local/bin/python
+#
+#  loadGenMapFile.py
+###########################################################################
+#
+#  Purpose:
+#
+#      This script will apply a new map positions file, written by
+#      makeGenMapFile.py, to MRK_Marker.cmOffset.
+#
+#  Usage:
+#
+#      loadGenMapFile.py [new map positions file]
+#
+#      default: $NEW_MAP_FILE
+#      (an archived file may be given to replay its load)
+#
+#  Env Vars:
+#
+#      The following environment variables are set by the configuration
+#      file that is sourced by the wrapper script:
+#
+#          NEW_MAP_FILE
+#          MGD_DBUSER
+#          MGD_DBPASSWORDFILE
+#
+#  Inputs:
+#
+#      - new map positions file ($NEW_MAP_FILE)
+#        It has the following tab-delimited fields:
+#
+#        1) Marker key
+#        2) new cM offset
+#
+#  Outputs:
+#
+#      - MRK_Marker.cmOffset
+#
+#      - metrics file ($LOGDIR/loadGenMapFile.metrics.json)
+#        (see loadmetrics.py)
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  An exception occurred
+#
+#  Assumes:  Nothing
+#
+#  Implementation:
+#
+#      This script will perform following steps:
+#
+#      1) Initialize variables.
+#      2) Open files.
+#      3) Stage the file in a temp table (multi-row inserts) and apply
+#         it with one update...from in one transaction
+#         (makeGenMapFile.py's bulk update)
+#      4) Close files.
+#
+#  Notes:  None
+#
+###########################################################################
+
+import sys
+import os
+import db
+import loadmetrics
+import makeGenMapFile
+
+# file name NEW_MAP_FILE (or the file given on the command line)
+newMapFile = None
+
+# file pointer
+fpNewMap = None
+
+TAB = '\t'
+CRT = '\n'
+
+#
+# Purpose: Initialization
+# Returns: 1 if file does not exist or is not readable, else 0
+# Assumes: Nothing
+# Effects: sets the global variables, file pointers, etc.
+# Throws: Nothing
+#
+def initialize():
+    global newMapFile, fpNewMap
+
+    if len(sys.argv) > 1:
+        newMapFile = sys.argv[1]
+    else:
+        newMapFile = os.getenv('NEW_MAP_FILE')
+
+    rc = 0
+
+    #
+    # Make sure the environment variables are set.
+    #
+    if not newMapFile:
+        print 'Environment variable not set: NEW_MAP_FILE'
+        rc = 1
+
+    #
+    # Initialize file pointers.
+    #
+    fpNewMap = None
+
+    #
+    # Use one connection to the database
+    #
+    db.set_sqlUser(os.getenv('MGD_DBUSER'))
+    db.set_sqlPasswordFromFile(os.getenv('MGD_DBPASSWORDFILE'))
+    db.useOneConnection(1)
+
+    return rc
+
+#
+# Purpose: Open files.
+# Returns: 1 if file does not exist or is not readable, else 0
+# Assumes: Nothing
+# Effects: opens the file pointers
+# Throws: Nothing
+#
+def openFiles():
+    global fpNewMap
+
+    try:
+        fpNewMap = open(newMapFile, 'r')
+    except:
+        print 'Cannot open map file: ' + newMapFile
+        return 1
+
+    return 0
+
+#
+# Purpose: Close files.
+# Returns: 0
+# Assumes: Nothing
+# Effects: close file pointers
+# Throws: Nothing
+#
+def closeFiles():
+
+    if fpNewMap:
+        fpNewMap.close()
+
+    db.useOneConnection(0)
+
+    return 0
+
+#
+# Purpose: Apply the new map positions to MRK_Marker.cmOffset
+# Returns: 0, or 1 if the file cannot be parsed
+#          (nothing is applied then)
+# Assumes: Nothing
+# Effects: updates MRK_Marker.cmOffset in one transaction
+# Throws: Nothing
+#
+def loadMap():
+
+    makeGenMapFile.startBulkUpdate()
+
+    lineNum = 0
+
+    for line in fpNewMap:
+
+        lineNum = lineNum + 1
+        loadmetrics.count('rowsRead')
+
+        try:
+            (markerKey, cmOffset) = line.rstrip(CRT).split(TAB)
+            makeGenMapFile.stageOffset(int(markerKey), float(cmOffset))
+        except ValueError:
+            # nothing has been applied; the temp table goes with the session
+            print 'Cannot parse map file: %s: line %d' % (newMapFile, lineNum)
+            return 1
+
+    makeGenMapFile.finishBulkUpdate()
+
+    return 0
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+
+    loadmetrics.start('loadGenMapFile', db)
+
+    if loadmetrics.run('initialize', initialize) != 0:
+        sys.exit(1)
+
+    if loadmetrics.run('openFiles', openFiles) != 0:
+        sys.exit(1)
+
+    if loadmetrics.run('loadMap', loadMap) != 0:
+        closeFiles()
+        sys.exit(1)
+
+    closeFiles()
+
+    sys.exit(0)
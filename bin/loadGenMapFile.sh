@@ -0,0 +1,79 @@
+#!/bin/sh
+#
+#  loadGenMapFile.sh
+###########################################################################
+#
+#  Purpose:
+#
+#      This script is a wrapper around the process that
+#      applies the new map positions file
+#      to MRK_Marker.cmOffset.
+#
+#  Usage:
+#
+#      loadGenMapFile.sh [new map positions file]
+#
+#  Env Vars:
+#
+#      See the configuration file (genmapload.config)
+#
+#  Inputs:  None
+#
+#  Outputs:
+#
+#      - Log file (${LOG_DIAG})
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  Fatal error occurred
+#
+#  Assumes:  Nothing
+#
+#  Implementation:
+#
+#      This script will perform following steps:
+#
+#      1) Source the configuration file to establish the environment.
+#      2) Establish the log file.
+#      3) Call loadGenMapFile.py to apply the new map positions file.
+#
+#  Notes:  None
+#
+###########################################################################
+
+cd `dirname $0`
+
+CONFIG=genmapload.config
+
+#
+# Make sure the configuration file exists and source it.
+#
+if [ -f ../${CONFIG} ]
+then
+    . ../${CONFIG}
+else
+    echo "Missing configuration file: ${CONFIG}"
+    exit 1
+fi
+
+#
+# Establish the log file.
+#
+LOG=${LOG_DIAG}
+
+#
+# Call the Python script to apply the new map positions file.
+#
+echo "" >> ${LOG}
+date >> ${LOG}
+echo "Apply the new map positions file (loadGenMapFile.sh)" | tee -a ${LOG}
+./loadGenMapFile.py "$@" 2>&1 >> ${LOG}
+STAT=$?
+if [ ${STAT} -ne 0 ]
+then
+    echo "Error: Apply the new map positions file (loadGenMapFile.sh)" | tee -a ${LOG}
+    exit 1
+fi
+
+exit 0
@@ -0,0 +1,110 @@
+#
+#  loadlib.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Database helpers shared by the genmapload scripts:
+#
+#        fetchRows  : read a query through a server-side cursor
+#        insertRows : load rows into a (temp) table with multi-row inserts
+#
+#      Both run over the scripts' own db connection, so they work with
+#      temp tables (a COPY over another connection cannot see them).
+#
+#  Usage:
+#
+#      import loadlib
+#
+#      for r in loadlib.fetchRows('mapRows', 'select ...'):
+#          ...
+#
+#      loadlib.insertRows('mitMap', rows)
+#
+###########################################################################
+
+import string
+import db
+
+# number of rows fetched at a time from a server-side cursor
+fetchSize = 10000
+
+# number of rows per multi-row insert
+insertBatchSize = 1000
+
+COMMA = ','
+
+#
+# Purpose: Runs a query through a named server-side cursor
+# Returns: generator of result rows, fetched size rows at a time
+# Assumes: Nothing
+# Effects: declares/closes the cursor
+#          (with hold, so that the caller may commit while reading)
+# Throws: Nothing
+#
+# Args:
+#   name      cursor name
+#   cmd       select statement
+#   size      rows per fetch (default fetchSize)
+#
+
+def fetchRows(name, cmd, size = None):
+
+    if not size:
+        size = fetchSize
+
+    db.sql('declare %s cursor with hold for %s' % (name, cmd), None)
+
+    try:
+        while 1:
+            results = db.sql('fetch forward %d from %s' % (size, name), 'auto')
+            if not results:
+                break
+            for r in results:
+                yield r
+    finally:
+        db.sql('close %s' % (name), None)
+
+#
+# Purpose: Quotes one value for an insert
+# Returns: SQL literal
+#
+def quote(value):
+
+    if value is None:
+        return 'null'
+
+    if isinstance(value, basestring):
+        return "'" + value.replace("'", "''") + "'"
+
+    return str(value)
+
+#
+# Purpose: Inserts rows into a table, insertBatchSize rows per insert
+# Returns: number of rows inserted
+# Assumes: the rows have the table's columns, in order
+# Effects: inserts into table
+# Throws: Nothing
+#
+# Args:
+#   table     table name
+#   rows      iterable of tuples of values (string, number or None)
+#
+
+def insertRows(table, rows):
+
+    values = []
+    n = 0
+
+    for row in rows:
+        values.append('(' + string.join([quote(v) for v in row], COMMA) + ')')
+        if len(values) >= insertBatchSize:
+            db.sql('insert into %s values %s' % (table, string.join(values, COMMA)), None)
+            n = n + len(values)
+            values = []
+
+    if values:
+        db.sql('insert into %s values %s' % (table, string.join(values, COMMA)), None)
+        n = n + len(values)
+
+    return n
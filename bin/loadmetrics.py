@@ -0,0 +1,481 @@
+#
+#  loadmetrics.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Per-stage metrics of the genmapload Python scripts
+#      (initialize, openFiles, getMap, genMap, processReport, ...),
+#      written as a JSON metrics file next to the logs.
+#
+#  Usage:
+#
+#      import loadmetrics
+#
+#      loadmetrics.start('makeGenMapFile', db)
+#      if loadmetrics.run('initialize', initialize) != 0:
+#          sys.exit(1)
+#      ...
+#      loadmetrics.count('rowsRead')
+#
+#  Env Vars:
+#
+#      LOGDIR
+#      GENMAP_PROFILE (yes|no, default no)
+#      GENMAP_PROFILE_TOP (default 20)
+#
+#  Outputs:
+#
+#      - metrics file (${LOGDIR}/<script>.metrics.json), written at exit:
+#
+#        {"script": ..., "started": ..., "elapsed": ...,
+#         "stages": [{"stage": ..., "status": ..., "elapsed": ..., "rowsRead": ...,
+#                     "rowsWritten": ..., "rowsUpdated": ...,
+#                     "dbRoundTrips": ..., "peakRssKb": ...}, ...]}
+#
+#        peakRssKb is the peak resident set size of the process at the
+#        end of the stage (it never goes down)
+#
+#        mergeMetrics.py merges the metrics files of one run
+#        into the run summary
+#
+#      - GENMAP_PROFILE=yes only:
+#        profile of each stage (${LOGDIR}/<script>.<stage>.prof, cProfile;
+#        read it with pstats or snakeviz)
+#        profile of each worker thread and pool process
+#        (${LOGDIR}/<script>.<function>-<pid>.prof, see profileHelper())
+#        summary (${LOGDIR}/<script>.profile.txt): per stage, the
+#        GENMAP_PROFILE_TOP functions with the most time of their own,
+#        in the stage's thread and in the threads/processes it ran, and
+#        the top allocation sites (tracemalloc) or, without tracemalloc,
+#        the growth of the peak RSS and the object types with the most
+#        new objects (gc)
+#
+#  Notes:
+#
+#      Every db.sql() call counts as one database round trip
+#      (one per command for a list of commands).
+#
+#      A stage's profile only sees the thread that runs it; the
+#      GENMAP_THREADED threads and the GENMAP_WORKERS/GENMAP_DB_CONNECTIONS
+#      pool processes profile themselves (profileHelper()).
+#      tracemalloc is optional (Python 3, or pytracemalloc); the gc
+#      fallback only counts the objects gc tracks (containers and
+#      instances, not strings or numbers), and the memory of the pool
+#      processes is not measured.  With GENMAP_PROFILE=no the profilers
+#      are not imported.
+#
+###########################################################################
+
+import os
+import gc
+import glob
+import time
+import json
+import atexit
+import resource
+import threading
+
+# profiling (GENMAP_PROFILE=yes), see startProfiling()
+profiling = 0
+profileTop = 20
+profiler = None
+helperProfilers = {}
+cProfile = None
+pstats = None
+tracemalloc = None
+
+# script name, start time
+script = None
+started = None
+
+# the stages, in the order they were run; the stage being run
+stages = []
+current = None
+
+# number of database round trips made by this process
+dbRoundTrips = 0
+
+# the counters are updated by the GENMAP_THREADED threads too
+countLock = threading.Lock()
+
+# the counters of each stage
+COUNTERS = ('rowsRead', 'rowsWritten', 'rowsUpdated', 'dbRoundTrips')
+
+#
+# Purpose: Starts the metrics of a script
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: counts the db.sql() calls of dbModule,
+#          writes the metrics file at exit
+# Throws: Nothing
+#
+# Args:
+#   name      script name
+#   dbModule  the "db" module (optional)
+#
+
+def start(name, dbModule = None):
+    global script, started
+
+    script = name
+    started = time.time()
+
+    if dbModule:
+        instrument(dbModule)
+
+    if os.getenv('GENMAP_PROFILE', 'no') == 'yes':
+        startProfiling()
+
+    atexit.register(write)
+
+#
+# Purpose: Turns profiling on (GENMAP_PROFILE=yes)
+# Returns: Nothing
+# Assumes: start() has set the script name
+# Effects: imports the profilers, truncates the summary file
+# Throws: Nothing
+#
+
+def startProfiling():
+    global profiling, profileTop, cProfile, pstats, tracemalloc
+
+    logDir = os.getenv('LOGDIR')
+
+    if not logDir:
+        print 'Environment variable not set: LOGDIR (GENMAP_PROFILE ignored)'
+        return
+
+    import cProfile
+    import pstats
+
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    profileTop = int(os.getenv('GENMAP_PROFILE_TOP', str(profileTop)))
+
+    try:
+        open(os.path.join(logDir, script + '.profile.txt'), 'w').close()
+        for fileName in glob.glob(os.path.join(logDir, script + '.*.prof')):
+            os.remove(fileName)
+    except (IOError, OSError), e:
+        print 'Cannot write profile summary: ' + str(e)
+        return
+
+    profiling = 1
+
+def instrument(dbModule):
+
+    sql = dbModule.sql
+
+    def countedSql(cmd, *args, **kwargs):
+        if type(cmd) == type([]):
+            roundTrip(len(cmd))
+        else:
+            roundTrip(1)
+        return sql(cmd, *args, **kwargs)
+
+    dbModule.sql = countedSql
+
+def roundTrip(n = 1):
+    global dbRoundTrips
+
+    countLock.acquire()
+    try:
+        dbRoundTrips = dbRoundTrips + n
+    finally:
+        countLock.release()
+
+    count('dbRoundTrips', n)
+
+#
+# Purpose: Runs one stage
+# Returns: the return value of function
+#          (recorded as the stage's status if it is an int)
+# Assumes: Nothing
+# Effects: records the stage's elapsed time, counters and peak memory
+# Throws: whatever function throws
+#
+
+def run(name, function, *args):
+
+    begin(name)
+    try:
+        # (a stage run by a profiled stage is part of its profile)
+        if profiling and not profiler:
+            rc = profile(name, function, args)
+        else:
+            rc = function(*args)
+        if type(rc) == type(0):
+            current['status'] = rc
+        return rc
+    finally:
+        end()
+
+#
+# Purpose: Runs one stage under cProfile (and tracemalloc)
+# Returns: the return value of function
+# Assumes: profiling is on
+# Effects: writes ${LOGDIR}/<script>.<name>.prof,
+#          appends the stage to ${LOGDIR}/<script>.profile.txt
+# Throws: whatever function throws
+#
+
+def profile(name, function, args):
+    global profiler
+
+    profiler = cProfile.Profile()
+    stageStart = time.time()
+
+    if tracemalloc:
+        tracemalloc.start()
+        memory = None
+    else:
+        memory = memoryUsage()
+
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        if tracemalloc:
+            allocations = allocationSites(tracemalloc.take_snapshot())
+            tracemalloc.stop()
+        else:
+            allocations = memoryGrowth(memory, memoryUsage())
+
+        try:
+            writeProfile(name, profiler, stageStart, allocations)
+        except IOError, e:
+            print 'Cannot write profile: ' + name + ': ' + str(e)
+
+        profiler = None
+
+#
+# Purpose: Runs a function of a worker thread or pool process,
+#          profiled if profiling is on
+# Returns: the return value of function
+# Assumes: Nothing
+# Effects: adds the call to the profile of this function in this
+#          process (${LOGDIR}/<script>.<name>-<pid>.prof), rewritten
+#          after each call; the stage that runs the thread/process adds
+#          it to its summary
+# Throws: whatever function throws
+#
+# Args:
+#   name      function (thread) name, unique in the process
+#   function  function to run
+#   args      its arguments
+#
+
+def profileHelper(name, function, *args):
+
+    if not profiling:
+        return function(*args)
+
+    key = '%s-%d' % (name, os.getpid())
+
+    if not helperProfilers.has_key(key):
+        helperProfilers[key] = cProfile.Profile()
+
+    helperProfiler = helperProfilers[key]
+
+    try:
+        return helperProfiler.runcall(function, *args)
+    finally:
+        try:
+            helperProfiler.dump_stats(os.path.join(os.getenv('LOGDIR'), '%s.%s.prof' % (script, key)))
+        except IOError, e:
+            print 'Cannot write profile: ' + key + ': ' + str(e)
+
+#
+# Purpose: Top allocation sites of a tracemalloc snapshot
+# Returns: list of lines
+#
+
+def allocationSites(snapshot):
+
+    lines = ['top allocation sites (tracemalloc)']
+
+    for stat in snapshot.statistics('lineno')[:profileTop]:
+        lines.append('    %s' % (stat))
+
+    return lines
+
+#
+# Purpose: Memory use of this process, without tracemalloc
+# Returns: (peak RSS in kB, dictionary of type name -> number of
+#          objects tracked by gc)
+#
+
+def memoryUsage():
+
+    counts = {}
+
+    for o in gc.get_objects():
+        t = type(o).__name__
+        counts[t] = counts.get(t, 0) + 1
+
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, counts)
+
+#
+# Purpose: Growth of the memory use of this process over a stage
+# Returns: list of lines: the growth of the peak RSS and the
+#          object types with the most new objects
+#
+
+def memoryGrowth(before, after):
+
+    (rssBefore, countsBefore) = before
+    (rssAfter, countsAfter) = after
+
+    growth = []
+    for (t, n) in countsAfter.items():
+        n = n - countsBefore.get(t, 0)
+        if n > 0:
+            growth.append((n, t))
+    growth.sort()
+    growth.reverse()
+
+    lines = ['peak RSS growth: %d kB' % (rssAfter - rssBefore),
+             'top new objects by type (gc; tracemalloc is not available)']
+
+    for (n, t) in growth[:profileTop]:
+        lines.append('    %10d %s' % (n, t))
+
+    return lines
+
+#
+# Purpose: Writes the profile of one stage
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: writes ${LOGDIR}/<script>.<name>.prof,
+#          appends the stage to ${LOGDIR}/<script>.profile.txt
+# Throws: IOError
+#
+
+def writeProfile(name, stageProfiler, stageStart, allocations):
+
+    logDir = os.getenv('LOGDIR')
+    profileFile = os.path.join(logDir, '%s.%s.prof' % (script, name))
+
+    stageProfiler.dump_stats(profileFile)
+
+    fp = open(os.path.join(logDir, script + '.profile.txt'), 'a')
+
+    fp.write('stage %s (%s)\n\n' % (name, profileFile))
+
+    stats = pstats.Stats(profileFile, stream = fp)
+    stats.strip_dirs().sort_stats('time').print_stats(profileTop)
+
+    # the worker threads/processes that ran during the stage
+    helperFiles = [f for f in glob.glob(os.path.join(logDir, script + '.*-*.prof'))
+                   if os.path.getmtime(f) >= stageStart]
+    helperFiles.sort()
+
+    if helperFiles:
+        fp.write('stage %s threads and pool processes (%s)\n\n' % \
+                 (name, ', '.join([os.path.basename(f) for f in helperFiles])))
+        stats = pstats.Stats(*helperFiles, stream = fp)
+        stats.strip_dirs().sort_stats('time').print_stats(profileTop)
+
+    for line in allocations:
+        fp.write(line + '\n')
+    fp.write('\n')
+
+    fp.close()
+
+def begin(name):
+    global current
+
+    current = {'stage' : name, 'start' : time.time()}
+    for c in COUNTERS:
+        current[c] = 0
+
+def end():
+    global current
+
+    if not current:
+        return
+
+    current['elapsed'] = time.time() - current['start']
+    current['peakRssKb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stages.append(current)
+    current = None
+
+#
+# Purpose: Records a stage that was not run by run()/begin()/end()
+#          (e.g. a command run by genmapdriver.py, or a skipped stage)
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+# Args:
+#   name      stage name
+#   start     start time (seconds since epoch)
+#   end       end time (seconds since epoch)
+#   status    exit status
+#   skipped   True if the stage was skipped
+#
+
+def record(name, start, end, status, skipped = False):
+
+    stage = {'stage' : name, 'start' : start, 'elapsed' : end - start, 'status' : status}
+    for c in COUNTERS:
+        stage[c] = 0
+    if skipped:
+        stage['skipped'] = True
+
+    stages.append(stage)
+
+#
+# Purpose: Adds n to a counter of the current stage
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+
+def count(counter, n = 1):
+
+    countLock.acquire()
+    try:
+        if current:
+            current[counter] = current[counter] + n
+    finally:
+        countLock.release()
+
+#
+# Purpose: Writes the metrics file
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: writes ${LOGDIR}/<script>.metrics.json
+# Throws: Nothing
+#
+
+def write():
+
+    logDir = os.getenv('LOGDIR')
+
+    if not script or not logDir:
+        return
+
+    # a stage that did not return (sys.exit)
+    end()
+
+    metrics = {
+        'script' : script,
+        'started' : started,
+        'elapsed' : time.time() - started,
+        'stages' : stages,
+        }
+
+    fileName = os.path.join(logDir, script + '.metrics.json')
+
+    try:
+        fp = open(fileName, 'w')
+        json.dump(metrics, fp, indent = 2, sort_keys = True)
+        fp.close()
+    except IOError, e:
+        print 'Cannot write metrics file: ' + fileName + ': ' + str(e)
@@ -11,7 +11,13 @@
 #
 #  Usage:
 #
-#      makeGenMapFile.py
+#      makeGenMapFile.py [-n|--dry-run]
+#
+#      -n, --dry-run  interpolate the SNP map ($SNP_DOWNLOAD_FILE, as is)
+#                     and write a report of the changes to
+#                     $GENMAP_DRYRUN_REPORT; nothing is written to the
+#                     database (read-only session) or to the load's
+#                     input/output files
 #
 #  Env Vars:
 #
@@ -20,6 +26,30 @@
 #
 #	   SNP_MAP_FILE
 #          MGI_MAP_FILE
+#          MGI_MAP_FORMAT (text|binary, default text)
+#          MGI_MAP_BINARY_FILE (required if MGI_MAP_FORMAT=binary)
+#          CMOFFSET_UPDATE_MODE (bulk|row|file, default bulk)
+#          NEW_MAP_FILE (optional; required if CMOFFSET_UPDATE_MODE=file)
+#          GENMAP_CHANGED_KEYS_FILE (optional)
+#          CMOFFSET_COMMIT_SIZE (default 0)
+#          GENMAP_CHECKPOINT (optional)
+#          CMOFFSET_TOLERANCE (default 0)
+#          SNP_DOWNLOAD_FILE
+#          SNP_CACHE_FILE (optional)
+#          GENMAP_PIPELINE (yes|no, default no)
+#          MGI_MAP_DEBUG_TAP (yes|no, default no)
+#          GENMAP_INCREMENTAL (yes|no, default no)
+#          MGI_MAP_SNAPSHOT (optional)
+#          GENMAP_THREADED (yes|no, default no)
+#          GENMAP_QUEUE_SIZE (default 4)
+#          GENMAP_WORKERS (default 1)
+#          GENMAP_DB_CONNECTIONS (default 1)
+#          GENMAP_ALL_MAPS_FILE (optional)
+#          GENMAP_SNP_MAPS (optional), and for each name in it:
+#          SNP_MAP_FILE_<name>, SNP_CACHE_FILE_<name> (optional),
+#          GENMAP_MAP_FILE_<name>
+#          GENMAP_DRYRUN_REPORT (required if --dry-run)
+#          GENMAP_DRYRUN_TOP (default 50)
 #
 #  Inputs:
 #
@@ -52,6 +82,9 @@
 #
 #      - MGI map file ($MGI_MAP_FILE)
 #	 Current MGI map
+#        if GENMAP_PIPELINE=yes, the same rows are read in-process from
+#        makeMGIMapFile.iterMap() instead (and written to $MGI_MAP_FILE
+#        only if MGI_MAP_DEBUG_TAP=yes)
 #        It has the following tab-delimited fields:
 #
 #        1) Marker key
@@ -60,13 +93,90 @@
 #        4) Chromosome
 #        5) bp (basepair)
 #           build 37 genome coordinate (start coordinate)
+#        6) current cM offset (MRK_Marker.cmOffset)
+#
+#        if MGI_MAP_FORMAT=binary, the binary export ($MGI_MAP_BINARY_FILE)
+#        is memory-mapped instead and its key/chromosome/bp columns are
+#        read as typed values (see mgimaplib.py)
+#
+#      - MGI map snapshot of the last load ($MGI_MAP_SNAPSHOT)
+#        first line:  #snpChecksum <TAB> checksum of SNP_DOWNLOAD_FILE
+#        then one tab-delimited line per marker:
+#        1) Marker key
+#        2) Chromosome
+#        3) bp (basepair)
+#        4) cM offset in MRK_Marker after the load
+#
+#      - checkpoint of an interrupted load ($GENMAP_CHECKPOINT)
+#        tab-delimited name/value lines:
+#        snpChecksum   checksum of SNP_DOWNLOAD_FILE
+#        mgiChecksum   checksum of the MGI map export (MGI_MAP_FILE or
+#                      MGI_MAP_BINARY_FILE); in pipeline mode there is
+#                      no export to match and the checkpoint is not used
+#        updateMode    CMOFFSET_UPDATE_MODE
+#        chromosome    chromosome of the last committed marker
+#        markerKey     key of the last committed marker; every marker
+#                      up to this key has been committed
+#        chromosomes   chromosomes committed in parallel mode
+#                      (comma-delimited)
 #
 #  Outputs:
 #
-#	- MRK_Offset file ($NEW_MAP_FILE)
-#         BCP file of map positions (MRK_Offset.source = 0)
-#         The existing map positions will be deleted and the
-#         new map positions inserted into MRK_Offset.
+#      - checkpoint ($GENMAP_CHECKPOINT)
+#        rewritten after every commit, removed at the end of the load
+#
+#      - MGI map snapshot of this load ($MGI_MAP_SNAPSHOT)
+#        replaced at the end of a successful load
+#
+#      - all maps file ($GENMAP_ALL_MAPS_FILE), if set
+#        female, male and sex-averaged map positions of each marker
+#        interpolated by this load (all markers unless incremental)
+#        It has the following tab-delimited fields:
+#
+#        1) Marker key
+#        2) Symbol
+#        3) MGI ID
+#        4) Chromosome
+#        5) bp (basepair)
+#        6) female cM
+#        7) male cM
+#        8) sex-averaged cM (the new MRK_Marker.cmOffset)
+#        (-1.0 in 6-8 if the marker is syntenic)
+#
+#      - map positions of each other SNP map ($GENMAP_MAP_FILE_<name>),
+#        GENMAP_SNP_MAPS only
+#        the markers interpolated by this load against SNP_MAP_FILE_<name>
+#        (the same fields as the all maps file); these maps are never
+#        applied to MRK_Marker
+#
+#      - metrics file ($LOGDIR/makeGenMapFile.metrics.json)
+#        elapsed time, rows read/written/updated, database round trips
+#        and peak memory of the initialize, openFiles and genMap stages
+#        (see loadmetrics.py)
+#
+#      - profiles ($LOGDIR/makeGenMapFile.<stage>.prof, $LOGDIR/makeGenMapFile.profile.txt)
+#        GENMAP_PROFILE=yes only (see loadmetrics.py)
+#
+#	- new map positions file ($NEW_MAP_FILE), if set
+#         COPY-format (tab-delimited) file of the markers whose
+#         MRK_Marker.cmOffset changes:
+#
+#         1) Marker key
+#         2) new cM offset
+#
+#         loadGenMapFile.py applies it to MRK_Marker
+#         (CMOFFSET_UPDATE_MODE=file, or to replay an archived load)
+#         rewritten in full if the load resumes from a checkpoint
+#
+#      - changed marker keys file ($GENMAP_CHANGED_KEYS_FILE), if set
+#        the key of each marker whose MRK_Marker.cmOffset changes,
+#        one per line (the same markers as the new map positions file);
+#        rewritten in full if the load resumes from a checkpoint
+#        refreshLocations.py refreshes the location cache of these markers
+#
+#      - dry run report ($GENMAP_DRYRUN_REPORT), --dry-run only
+#        the changes by chromosome, a histogram of the cM deltas of the
+#        changed markers, and the GENMAP_DRYRUN_TOP largest moves
 #
 #  Exit Codes:
 #
@@ -81,9 +191,55 @@
 #
 #      1) Initialize variables.
 #      2) Open files.
+#         if SNP_CACHE_FILE was built from the same SNP_DOWNLOAD_FILE
+#         (same checksum), then the SNP map is memory-mapped from the cache
+#         and the copy/parse of the SNP map file is skipped;
+#         else the SNP map file is copied, parsed, validated and the cache
+#         is rebuilt
 #      3) Interpolate
-#      4) Create BCP files
-#      5) Close files.
+#         against SNP_MAP_FILE, the map applied to MRK_Marker, and in the
+#         same pass against each of the other SNP maps (GENMAP_SNP_MAPS;
+#         each read from its own cache SNP_CACHE_FILE_<name> if it was
+#         built from the same file)
+#      4) Write the new map positions file ($NEW_MAP_FILE)
+#         and the changed marker keys file ($GENMAP_CHANGED_KEYS_FILE)
+#      4) if GENMAP_INCREMENTAL=yes, skip the markers whose chromosome,
+#         bp and cM offset are the same as in the snapshot of the last load;
+#         a full load is run if there is no snapshot or if the SNP map
+#         checksum differs from the snapshot's
+#      5) Update MRK_Marker.cmOffset of the markers whose new offset
+#         differs from the current offset by more than CMOFFSET_TOLERANCE
+#         bulk mode:  stage all offsets in a temp table (multi-row inserts)
+#                     and apply them with one update...from in one transaction
+#         row mode:   one update/commit per marker
+#         if CMOFFSET_COMMIT_SIZE > 0, commit every CMOFFSET_COMMIT_SIZE
+#         markers instead, and record the last committed marker in
+#         $GENMAP_CHECKPOINT; a rerun after an interrupted load does not
+#         update the committed markers again (if the SNP map, the MGI map
+#         export and the mode are the same), but interpolates them and
+#         writes them to every output file as the interrupted load did
+#         file mode:  MRK_Marker is not updated; loadGenMapFile.py
+#                     applies $NEW_MAP_FILE
+#         if MGI_MAP_FORMAT=binary and numpy is available, the bp column
+#         of each chromosome is interpolated as one array and compared
+#         with the cmOffset column; rows are only built for the markers
+#         that changed (not for a dry run, incremental or resumed load,
+#         or with GENMAP_ALL_MAPS_FILE or GENMAP_SNP_MAPS)
+#         else, if GENMAP_THREADED=yes, reading the markers, interpolating and
+#         writing run in three threads connected by queues of
+#         GENMAP_QUEUE_SIZE batches, so that each batch is interpolated
+#         while the next one is read and written while the next one is
+#         interpolated (one database call at a time over the connection)
+#         if GENMAP_WORKERS or GENMAP_DB_CONNECTIONS > 1 (parallel mode),
+#         each chromosome is interpolated in a pool of GENMAP_WORKERS
+#         processes and applied (bulk, one transaction per chromosome)
+#         in a pool of GENMAP_DB_CONNECTIONS processes, each with its
+#         own database connection
+#      6) Close files.
+#
+#      --dry-run: the markers and their current offsets are read with the
+#      pipeline query (makeMGIMapFile.iterMap(), read-only), steps 4-5
+#      are replaced by the dry run report
 #
 #  Notes:  None
 #
@@ -95,8 +251,17 @@
 import sys 
 import os
 import string
+import getopt
+import heapq
+import threading
+import Queue
+import multiprocessing
 import db
 import mgi_utils
+import snpmaplib
+import mgimaplib
+import makeMGIMapFile
+import loadmetrics
 
 db.setTrace = true
 
@@ -106,25 +271,157 @@ snpMapFile = None
 # file name MGI_MAP_FILE
 mgiMapFile = None
 
+# MGI map format (MGI_MAP_FORMAT), file name MGI_MAP_BINARY_FILE,
+# the binary MGI map (mgimaplib.MgiMap)
+mgiMapFormat = 'text'
+mgiMapBinaryFile = None
+mgiMap = None
+
+# file name SNP_CACHE_FILE, checksum of SNP_DOWNLOAD_FILE
+snpCacheFile = None
+snpChecksum = None
+
 # file pointer
 fpSNPMap = None
 fpMGIMap = None
 
-# the snp map
-# key = chromosome
-# value = [(bp, fcM, mcM, acM), (bp, fcM, mcM, acM)...]
-snpMap = {}
-I_BP = 0	# basepair coordiante
-I_FCM = 1	# female map coordinate
-I_MCM = 2	# male map coordinate
-I_ACM = 3	# sex-averaged map coordinate
+# the snp map (snpmaplib.SnpMap)
+# chromosome -> typed arrays of (bp, fcM, mcM, acM)
+snpMap = None
 
 # interpolate bp->cM
-fromCoord = I_BP
-toCoord = I_ACM
+fromCoord = snpmaplib.I_BP
+toCoord = snpmaplib.I_ACM
+
+# the maps interpolated for each marker (one interval search per marker):
+# toCoord, or all three maps if GENMAP_ALL_MAPS_FILE is set
+toCoords = (toCoord,)
+
+# file name GENMAP_ALL_MAPS_FILE, file pointer
+allMapsFile = None
+fpAllMaps = None
+
+# the other SNP maps (GENMAP_SNP_MAPS), interpolated but not applied
+# one dictionary per map:
+#   name       : map name
+#   mapFile    : SNP_MAP_FILE_<name>
+#   cacheFile  : SNP_CACHE_FILE_<name> (or None)
+#   outputFile : GENMAP_MAP_FILE_<name>
+#   snpMap     : snpmaplib.SnpMap
+#   fp         : file pointer of outputFile
+otherMaps = []
+
+# the maps interpolated for the other SNP maps
+ALL_COORDS = (snpmaplib.I_FCM, snpmaplib.I_MCM, snpmaplib.I_ACM)
+
+# how MRK_Marker.cmOffset is updated (CMOFFSET_UPDATE_MODE)
+updateMode = None
+
+# file name NEW_MAP_FILE, file pointer
+newMapFile = None
+fpNewMap = None
+
+# file name GENMAP_CHANGED_KEYS_FILE, file pointer
+changedKeysFile = None
+fpChangedKeys = None
+
+# number of rows per multi-row insert into the staging table
+insertBatchSize = 1000
+
+# rows waiting for the next multi-row insert, number of rows staged
+stageBuffer = []
+stagedRows = 0
+
+# number of markers per transaction (CMOFFSET_COMMIT_SIZE)
+# 0: one transaction (bulk mode), one per marker (row mode)
+commitSize = 0
+
+# rows staged and updated by the transactions committed so far
+committedStaged = 0
+committedUpdated = 0
+
+# file name GENMAP_CHECKPOINT, checksum of the MGI map export
+checkpointFile = None
+mgiChecksum = None
+
+# the checkpoint: chromosome and key of the last committed marker,
+# chromosomes committed in parallel mode
+checkpointChr = None
+checkpointKey = None
+checkpointChromosomes = []
+
+# number of markers interpolated at a time
+convertBatchSize = 10000
+
+# dry run (-n/--dry-run), file name GENMAP_DRYRUN_REPORT,
+# number of largest moves reported (GENMAP_DRYRUN_TOP)
+dryRun = False
+reportFile = None
+reportTop = 50
+
+# dry run counts
+# key = chromosome
+# value = {'unchanged', 'changed', 'newly syntenic', 'newly placed' : number of markers}
+chrCounts = {}
+
+# dry run histogram of the cM deltas (|new - old|) of the changed markers:
+# deltaCounts[i] = number of markers with DELTA_BINS[i-1] <= delta < DELTA_BINS[i]
+DELTA_BINS = (0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0)
+deltaCounts = [0] * (len(DELTA_BINS) + 1)
+
+# dry run: heap of the reportTop largest moves
+# (delta, marker key, symbol, MGI ID, chromosome, bp, old cM, new cM)
+topMoves = []
+
+# read the markers straight from makeMGIMapFile.iterMap() (GENMAP_PIPELINE)
+# and optionally copy them to the MGI map file (MGI_MAP_DEBUG_TAP)
+pipeline = False
+debugTap = False
+
+# read, interpolate and write in three threads (GENMAP_THREADED),
+# number of batches queued between them (GENMAP_QUEUE_SIZE)
+threaded = False
+queueSize = 4
+
+# incremental load (GENMAP_INCREMENTAL)
+incremental = False
+
+# parallel mode: worker processes that interpolate (GENMAP_WORKERS)
+# and that apply the new offsets, each over its own database connection
+# (GENMAP_DB_CONNECTIONS); one chromosome per task
+workers = 1
+connections = 1
+convertPool = None
+applyPool = None
+
+# file name MGI_MAP_SNAPSHOT, file pointer of the new snapshot
+snapshotFile = None
+fpSnapshot = None
+
+# the snapshot of the last load
+# key = marker key
+# value = (chromosome, bp, cM offset)
+# markers are removed as they are read from the MGI map;
+# what is left at the end was removed from the MGI map
+snapshot = {}
+
+# incremental load counts
+# key = 'skipped', 'added', 'moved', 'removed'
+# value = number of markers
+incrementalCounts = {}
+
+# new offsets within this distance of the current offset are not written
+# (CMOFFSET_TOLERANCE)
+tolerance = 0.0
+
+# offset comparison counts
+# key = 'unchanged', 'changed', 'newly syntenic', 'newly placed'
+# value = number of markers
+changeCounts = {}
 
 COMMA = ','
 TAB = '\t'
+CRT = '\n'
 
 #
 # Purpose: Initialization
@@ -135,13 +432,112 @@ TAB = '\t'
 #
 def initialize():
     global snpMapFile, mgiMapFile
+    global mgiMapFormat, mgiMapBinaryFile
     global fpSNPMap, fpMGIMap
+    global updateMode, tolerance
+    global snpCacheFile, snpChecksum, snpMap, mgiChecksum
+    global pipeline, debugTap
+    global threaded, queueSize
+    global incremental, snapshotFile
+    global workers, connections, convertPool, applyPool
+    global allMapsFile, toCoords
+    global newMapFile, changedKeysFile
+    global commitSize, checkpointFile
+    global dryRun, reportFile, reportTop
+
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], 'n', ['dry-run'])
+    except getopt.GetoptError:
+        print 'Usage: makeGenMapFile.py [-n|--dry-run]'
+        return 1
+
+    for (opt, value) in opts:
+        if opt in ('-n', '--dry-run'):
+            dryRun = True
 
     snpMapFile = os.getenv('SNP_MAP_FILE')
     mgiMapFile = os.getenv('MGI_MAP_FILE')
+    mgiMapFormat = os.getenv('MGI_MAP_FORMAT', 'text')
+    mgiMapBinaryFile = os.getenv('MGI_MAP_BINARY_FILE')
+    snpCacheFile = os.getenv('SNP_CACHE_FILE')
+    pipeline = os.getenv('GENMAP_PIPELINE', 'no') == 'yes'
+    debugTap = os.getenv('MGI_MAP_DEBUG_TAP', 'no') == 'yes'
+    threaded = os.getenv('GENMAP_THREADED', 'no') == 'yes'
+    incremental = os.getenv('GENMAP_INCREMENTAL', 'no') == 'yes'
+    snapshotFile = os.getenv('MGI_MAP_SNAPSHOT')
+    updateMode = os.getenv('CMOFFSET_UPDATE_MODE', 'bulk')
+    allMapsFile = os.getenv('GENMAP_ALL_MAPS_FILE')
+    newMapFile = os.getenv('NEW_MAP_FILE')
+    changedKeysFile = os.getenv('GENMAP_CHANGED_KEYS_FILE')
+    checkpointFile = os.getenv('GENMAP_CHECKPOINT')
+    reportFile = os.getenv('GENMAP_DRYRUN_REPORT')
+
+    #
+    # dry run: interpolate SNP_DOWNLOAD_FILE as is (not copied to INPUTDIR),
+    # read the markers and their current offsets straight from the database,
+    # and write nothing but the report
+    #
+    if dryRun:
+        snpMapFile = os.getenv('SNP_DOWNLOAD_FILE')
+        pipeline = True
+        debugTap = False
+        incremental = False
+        snapshotFile = None
+        allMapsFile = None
+        newMapFile = None
+        changedKeysFile = None
+        checkpointFile = None
+
+    if allMapsFile:
+        toCoords = ALL_COORDS
+
+    if dryRun:
+        snpMaps = []
+    else:
+        snpMaps = os.getenv('GENMAP_SNP_MAPS', '').split()
+
+    for name in snpMaps:
+        otherMaps.append({'name' : name,
+                          'mapFile' : os.getenv('SNP_MAP_FILE_' + name),
+                          'cacheFile' : os.getenv('SNP_CACHE_FILE_' + name),
+                          'outputFile' : os.getenv('GENMAP_MAP_FILE_' + name),
+                          'snpMap' : None,
+                          'fp' : None})
 
     rc = 0
 
+    try:
+        tolerance = float(os.getenv('CMOFFSET_TOLERANCE', '0'))
+    except ValueError:
+        print 'Invalid CMOFFSET_TOLERANCE: ' + os.getenv('CMOFFSET_TOLERANCE')
+        rc = 1
+
+    try:
+        commitSize = int(os.getenv('CMOFFSET_COMMIT_SIZE', '0'))
+    except ValueError:
+        print 'Invalid CMOFFSET_COMMIT_SIZE: ' + os.getenv('CMOFFSET_COMMIT_SIZE')
+        rc = 1
+
+    try:
+        queueSize = int(os.getenv('GENMAP_QUEUE_SIZE', '4'))
+    except ValueError:
+        print 'Invalid GENMAP_QUEUE_SIZE: ' + os.getenv('GENMAP_QUEUE_SIZE')
+        rc = 1
+
+    try:
+        reportTop = int(os.getenv('GENMAP_DRYRUN_TOP', '50'))
+    except ValueError:
+        print 'Invalid GENMAP_DRYRUN_TOP: ' + os.getenv('GENMAP_DRYRUN_TOP')
+        rc = 1
+
+    try:
+        workers = int(os.getenv('GENMAP_WORKERS', '1'))
+        connections = int(os.getenv('GENMAP_DB_CONNECTIONS', '1'))
+    except ValueError:
+        print 'Invalid GENMAP_WORKERS/GENMAP_DB_CONNECTIONS: ' + \
+              str(os.getenv('GENMAP_WORKERS')) + '/' + str(os.getenv('GENMAP_DB_CONNECTIONS'))
+        rc = 1
+
     #
     # Make sure the environment variables are set.
     #
@@ -153,16 +549,106 @@ def initialize():
         print 'Environment variable not set: MGI_MAP_FILE'
         rc = 1
 
+    if mgiMapFormat not in ('text', 'binary'):
+        print 'Invalid MGI_MAP_FORMAT (text|binary): ' + mgiMapFormat
+        rc = 1
+
+    for m in otherMaps:
+        for (name, value) in (('SNP_MAP_FILE_', m['mapFile']), ('GENMAP_MAP_FILE_', m['outputFile'])):
+            if not value:
+                print 'Environment variable not set: ' + name + m['name']
+                rc = 1
+
+    if mgiMapFormat == 'binary' and not pipeline and not mgiMapBinaryFile:
+        print 'Environment variable not set: MGI_MAP_BINARY_FILE'
+        rc = 1
+
+    if updateMode not in ('bulk', 'row', 'file'):
+        print 'Invalid CMOFFSET_UPDATE_MODE (bulk|row|file): ' + updateMode
+        rc = 1
+
+    if updateMode == 'file' and not newMapFile and not dryRun:
+        print 'Environment variable not set: NEW_MAP_FILE'
+        rc = 1
+
+    if dryRun:
+        if not reportFile:
+            print 'Environment variable not set: GENMAP_DRYRUN_REPORT'
+            rc = 1
+        commitSize = 0
+        workers = 1
+        connections = 1
+
     #
-    # copy new input file
+    # parallel mode: start the worker pools now, before the first db call
+    # (makeMGIMapFile.initialize(), db.useOneConnection() below), so that
+    # no worker inherits this process's database connection;
+    # each applyPool worker keeps its own connection, so that the
+    # cmOffsets temp table lives from startBulkUpdate() to applyStaged()
     #
+    if rc == 0 and (workers > 1 or connections > 1):
+        convertPool = multiprocessing.Pool(max(workers, 1))
+        applyPool = multiprocessing.Pool(max(connections, 1), db.useOneConnection, (1,))
 
-    try:
-        os.system('cp -r ${SNP_DOWNLOAD_FILE} ${INPUTDIR}')
-    except:
-        print 'Cannot copy the input file: ' + \
-              os.environ('SNP_DOWNLOAD_FILE') + ' to ' + os.environ('INPUT_DIR')
-        return 1
+    #
+    # in pipeline mode, the markers come from makeMGIMapFile.iterMap()
+    # over this process's database connection
+    #
+    if pipeline and makeMGIMapFile.initialize() != 0:
+        rc = 1
+
+    if incremental and not snapshotFile:
+        print 'Environment variable not set: MGI_MAP_SNAPSHOT'
+        rc = 1
+
+    #
+    # the checksum of the SNP map input file keys the SNP map cache,
+    # the MGI map snapshot and the checkpoint
+    #
+
+    if snpCacheFile or snapshotFile or checkpointFile:
+        try:
+            snpChecksum = snpmaplib.checksum(os.getenv('SNP_DOWNLOAD_FILE'))
+        except (IOError, TypeError):
+            snpChecksum = None
+
+    #
+    # if the SNP map cache was built from the same input file,
+    # then skip the copy (and the parse, see openFiles())
+    #
+
+    if snpCacheFile and snpChecksum:
+        snpMap = snpmaplib.readCache(snpCacheFile, snpChecksum)
+
+    #
+    # the checksum of the MGI map export keys the checkpoint
+    # (a load resumed over a newer export would skip moved markers)
+    #
+
+    if checkpointFile and not pipeline:
+        try:
+            if mgiMapFormat == 'binary':
+                mgiChecksum = snpmaplib.checksum(mgiMapBinaryFile)
+            else:
+                mgiChecksum = snpmaplib.checksum(mgiMapFile)
+        except (IOError, TypeError):
+            mgiChecksum = None
+
+    if rc == 0 and checkpointFile and updateMode != 'file':
+        readCheckpoint()
+
+    if snpMap:
+        print 'Using SNP map cache: ' + snpCacheFile
+    elif dryRun:
+        pass
+    else:
+        #
+        # copy new input file
+        #
+        if os.system('cp -r ${SNP_DOWNLOAD_FILE} ${INPUTDIR}') != 0:
+            print 'Cannot copy the input file: ' + \
+                  str(os.getenv('SNP_DOWNLOAD_FILE')) + ' to ' + str(os.getenv('INPUTDIR'))
+            return 1
 
     #
     # Initialize file pointers.
@@ -172,6 +658,10 @@ def initialize():
 
     db.useOneConnection(1)
 
+    if rc == 0 and dryRun:
+        db.sql('set session characteristics as transaction read only', None)
+        print 'Dry run: report ' + reportFile
+
     return rc
 
 #
@@ -182,47 +672,158 @@ def initialize():
 # Throws: Nothing
 #
 def openFiles():
-    global fpSNPMap, fpMGIMap
-    global snpMap
+    global fpSNPMap, fpMGIMap, fpAllMaps, fpNewMap, fpChangedKeys
+    global snpMap, mgiMap
 
     #
     # Open the map files
+    # in pipeline mode, the MGI map file is only written (debug tap)
+    #
+    if not pipeline and mgiMapFormat == 'binary':
+        try:
+            mgiMap = mgimaplib.readMap(mgiMapBinaryFile)
+        except IOError:
+            mgiMap = None
+        if not mgiMap:
+            print 'Cannot open map file: ' + mgiMapBinaryFile
+            return 1
+    else:
+        try:
+            if not pipeline:
+                fpMGIMap = open(mgiMapFile, 'r')
+            elif debugTap:
+                fpMGIMap = open(mgiMapFile, 'w')
+        except:
+            print 'Cannot open map file: ' + mgiMapFile
+            return 1
+
+    if allMapsFile:
+        try:
+            fpAllMaps = open(allMapsFile, 'w')
+        except:
+            print 'Cannot open map file: ' + allMapsFile
+            return 1
+
+    #
+    # when resuming from a checkpoint, the markers committed before it
+    # are written again (see writeOffsets()), so every output file
+    # is rewritten in full
     #
+    if newMapFile:
+        try:
+            fpNewMap = open(newMapFile, 'w')
+        except:
+            print 'Cannot open map file: ' + newMapFile
+            return 1
+
+    if changedKeysFile:
+        try:
+            fpChangedKeys = open(changedKeysFile, 'w')
+        except:
+            print 'Cannot open changed keys file: ' + changedKeysFile
+            return 1
+
+    if snapshotFile:
+        if openSnapshot() != 0:
+            return 1
+
+    if openOtherMaps() != 0:
+        return 1
+
+    # snpMap was read from the cache (see initialize())
+    if snpMap:
+        return 0
+
     try:
         fpSNPMap = open(snpMapFile, 'r')
     except:
         print 'Cannot open map file: ' + snpMapFile
         return 1
 
-    try:
-        fpMGIMap = open(mgiMapFile, 'r')
-    except:
-        print 'Cannot open map file: ' + mgiMapFile
+    #
+    # the file parsed must be the SNP_DOWNLOAD_FILE whose checksum keys
+    # the cache, the snapshot and the checkpoint (not a partial copy)
+    #
+    if snpChecksum and snpmaplib.checksum(snpMapFile) != snpChecksum:
+        print 'Map file differs from SNP_DOWNLOAD_FILE: ' + snpMapFile
         return 1
 
     #
     # Create snpMap lookup
     #
-    lineNum = 0
-    for line in fpSNPMap.readlines():
+    try:
+        snpMap = snpmaplib.readSnpMap(fpSNPMap)
+        snpMap.validate()
+        for chr in snpMap.chromosomes():
+            loadmetrics.count('rowsRead', snpMap.size(chr))
+    except ValueError, e:
+        print 'Cannot parse map file: ' + snpMapFile + ': ' + str(e)
+        return 1
+
+    #
+    # rebuild the cache for the next run
+    # (not for a dry run's candidate map)
+    #
+    if snpCacheFile and snpChecksum and not dryRun:
+        try:
+            snpmaplib.writeCache(snpMap, snpCacheFile, snpChecksum)
+            print 'Rebuilt SNP map cache: ' + snpCacheFile
+        except (IOError, OSError), e:
+            print 'Cannot write SNP map cache: ' + snpCacheFile + ': ' + str(e)
+
+    return 0
+
+#
+# Purpose: Reads the other SNP maps (GENMAP_SNP_MAPS)
+#          and opens their output files
+# Returns: 1 if a map cannot be read or an output file cannot be
+#          opened, else 0
+# Assumes: Nothing
+# Effects: reads each map from its cache, or parses it and
+#          rebuilds its cache
+# Throws: Nothing
+#
 
-	lineNum = lineNum + 1
+def openOtherMaps():
 
-	# skip header line
-	if lineNum == 1:
-	    continue
-	    
-        (snpid, chr, bp, fcM, mcM, acM) = line.split(COMMA)
+    for m in otherMaps:
 
-	if chr == '20':
-	    mcM = acM = fcM
+        try:
+            sum = snpmaplib.checksum(m['mapFile'])
+        except IOError:
+            print 'Cannot open map file: ' + m['mapFile']
+            return 1
 
-	key = chr
-	value = (float(bp), float(fcM), float(mcM), float(acM.strip()))
+        if m['cacheFile']:
+            m['snpMap'] = snpmaplib.readCache(m['cacheFile'], sum)
 
-	if not snpMap.has_key(key):
-	    snpMap[key] = []
-	snpMap[key].append(value)
+        if m['snpMap']:
+            print 'Using SNP map cache (%s): %s' % (m['name'], m['cacheFile'])
+        else:
+            try:
+                fp = open(m['mapFile'], 'r')
+                m['snpMap'] = snpmaplib.readSnpMap(fp)
+                fp.close()
+                m['snpMap'].validate()
+            except IOError:
+                print 'Cannot open map file: ' + m['mapFile']
+                return 1
+            except ValueError, e:
+                print 'Cannot parse map file: ' + m['mapFile'] + ': ' + str(e)
+                return 1
+
+            if m['cacheFile']:
+                try:
+                    snpmaplib.writeCache(m['snpMap'], m['cacheFile'], sum)
+                    print 'Rebuilt SNP map cache (%s): %s' % (m['name'], m['cacheFile'])
+                except (IOError, OSError), e:
+                    print 'Cannot write SNP map cache: ' + m['cacheFile'] + ': ' + str(e)
+
+        try:
+            m['fp'] = open(m['outputFile'], 'w')
+        except IOError:
+            print 'Cannot open map file: ' + m['outputFile']
+            return 1
 
     return 0
 
@@ -242,115 +843,453 @@ def closeFiles():
     if fpMGIMap:
         fpMGIMap.close()
 
+    if fpAllMaps:
+        fpAllMaps.close()
+
+    if fpNewMap:
+        fpNewMap.close()
+
+    if fpChangedKeys:
+        fpChangedKeys.close()
+
+    for m in otherMaps:
+        if m['fp']:
+            m['fp'].close()
+
+    if fpSnapshot:
+        fpSnapshot.close()
+        os.remove(fpSnapshot.name)
+
+    for pool in (convertPool, applyPool):
+        if pool:
+            pool.close()
+            pool.join()
+
     db.useOneConnection(0)
 
     return 0
 
 #
-# Purpose: Performs a binary search of the SNP (by position)
-# Returns: the SNP interval containing the given position
-#    imax is an index within snpMap for a given chromosome
-#    the position argument (pos) is in the interval defined by the SNP 
-#    at imax and the one at imaX+1.
+# Purpose: Reads the snapshot of the last load (incremental load)
+#          and opens the snapshot of this load
+# Returns: 1 if the new snapshot cannot be opened, else 0
 # Assumes: Nothing
-# Effects: Nothing
+# Effects: loads the snapshot lookup
+#          turns incremental off if there is no usable snapshot
+# Throws: Nothing
+#
+
+def openSnapshot():
+    global incremental, fpSnapshot
+
+    if incremental:
+        try:
+            fp = open(snapshotFile, 'r')
+            header = fp.readline().rstrip(CRT).split(TAB)
+        except IOError:
+            fp = None
+            header = []
+
+        if not fp:
+            print 'No MGI map snapshot; running a full load: ' + snapshotFile
+            incremental = False
+        elif header != ['#snpChecksum', str(snpChecksum)]:
+            print 'SNP map has changed since the last load; running a full load'
+            incremental = False
+        else:
+            for line in fp:
+                (markerKey, chr, bp, cm) = line.rstrip(CRT).split(TAB)
+                snapshot[markerKey] = (chr, bp, cm)
+            print 'Incremental load against snapshot: ' + snapshotFile
+
+        if fp:
+            fp.close()
+
+    try:
+        fpSnapshot = open(snapshotFile + '.new', 'w')
+        fpSnapshot.write('#snpChecksum' + TAB + str(snpChecksum) + CRT)
+    except IOError:
+        print 'Cannot open map snapshot: ' + snapshotFile + '.new'
+        return 1
+
+    for c in ('skipped', 'added', 'moved', 'removed'):
+        incrementalCounts[c] = 0
+
+    return 0
+
+#
+# Purpose: Checks a marker against the snapshot of the last load
+# Returns: True if the marker's chromosome, bp and current cM offset
+#          are the same as in the snapshot
+# Assumes: Nothing
+# Effects: removes the marker from the snapshot lookup
+# Throws: Nothing
+#
+
+def isUnmoved(markerKey, chr, bp, oldCm):
+
+    if not snapshot.has_key(markerKey):
+        incrementalCounts['added'] = incrementalCounts['added'] + 1
+        return False
+
+    (lastChr, lastBp, lastCm) = snapshot[markerKey]
+    del snapshot[markerKey]
+
+    if chr == lastChr and bp == lastBp and \
+        (oldCm == lastCm or \
+         (oldCm != 'None' and lastCm != 'None' and abs(float(oldCm) - float(lastCm)) <= tolerance)):
+        incrementalCounts['skipped'] = incrementalCounts['skipped'] + 1
+        return True
+
+    incrementalCounts['moved'] = incrementalCounts['moved'] + 1
+    return False
+
+#
+# Purpose: Replaces the snapshot of the last load with that of this load
+# Returns: Nothing
+# Assumes: the load has been committed
+# Effects: renames the new snapshot file
+# Throws: Nothing
+#
+
+def saveSnapshot():
+    global fpSnapshot
+
+    if not fpSnapshot:
+        return
+
+    fpSnapshot.close()
+    os.rename(fpSnapshot.name, snapshotFile)
+    fpSnapshot = None
+
+    if incremental:
+        incrementalCounts['removed'] = len(snapshot)
+        for c in ('skipped', 'added', 'moved', 'removed'):
+            print 'incremental %s: %d' % (c, incrementalCounts[c])
+
+#
+# Purpose: Reads the checkpoint of an interrupted load
+# Returns: Nothing
+# Assumes: snpChecksum and mgiChecksum have been computed
+# Effects: sets the checkpoint globals, if the checkpoint was written
+#          with the same SNP map, MGI map export and update mode
+# Throws: Nothing
+#
+
+def readCheckpoint():
+    global checkpointChr, checkpointKey, checkpointChromosomes
+
+    try:
+        fp = open(checkpointFile, 'r')
+    except IOError:
+        return
+
+    checkpoint = {}
+    for line in fp:
+        (name, value) = (line.rstrip(CRT).split(TAB) + [''])[:2]
+        checkpoint[name] = value
+    fp.close()
+
+    if checkpoint.get('snpChecksum') != str(snpChecksum) or \
+       checkpoint.get('updateMode') != updateMode:
+        print 'Checkpoint is from a different SNP map or update mode; starting over: ' + checkpointFile
+        return
+
+    if not mgiChecksum or checkpoint.get('mgiChecksum') != mgiChecksum:
+        print 'Checkpoint is from a different MGI map export; starting over: ' + checkpointFile
+        return
+
+    if checkpoint.get('markerKey'):
+        checkpointKey = int(checkpoint['markerKey'])
+        checkpointChr = checkpoint.get('chromosome')
+
+    if checkpoint.get('chromosomes'):
+        checkpointChromosomes = checkpoint['chromosomes'].split(COMMA)
+
+    print 'Resuming from checkpoint: %s (marker key %s, chromosomes %s)' % \
+          (checkpointFile, checkpointKey, string.join(checkpointChromosomes, COMMA))
+
+#
+# Purpose: Writes the checkpoint
+# Returns: Nothing
+# Assumes: the markers it records have been committed
+# Effects: replaces the checkpoint file atomically
+# Throws: IOError, OSError
+#
+
+def writeCheckpoint():
+
+    if not checkpointFile:
+        return
+
+    tmpFile = checkpointFile + '.tmp'
+    fp = open(tmpFile, 'w')
+    for (name, value) in (('snpChecksum', snpChecksum),
+                          ('mgiChecksum', mgiChecksum),
+                          ('updateMode', updateMode),
+                          ('chromosome', checkpointChr),
+                          ('markerKey', checkpointKey),
+                          ('chromosomes', string.join(checkpointChromosomes, COMMA))):
+        if value is None:
+            value = ''
+        fp.write(name + TAB + str(value) + CRT)
+    fp.flush()
+    os.fsync(fp.fileno())
+    fp.close()
+    os.rename(tmpFile, checkpointFile)
+
+#
+# Purpose: Removes the checkpoint at the end of a load
+# Returns: Nothing
+#
+
+def removeCheckpoint():
+
+    if checkpointFile and os.path.exists(checkpointFile):
+        os.remove(checkpointFile)
+
+#
+# Purpose: Checks whether an interrupted load has already committed
+#          a marker's new offset
+# Returns: True if the marker is at or before the checkpoint
+# Assumes: the markers are read in marker key order
+#
+
+def isCommitted(markerKey, chr):
+
+    if chr in checkpointChromosomes:
+        return True
+
+    return checkpointKey is not None and int(markerKey) <= checkpointKey
+
+#
+# Purpose: Commits the markers written so far (CMOFFSET_COMMIT_SIZE)
+# Returns: Nothing
+# Assumes: startBulkUpdate() has been called (bulk mode)
+# Effects: applies the staged offsets and starts a new bulk update
+#          (bulk mode) or commits (row mode), then writes the checkpoint
 # Throws: Nothing
 #
 # Args:
-#   s           marker value = (bp, fcM, mcM, acM)
-#   pos         (numeric) The position to locate.
-#   fromCoord   (integer) The column number in the SNP table to search in.
+#   chr        chromosome of the last marker written
+#   markerKey  key of the last marker written
+#
+
+def commitBatch(chr, markerKey):
+    global committedStaged, committedUpdated
+    global checkpointChr, checkpointKey
+
+    if updateMode == 'bulk':
+        updated = applyStaged()
+        committedStaged = committedStaged + stagedRows
+        committedUpdated = committedUpdated + updated
+        loadmetrics.count('rowsUpdated', updated)
+        startBulkUpdate()
+    elif updateMode == 'row':
+        db.commit()
+    else:
+        return
+
+    # a resumed load re-reads the markers before its checkpoint:
+    # never move it back
+    if checkpointKey is not None and int(markerKey) <= checkpointKey:
+        return
+
+    checkpointChr = chr
+    checkpointKey = int(markerKey)
+    writeCheckpoint()
+
+#
+# Purpose: Start a bulk update of MRK_Marker.cmOffset
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: creates the cmOffsets temp table
+# Throws: Nothing
+#
+
+def startBulkUpdate():
+    global stagedRows
+
+    db.sql('''create temp table cmOffsets (
+              _Marker_key int not null,
+              cmOffset numeric not null)
+              ''', None)
+
+    stagedRows = 0
+    del stageBuffer[:]
+
+#
+# Purpose: Stage one new map position for the bulk update
+# Returns: Nothing
+# Assumes: startBulkUpdate() has been called
+# Effects: inserts into cmOffsets every insertBatchSize rows
+#          (one multi-row insert)
+# Throws: Nothing
 #
 
-def bsearch(s, pos, fromCoord):
+def stageOffset(markerKey, newCm):
 
-    imin = 0
-    imax = len(s) - 1
+    stageBuffer.append('(%s,%s)' % (markerKey, newCm))
 
-    # binary seach loop
+    if len(stageBuffer) >= insertBatchSize:
+        flushStage()
 
-    while imin <= imax:
+def flushStage():
+    global stagedRows
 
-	# check the middle item
-        imid = (imin + imax)/2
-        ival = s[imid][fromCoord]
+    if not stageBuffer:
+        return
 
-        if pos > ival:
-	    # too big, check second  half of list
-            imin = imid + 1
+    db.sql('insert into cmOffsets values ' + string.join(stageBuffer, COMMA), None)
+    stagedRows = stagedRows + len(stageBuffer)
+    del stageBuffer[:]
 
-        elif pos <= ival:
-	    # too little, check first half of list
-            imax = imid - 1
+#
+# Purpose: Apply the staged map positions to MRK_Marker in one transaction
+#          by running one update...from
+# Returns: 0 (finishBulkUpdate), number of rows updated (applyStaged)
+# Assumes: startBulkUpdate() has been called
+# Effects: updates MRK_Marker.cmOffset, drops the cmOffsets temp table
+# Throws: Nothing
+#
+
+def finishBulkUpdate():
+
+    updated = applyStaged()
+
+    print 'cmOffset rows staged: %d' % (committedStaged + stagedRows)
+    print 'cmOffset rows updated: %d' % (committedUpdated + updated)
+
+    loadmetrics.count('rowsUpdated', updated)
+
+    return 0
+
+def applyStaged():
+
+    flushStage()
+
+    db.sql('create index cmOffsets_idx1 on cmOffsets(_Marker_key)', None)
+    db.sql('analyze cmOffsets', None)
 
-    return imax
+    results = db.sql('''with updated as (
+              update MRK_Marker m
+              set cmOffset = t.cmOffset
+              from cmOffsets t
+              where m._Marker_key = t._Marker_key
+              returning m._Marker_key
+              )
+              select count(*) as updated from updated
+              ''', 'auto')
+
+    db.sql('drop table cmOffsets', None)
+    db.commit()
+
+    return results[0]['updated']
 
 #
-# Purpose: Converts (via interpolation) one type of coordinate to another
-# Returns: the new map position
+# Purpose: Compares a new map position against the current one
+# Returns: 'unchanged', 'newly syntenic', 'newly placed' or 'changed'
 # Assumes: Nothing
 # Effects: Nothing
 # Throws: Nothing
 #
 # Args:
-#   chr       (integer) chromosome number (1-20)
-#   pos       (numeric) position to convert
-#   fromCoord (integer) column in which to search for pos
-#   toCoord   (integer) column to interpolate to get answer
+#   newCm     (float) the interpolated map position
+#   oldCm     (string) the current MRK_Marker.cmOffset ('None' if null)
 #
 
-def convert(chr, pos, fromCoord = I_BP, toCoord = I_ACM):
+def compareOffset(newCm, oldCm):
+
+    if oldCm != 'None' and abs(newCm - float(oldCm)) <= tolerance:
+        return 'unchanged'
+
+    if newCm == -1.0:
+        return 'newly syntenic'
 
-    s = snpMap[chr]
-    i = bsearch(s, pos, fromCoord)
+    if newCm >= 0 and (oldCm == 'None' or float(oldCm) < 0):
+        return 'newly placed'
 
-    if i == len(s) - 1:
-	x = float(s[i][toCoord])
-	y = float(s[i][fromCoord])
-	pos = float(pos)
-	pos2 = float(pos * x)/y
+    return 'changed'
 
-        if toCoord == I_BP:
-            pos2 = int(pos2)
+#
+# Purpose: Reads the MGI map
+# Returns: generator of (marker key, symbol, MGI ID, chromosome, bp, cmOffset)
+#          as strings; from the binary MGI map, followed by the bp as
+#          a number (see markerPosition())
+# Assumes: Nothing
+# Effects: in pipeline mode, writes the rows to the MGI map file
+#          if the debug tap is on
+# Throws: Nothing
+#
+
+def markerRows():
+
+    if pipeline:
+        for row in makeMGIMapFile.iterMap(dryRun):
+            if fpMGIMap:
+                fpMGIMap.write(string.join(row, TAB) + CRT)
+            yield row
+    elif mgiMap:
+        for row in mgiMap.rows():
+            loadmetrics.count('rowsRead')
+            yield row
     else:
+        for line in fpMGIMap:
+            loadmetrics.count('rowsRead')
+            yield line.strip().split(TAB)
+
+#
+# Purpose: The bp of a marker, for interpolation
+# Returns: the bp (number or None) of a binary MGI map row,
+#          else the bp string ('None' if no coordinate)
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+
+def markerPosition(row):
 
-        from1 = s[i][fromCoord]
-        from2 = s[i+1][fromCoord]
-        f = float(pos - from1)/(from2 - from1)
-        to1 = s[i][toCoord]
-        to2 = s[i+1][toCoord]
-        pos2 = to1 + f*(to2-to1)
-        if toCoord == I_BP:
-            pos2 = int(pos2)
+    if len(row) > 6:
+        return row[6]
 
-    return pos2
+    return row[4]
 
 #
-# Purpose: Generate the map by interpolating
-#          the SNP map and the MGI map.
-# Returns: 0
+# Purpose: Interpolates the map positions of the markers of one chromosome
+# Returns: list of new map positions, in the same order as bps:
+#          one tuple per marker of one position (string) per coords
 # Assumes: Nothing
-# Effects: creates the map file
+# Effects: Nothing
 # Throws: Nothing
 #
-def genMap():
+# Args:
+#   chr       chromosome
+#   bps       list of bp (string, 'None' if no coordinate,
+#             or number, None if no coordinate; see markerPosition())
+#   s         SnpMap holding chr (default snpMap)
+#   coords    the maps to interpolate (default toCoords)
+#
 
-    #
-    # for each marker found in mgd...
-    #
+def convertChromosome(chr, bps, s = None, coords = None):
+
+    if s is None:
+        s = snpMap
+
+    if coords is None:
+        coords = toCoords
 
-    for line in fpMGIMap.readlines():
+    newCms = []
 
-	# not all of these fields are needed for the interpolation,
-	# but are handy for testing/debugging
+    # (index into newCms, bp) of the markers to interpolate
+    toConvert = []
 
-	(markerKey, symbol, accid, chr, bp) = line.strip().split(TAB)
+    for bp in bps:
 
 	# if there is no basepair,
 	#     then set this map position to syntenic
 
-	if bp == 'None' or bp <= 0:
-	    newCm = '-1.0'
+	if bp is None or bp == 'None' or float(bp) <= 0:
+	    newCm = ('-1.0',) * len(coords)
 
 	#
 	# if chromosome does not exist in snpMap
@@ -360,20 +1299,784 @@ def genMap():
 	# note that some of the MT's have genome coordinates
 	#
 
-	elif not snpMap.has_key(chr):
-	    #print 'chromosome not found in snpMap:  ', symbol, chr
-	    newCm = '-1.0'
+	elif not s.has_key(chr):
+	    #print 'chromosome not found in snpMap:  ', chr
+	    newCm = ('-1.0',) * len(coords)
 
-	# for everything else, interpolate the map position
+	# for everything else, interpolate the map position (below)
 
         else:
-	    # send convert the chromosome and the bp of the marker
-	    newCm = str(convert(chr, float(bp)))
+            newCm = None
+            toConvert.append((len(newCms), float(bp)))
+
+        newCms.append(newCm)
+
+    #
+    # send convert the chromosome and the bp of its markers
+    # (one interval search per marker for all of coords)
+    #
+
+    if toConvert:
+        results = s.convertBatchMulti(chr, [pos for (i, pos) in toConvert], fromCoord, coords)
+        for j in range(len(toConvert)):
+            newCms[toConvert[j][0]] = tuple([str(r[j]) for r in results])
+
+    return newCms
+
+#
+# Purpose: Interpolates the map positions of a batch of markers
+# Returns: list of new map positions (see convertChromosome()),
+#          in the same order as markers
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+# Args:
+#   markers   list of (marker key, symbol, MGI ID, chromosome, bp, cmOffset)
+#   s         SnpMap (default snpMap)
+#   coords    the maps to interpolate (default toCoords)
+#
+
+def convertMarkers(markers, s = None, coords = None):
+
+    newCms = [None] * len(markers)
+
+    #
+    # each chromosome is interpolated in one batch
+    #
+    # key = chromosome
+    # value = [index into markers, ...]
+    #
+
+    byChromosome = {}
+
+    for i in range(len(markers)):
+        chr = markers[i][3]
+        if not byChromosome.has_key(chr):
+            byChromosome[chr] = []
+        byChromosome[chr].append(i)
+
+    for chr in byChromosome.keys():
+        indexes = byChromosome[chr]
+        results = convertChromosome(chr, [markerPosition(markers[i]) for i in indexes], s, coords)
+        for j in range(len(indexes)):
+            newCms[indexes[j]] = results[j]
+
+    return newCms
+
+#
+# Purpose: Writes the new map positions of a batch of markers
+#          that differ from their current map position
+# Returns: Nothing
+# Assumes: startBulkUpdate() has been called (bulk mode)
+# Effects: updates MRK_Marker.cmOffset (row mode)
+#          or stages the new map positions (bulk mode),
+#          except for the markers committed by an interrupted load
+#          writes the all maps file, the new map positions file
+#          and the changed marker keys file
+# Throws: Nothing
+#
+# Args:
+#   markers   list of (marker key, symbol, MGI ID, chromosome, bp, cmOffset)
+#   newCms    list of new map positions (see convertChromosome())
+#   offsets   if given, the (marker key, cmOffset) of the changed markers
+#             are appended to this list instead of being written
+#
+
+def writeOffsets(markers, newCms, offsets = None):
+
+    iCm = list(toCoords).index(toCoord)
+
+    for i in range(len(markers)):
+
+        (markerKey, symbol, accid, chr, bp, oldCm) = markers[i][:6]
+        newCm = newCms[i][iCm]
+
+        if fpAllMaps:
+            fpAllMaps.write(string.join([markerKey, symbol, accid, chr, bp] + list(newCms[i]), TAB) + CRT)
 
         #print string.join([markerKey, symbol, accid, chr, bp, newCm], TAB)
-	mapSQL = "update MRK_Marker set cmOffset = '%s' where _Marker_key = %s" % (float(newCm), markerKey)
-	db.sql(mapSQL, None);
-	db.commit()
+
+        change = compareOffset(float(newCm), oldCm)
+        changeCounts[change] = changeCounts[change] + 1
+
+        if dryRun:
+            countChange(markers[i], change, float(newCm))
+            continue
+
+        if fpSnapshot:
+            if change == 'unchanged':
+                fpSnapshot.write(string.join([markerKey, chr, bp, oldCm], TAB) + CRT)
+            else:
+                fpSnapshot.write(string.join([markerKey, chr, bp, str(float(newCm))], TAB) + CRT)
+
+        # only write real changes
+
+        if change == 'unchanged':
+            continue
+
+        loadmetrics.count('rowsWritten')
+
+        if fpNewMap:
+            fpNewMap.write(markerKey + TAB + str(float(newCm)) + CRT)
+
+        if fpChangedKeys:
+            fpChangedKeys.write(markerKey + CRT)
+
+        if updateMode == 'file':
+            continue
+
+        # resumed load: the interrupted load has committed it
+
+        if isCommitted(markerKey, chr):
+            changeCounts['resumed'] = changeCounts.get('resumed', 0) + 1
+            continue
+
+        if offsets is not None:
+            offsets.append((markerKey, float(newCm)))
+        elif updateMode == 'row':
+	    mapSQL = "update MRK_Marker set cmOffset = '%s' where _Marker_key = %s" % (float(newCm), markerKey)
+	    db.sql(mapSQL, None);
+            if not commitSize:
+	        db.commit()
+            loadmetrics.count('rowsUpdated')
+        else:
+            stageOffset(markerKey, float(newCm))
+
+#
+# Purpose: Interpolates a batch of markers against the other SNP maps
+# Returns: list of the map positions of the markers (see convertMarkers()),
+#          one per map in otherMaps
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+
+def convertOtherMaps(markers):
+
+    return [convertMarkers(markers, m['snpMap'], ALL_COORDS) for m in otherMaps]
+
+#
+# Purpose: Writes the map positions of a batch of markers
+#          for each of the other SNP maps
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: writes the other maps' output files
+# Throws: Nothing
+#
+# Args:
+#   markers   list of (marker key, symbol, MGI ID, chromosome, bp, cmOffset)
+#   otherCms  see convertOtherMaps()
+#
+
+def writeOtherMaps(markers, otherCms):
+
+    for j in range(len(otherMaps)):
+
+        fp = otherMaps[j]['fp']
+        newCms = otherCms[j]
+
+        for i in range(len(markers)):
+            (markerKey, symbol, accid, chr, bp, oldCm) = markers[i][:6]
+            fp.write(string.join([markerKey, symbol, accid, chr, bp] + list(newCms[i]), TAB) + CRT)
+
+def printCommitted():
+
+    if changeCounts.has_key('resumed'):
+        print 'cmOffset resumed (committed by the interrupted load): %d' % (changeCounts['resumed'])
+
+#
+# Purpose: Counts the change of one marker for the dry run report
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: adds to chrCounts, deltaCounts and topMoves
+# Throws: Nothing
+#
+# Args:
+#   row       (marker key, symbol, MGI ID, chromosome, bp, cmOffset)
+#   change    see compareOffset()
+#   newCm     (float) the interpolated map position
+#
+
+def countChange(row, change, newCm):
+
+    (markerKey, symbol, accid, chr, bp, oldCm) = row[:6]
+
+    if not chrCounts.has_key(chr):
+        chrCounts[chr] = {}
+        for c in ('unchanged', 'changed', 'newly syntenic', 'newly placed'):
+            chrCounts[chr][c] = 0
+
+    chrCounts[chr][change] = chrCounts[chr][change] + 1
+
+    if change != 'changed' or oldCm == 'None':
+        return
+
+    delta = abs(newCm - float(oldCm))
+
+    i = 0
+    while i < len(DELTA_BINS) and delta >= DELTA_BINS[i]:
+        i = i + 1
+    deltaCounts[i] = deltaCounts[i] + 1
+
+    if reportTop > 0:
+        move = (delta, markerKey, symbol, accid, chr, bp, float(oldCm), newCm)
+        if len(topMoves) < reportTop:
+            heapq.heappush(topMoves, move)
+        elif delta > topMoves[0][0]:
+            heapq.heapreplace(topMoves, move)
+
+#
+# Purpose: Writes the dry run report
+# Returns: 1 if the report cannot be written, else 0
+# Assumes: genMap() has counted the changes
+# Effects: writes GENMAP_DRYRUN_REPORT
+# Throws: Nothing
+#
+
+def writeReport():
+
+    try:
+        fp = open(reportFile, 'w')
+    except IOError:
+        print 'Cannot open report: ' + reportFile
+        return 1
+
+    changes = ('unchanged', 'changed', 'newly syntenic', 'newly placed')
+
+    fp.write('Genetic map dry run' + CRT)
+    fp.write('SNP map: ' + snpMapFile + CRT)
+    fp.write('Date: ' + mgi_utils.date() + CRT)
+    fp.write('Tolerance (cM): ' + str(tolerance) + CRT + CRT)
+
+    # changes by chromosome, in chromosome order ("20" is X)
+
+    def chrOrder(chr):
+        if chr.isdigit():
+            return (int(chr), chr)
+        return (100, chr)
+
+    fp.write('Changes by chromosome' + CRT)
+    fp.write(string.join(['chr'] + list(changes) + ['total'], TAB) + CRT)
+
+    chromosomes = chrCounts.keys()
+    chromosomes.sort(lambda x, y: cmp(chrOrder(x), chrOrder(y)))
+
+    for chr in chromosomes:
+        counts = [chrCounts[chr][c] for c in changes]
+        fp.write(string.join([chr] + map(str, counts + [sum(counts)]), TAB) + CRT)
+
+    counts = [changeCounts[c] for c in changes]
+    fp.write(string.join(['total'] + map(str, counts + [sum(counts)]), TAB) + CRT + CRT)
+
+    # histogram of the cM deltas
+
+    fp.write('cM delta of the changed markers (|new - old|)' + CRT)
+
+    low = '0'
+    for i in range(len(DELTA_BINS)):
+        fp.write('%s - %s%s%d%s' % (low, DELTA_BINS[i], TAB, deltaCounts[i], CRT))
+        low = str(DELTA_BINS[i])
+    fp.write('>= %s%s%d%s' % (low, TAB, deltaCounts[-1], CRT))
+    fp.write(CRT)
+
+    # largest moves, largest first
+
+    moves = heapq.nlargest(len(topMoves), topMoves)
+
+    fp.write('Largest moves (top %d)%s' % (reportTop, CRT))
+    fp.write(string.join(['Marker key', 'Symbol', 'MGI ID', 'chr', 'bp', 'old cM', 'new cM', 'delta'], TAB) + CRT)
+
+    for (delta, markerKey, symbol, accid, chr, bp, oldCm, newCm) in moves:
+        fp.write(string.join([markerKey, symbol, accid, chr, bp, str(oldCm), str(newCm), '%.6f' % (delta)], TAB) + CRT)
+
+    fp.close()
+
+    print 'Dry run report written: ' + reportFile
+
+    return 0
+
+#
+# Purpose: Interpolates one chromosome in a convertPool worker
+# Returns: (chromosome, list of new map positions (see convertChromosome()))
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+# Args:
+#   task      (chromosome, SNP map columns of the chromosome or None,
+#              list of bp)
+#
+
+def convertTask(task):
+
+    (chr, columns, bps) = task
+
+    s = snpmaplib.SnpMap()
+    if columns:
+        s.setColumns(chr, columns)
+
+    return (chr, convertChromosome(chr, bps, s))
+
+#
+# Purpose: Applies the new map positions of one chromosome
+#          in an applyPool worker, in one transaction
+# Returns: (chromosome, rows staged, rows updated, database round trips)
+# Assumes: Nothing
+# Effects: updates MRK_Marker.cmOffset over the worker's own
+#          database connection
+# Throws: Nothing
+#
+# Args:
+#   task      (chromosome, list of (marker key, cmOffset))
+#
+
+def applyTask(task):
+
+    (chr, offsets) = task
+
+    roundTrips = loadmetrics.dbRoundTrips
+
+    startBulkUpdate()
+    for (markerKey, newCm) in offsets:
+        stageOffset(markerKey, newCm)
+
+    updated = applyStaged()
+
+    return (chr, stagedRows, updated, loadmetrics.dbRoundTrips - roundTrips)
+
+#
+# Purpose: Runs a task in a pool worker, profiled if GENMAP_PROFILE=yes
+# Returns: the return value of the task
+# Assumes: Nothing
+# Effects: see loadmetrics.profileHelper()
+# Throws: Nothing
+#
+# Args:
+#   task      (convertTask or applyTask, its task)
+#
+
+def poolTask(task):
+
+    (function, args) = task
+
+    return loadmetrics.profileHelper(function.__name__, function, args)
+
+#
+# Purpose: Generate the map by interpolating the SNP map and the MGI map,
+#          one chromosome per worker process, and apply the new map
+#          positions one chromosome per database connection
+# Returns: 0
+# Assumes: initialize() has started convertPool and applyPool
+# Effects: updates MRK_Marker.cmOffset
+# Throws: Nothing
+#
+
+def genMapParallel():
+
+    for c in ('unchanged', 'changed', 'newly syntenic', 'newly placed'):
+        changeCounts[c] = 0
+
+    #
+    # partition the markers by chromosome
+    #
+    # key = chromosome
+    # value = list of (marker key, symbol, MGI ID, chromosome, bp, cmOffset)
+    #
+
+    byChromosome = {}
+
+    for row in markerRows():
+
+        (markerKey, symbol, accid, chr, bp, oldCm) = row[:6]
+
+        # incremental load: skip the markers that have not moved
+
+        if incremental:
+            if isUnmoved(markerKey, chr, bp, oldCm):
+                fpSnapshot.write(string.join([markerKey, chr, bp, oldCm], TAB) + CRT)
+                continue
+
+        if not byChromosome.has_key(chr):
+            byChromosome[chr] = []
+        byChromosome[chr].append(row)
+
+    #
+    # interpolate, largest chromosomes first;
+    # each worker is sent only its chromosome's slice of the SNP map
+    #
+
+    tasks = []
+    for chr in byChromosome.keys():
+        if snpMap.has_key(chr):
+            columns = [snpMap.column(chr, i) for i in (snpmaplib.I_BP, snpmaplib.I_FCM, snpmaplib.I_MCM, snpmaplib.I_ACM)]
+        else:
+            columns = None
+        tasks.append((chr, columns, [markerPosition(row) for row in byChromosome[chr]]))
+    tasks.sort(lambda x, y: cmp(len(y[2]), len(x[2])))
+
+    applyTasks = []
+
+    for (chr, newCms) in convertPool.imap_unordered(poolTask, [(convertTask, task) for task in tasks]):
+        offsets = []
+        writeOffsets(byChromosome[chr], newCms, offsets)
+        writeOtherMaps(byChromosome[chr], convertOtherMaps(byChromosome[chr]))
+        if offsets:
+            applyTasks.append((chr, offsets))
+        del byChromosome[chr]
+
+    for c in ('unchanged', 'changed', 'newly syntenic', 'newly placed'):
+        print 'cmOffset %s: %d' % (c, changeCounts[c])
+
+    #
+    # apply, one transaction per chromosome
+    #
+
+    staged = 0
+    updated = 0
+
+    for (chr, chrStaged, chrUpdated, roundTrips) in applyPool.imap_unordered(poolTask, [(applyTask, task) for task in applyTasks]):
+        print 'cmOffset chromosome %s rows staged: %d updated: %d' % (chr, chrStaged, chrUpdated)
+        staged = staged + chrStaged
+        updated = updated + chrUpdated
+        loadmetrics.count('dbRoundTrips', roundTrips)
+        checkpointChromosomes.append(chr)
+        writeCheckpoint()
+
+    print 'cmOffset rows staged: %d' % (staged)
+    print 'cmOffset rows updated: %d' % (updated)
+
+    loadmetrics.count('rowsUpdated', updated)
+
+    printCommitted()
+    saveSnapshot()
+    removeCheckpoint()
+
+    return 0
+
+#
+# Purpose: Reads the MGI map in batches
+# Returns: generator of (markers, skipped):
+#          markers: list of up to batchSize rows to interpolate
+#          skipped: list of the rows read since the last batch
+#          that have not moved (incremental load)
+# Assumes: Nothing
+# Effects: see isUnmoved()
+# Throws: Nothing
+#
+
+def markerBatches(batchSize):
+
+    markers = []
+    skipped = []
+
+    for row in markerRows():
+
+        (markerKey, symbol, accid, chr, bp, oldCm) = row[:6]
+
+        # incremental load: skip the markers that have not moved
+
+        if incremental:
+            if isUnmoved(markerKey, chr, bp, oldCm):
+                skipped.append(row)
+                continue
+
+        markers.append(row)
+
+        if len(markers) >= batchSize:
+            yield (markers, skipped)
+            markers = []
+            skipped = []
+
+    yield (markers, skipped)
+
+#
+# Purpose: Checks whether the markers can be interpolated column-wise
+#          (see convertColumns())
+# Returns: True if the MGI map is binary, numpy is available and
+#          only the sex-averaged map of each marker is needed:
+#          no dry run, incremental load, resumed load, all maps file
+#          or other SNP maps, which all work row by row
+# Assumes: openFiles() has been called
+# Effects: Nothing
+# Throws: Nothing
+#
+
+def isColumnar():
+
+    return mgiMap is not None and mgimaplib.numpy is not None and \
+           snpmaplib.numpy is not None and \
+           not dryRun and not incremental and not allMapsFile and \
+           not otherMaps and checkpointKey is None and not checkpointChromosomes
+
+#
+# Purpose: Interpolates the binary MGI map column-wise
+# Returns: Nothing
+# Assumes: isColumnar()
+# Effects: see writeOffsets(); commits every commitSize changed
+#          markers (commitBatch())
+# Throws: Nothing
+#
+# The bp column of each chromosome goes to convertBatchMulti() as a numpy
+# array, and the new offsets are compared with the cmOffset column as
+# arrays.  Rows (strings) are only built for the markers that may have
+# changed, and written by writeOffsets() in marker key order, as in the
+# row-wise load.  A marker is only taken as unchanged here if it is
+# within CMOFFSET_TOLERANCE by more than the rounding of the offsets to
+# strings (str(), 12 digits); the others are compared by writeOffsets()
+# exactly as in the row-wise load.
+#
+# Args:
+#   batchSize   number of changed markers written at a time
+#
+
+def convertColumns(batchSize):
+
+    numpy = mgimaplib.numpy
+
+    n = mgiMap.size()
+    loadmetrics.count('rowsRead', n)
+
+    chrs = mgiMap.column('chr')
+    bps = mgiMap.column('bp')
+    oldCms = mgiMap.column('cmOffset')
+
+    # no coordinate (bp <= 0, BP_NULL) or chromosome not in snpMap: syntenic
+    newCms = numpy.empty(n, dtype = numpy.float64)
+    newCms.fill(-1.0)
+
+    for code in range(len(mgiMap.chromosomes)):
+        chr = mgiMap.chromosomes[code]
+        if not snpMap.has_key(chr):
+            continue
+        indexes = numpy.nonzero((chrs == code) & (bps > 0))[0]
+        if len(indexes):
+            newCms[indexes] = snpMap.convertBatchMulti(chr, bps[indexes], fromCoord, (toCoord,), True)[0]
+
+    # the same test as compareOffset(), which sees the new offset
+    # rounded by str(); the slack covers the rounding
+    # (NaN, a null cmOffset, is never unchanged)
+    err = numpy.seterr(invalid = 'ignore')
+    try:
+        slack = (numpy.abs(newCms) + numpy.abs(oldCms)) * 1e-11
+        unchanged = numpy.abs(newCms - oldCms) <= tolerance + slack
+    finally:
+        numpy.seterr(**err)
+
+    changeCounts['unchanged'] = changeCounts['unchanged'] + int(numpy.count_nonzero(unchanged))
+
+    if fpSnapshot:
+        keys = mgiMap.column('key')
+        chromosomes = mgiMap.chromosomes
+        indexes = numpy.nonzero(unchanged)[0]
+        for start in range(0, len(indexes), batchSize):
+            chunk = indexes[start:start + batchSize]
+            for (key, chr, bp, cm) in zip(keys[chunk].tolist(), chrs[chunk].tolist(),
+                                          bps[chunk].tolist(), oldCms[chunk].tolist()):
+                if bp == mgimaplib.BP_NULL:
+                    bp = None
+                fpSnapshot.write('%d\t%s\t%s\t%s\n' % (key, chromosomes[chr], mgimaplib.bpString(bp), mgimaplib.cmString(cm)))
+
+    indexes = numpy.nonzero(~unchanged)[0].tolist()
+    uncommitted = 0
+
+    for start in range(0, len(indexes), batchSize):
+
+        batch = indexes[start:start + batchSize]
+        markers = [mgiMap.row(i) for i in batch]
+        writeOffsets(markers, [(str(float(newCms[i])),) for i in batch])
+
+        uncommitted = uncommitted + len(markers)
+        if commitSize and uncommitted >= commitSize:
+            commitBatch(markers[-1][3], markers[-1][0])
+            uncommitted = 0
+
+#
+# Purpose: Interpolates batches of markers
+# Returns: generator of (markers, skipped, new map positions,
+#          map positions of the other SNP maps)
+#          (see markerBatches(), convertMarkers(), convertOtherMaps())
+#
+
+def convertedBatches(batches):
+
+    for (markers, skipped) in batches:
+        yield (markers, skipped, convertMarkers(markers), convertOtherMaps(markers))
+
+#
+# Purpose: Runs a generator of batches in its own thread
+# Returns: generator of the same batches, read from a queue of
+#          queueSize batches
+# Assumes: Nothing
+# Effects: starts the thread; an exception in the thread is raised
+#          again by the returned generator; when the returned generator
+#          ends or is closed (e.g. the writer failed), the thread is
+#          stopped and waited for
+# Throws: whatever batches throws
+#
+# Args:
+#   batches   generator of batches
+#   name      thread name (its profile, see loadmetrics.profileHelper())
+#
+
+def threadedBatches(batches, name):
+
+    queue = Queue.Queue(queueSize)
+
+    # set when the consumer is done: the thread stops producing
+    stop = threading.Event()
+
+    # (batch, None), (None, exception info) or (None, None) at the end
+    # returns False if the consumer is done
+
+    def put(item):
+        while not stop.isSet():
+            try:
+                queue.put(item, True, 1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            try:
+                for batch in batches:
+                    if not put((batch, None)):
+                        return
+                put((None, None))
+            except:
+                put((None, sys.exc_info()))
+        finally:
+            batches.close()
+
+    thread = threading.Thread(target = loadmetrics.profileHelper, args = (name, produce), name = name)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while 1:
+            (batch, error) = queue.get()
+            if error:
+                raise error[0], error[1], error[2]
+            if batch is None:
+                break
+            yield batch
+    finally:
+        stop.set()
+        thread.join()
+
+#
+# Purpose: Lets the threads share this process's database connection
+# Returns: the function that restores db.sql() and db.commit()
+# Assumes: Nothing
+# Effects: db.sql() and db.commit() run one call at a time
+# Throws: Nothing
+#
+
+def lockDatabase():
+
+    lock = threading.RLock()
+    (sql, commit) = (db.sql, db.commit)
+
+    def locked(function):
+        def call(*args, **kwargs):
+            lock.acquire()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                lock.release()
+        return call
+
+    db.sql = locked(sql)
+    db.commit = locked(commit)
+
+    def unlockDatabase():
+        db.sql = sql
+        db.commit = commit
+
+    return unlockDatabase
+
+#
+# Purpose: Generate the map by interpolating
+#          the SNP map and the MGI map.
+# Returns: 0
+# Assumes: Nothing
+# Effects: updates MRK_Marker.cmOffset
+# Throws: Nothing
+#
+def genMap():
+
+    if convertPool:
+        return genMapParallel()
+
+    for c in ('unchanged', 'changed', 'newly syntenic', 'newly placed'):
+        changeCounts[c] = 0
+
+    if updateMode == 'bulk' and not dryRun:
+        startBulkUpdate()
+
+    #
+    # for each marker found in mgd...
+    # interpolate and write convertBatchSize markers at a time
+    # (commitSize at a time, if smaller, so that each commit
+    # falls on a batch)
+    #
+    # threaded: read -> interpolate -> write, each in its own thread
+    #
+
+    batchSize = convertBatchSize
+    if commitSize:
+        batchSize = min(convertBatchSize, commitSize)
+
+    if isColumnar():
+        convertColumns(batchSize)
+    else:
+        if threaded:
+            unlockDatabase = lockDatabase()
+            readBatches = threadedBatches(markerBatches(batchSize), 'markerBatches')
+            batches = threadedBatches(convertedBatches(readBatches), 'convertedBatches')
+        else:
+            batches = convertedBatches(markerBatches(batchSize))
+
+        uncommitted = 0
+
+        try:
+            for (markers, skipped, newCms, otherCms) in batches:
+
+                for row in skipped:
+                    (markerKey, symbol, accid, chr, bp, oldCm) = row[:6]
+                    fpSnapshot.write(string.join([markerKey, chr, bp, oldCm], TAB) + CRT)
+
+                writeOffsets(markers, newCms)
+                writeOtherMaps(markers, otherCms)
+
+                uncommitted = uncommitted + len(markers)
+                if commitSize and uncommitted >= commitSize:
+                    commitBatch(markers[-1][3], markers[-1][0])
+                    uncommitted = 0
+        finally:
+            # stop the threads (if the writer failed), then unlock
+            if threaded:
+                batches.close()
+                readBatches.close()
+                unlockDatabase()
+
+    for c in ('unchanged', 'changed', 'newly syntenic', 'newly placed'):
+        print 'cmOffset %s: %d' % (c, changeCounts[c])
+
+    if dryRun:
+        return writeReport()
+
+    if updateMode == 'bulk':
+        if finishBulkUpdate() != 0:
+            return 1
+    elif updateMode == 'row' and commitSize:
+        db.commit()
+
+    printCommitted()
+    saveSnapshot()
+    removeCheckpoint()
 
     return 0
 
@@ -381,17 +2084,20 @@ def genMap():
 #  MAIN
 #
 
-if initialize() != 0:
-    sys.exit(1)
+if __name__ == '__main__':
 
-if openFiles() != 0:
-    sys.exit(1)
+    loadmetrics.start('makeGenMapFile', db)
 
-if genMap() != 0:
-    closeFiles()
-    sys.exit(1)
+    if loadmetrics.run('initialize', initialize) != 0:
+        sys.exit(1)
+
+    if loadmetrics.run('openFiles', openFiles) != 0:
+        sys.exit(1)
 
-closeFiles()
+    if loadmetrics.run('genMap', genMap) != 0:
+        closeFiles()
+        sys.exit(1)
 
-sys.exit(0)
+    closeFiles()
 
+    sys.exit(0)
@@ -10,7 +10,9 @@
 #
 #  Usage:
 #
-#      makeGenMapFile.sh
+#      makeGenMapFile.sh [-n|--dry-run]
+#
+#      the options are passed to makeGenMapFile.py
 #
 #  Env Vars:
 #
@@ -67,7 +69,7 @@ LOG=${LOG_DIAG}
 echo "" >> ${LOG}
 date >> ${LOG}
 echo "Create the genetic map file (makeGenMapFile.sh)" | tee -a ${LOG}
-./makeGenMapFile.py 2>&1 >> ${LOG}
+./makeGenMapFile.py "$@" 2>&1 >> ${LOG}
 STAT=$?
 if [ ${STAT} -ne 0 ]
 then
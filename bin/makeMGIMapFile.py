@@ -18,6 +18,8 @@
 #      file that is sourced by the wrapper script:
 #
 #          MGI_MAP_FILE
+#          MGI_MAP_FORMAT (text|binary, default text)
+#          MGI_MAP_BINARY_FILE (required if MGI_MAP_FORMAT=binary)
 #
 #  Inputs:
 #
@@ -35,6 +37,17 @@
 #        4) Chromosome
 #        5) bp (basepair)
 #           build 37 genome hasOffsetinate (start hasOffsetinate)
+#        6) current cM offset (MRK_Marker.cmOffset)
+#
+#      - MGI map file, binary ($MGI_MAP_BINARY_FILE),
+#        instead of $MGI_MAP_FILE if MGI_MAP_FORMAT=binary
+#        the same fields as typed columns (see mgimaplib.py)
+#
+#      - metrics file ($LOGDIR/makeMGIMapFile.metrics.json)
+#        (see loadmetrics.py)
+#
+#      - profiles ($LOGDIR/makeMGIMapFile.<stage>.prof, $LOGDIR/makeMGIMapFile.profile.txt)
+#        GENMAP_PROFILE=yes only (see loadmetrics.py)
 #
 #  Exit Codes:
 #
@@ -53,7 +66,11 @@
 #      4) Write each MGI ID to the map file.
 #      5) Close files.
 #
-#  Notes:  None
+#  Notes:
+#
+#      iterMap() returns the map rows as a generator so that
+#      makeGenMapFile.py can consume them in-process (GENMAP_PIPELINE=yes)
+#      without the round trip through $MGI_MAP_FILE.
 #
 #  03/10/2011	lec
 #	- TR10622/ignore DNA-MIT markers (symbol like 'd%mit%')
@@ -65,11 +82,19 @@
 
 import sys 
 import os
+import string
 import db
+import loadlib
+import loadmetrics
+import mgimaplib
 
 # file name MGI_MAP_FILE
 mgiMapFile = None
 
+# export format (MGI_MAP_FORMAT), file name MGI_MAP_BINARY_FILE
+mgiMapFormat = 'text'
+mgiMapBinaryFile = None
+
 # file pointer
 fpMap = None
 
@@ -77,6 +102,9 @@ fpMap = None
 user = None
 passwordFile = None
 
+TAB = '\t'
+CRT = '\n'
+
 #
 # markers not "UN"
 # markers that are official/interim
@@ -101,11 +129,14 @@ updateSQL = '''update MRK_Offset o
 #
 def initialize():
     global mgiMapFile
+    global mgiMapFormat, mgiMapBinaryFile
     global fpMap
     global user
     global passwordFile
 
     mgiMapFile = os.getenv('MGI_MAP_FILE')
+    mgiMapFormat = os.getenv('MGI_MAP_FORMAT', 'text')
+    mgiMapBinaryFile = os.getenv('MGI_MAP_BINARY_FILE')
     user = os.getenv('MGD_DBUSER')
     passwordFile = os.getenv('MGD_DBPASSWORDFILE')
 
@@ -118,6 +149,14 @@ def initialize():
         print 'Environment variable not set: MGI_MAP_FILE'
         rc = 1
 
+    if mgiMapFormat not in ('text', 'binary'):
+        print 'Invalid MGI_MAP_FORMAT (text|binary): ' + mgiMapFormat
+        rc = 1
+
+    if mgiMapFormat == 'binary' and not mgiMapBinaryFile:
+        print 'Environment variable not set: MGI_MAP_BINARY_FILE'
+        rc = 1
+
     #
     # Initialize file pointers.
     #
@@ -142,6 +181,10 @@ def initialize():
 def openFiles():
     global fpMap
 
+    # the binary export is written by mgimaplib.writeMap()
+    if mgiMapFormat == 'binary':
+        return 0
+
     #
     # Open the association file.
     #
@@ -173,135 +216,145 @@ def closeFiles():
 #
 # Purpose: Query the database to get the MGI markers that have
 #          non-syntenic offsets (> 0) or basepair hasOffsetinates.
-# Returns: 1 if file does not exist or is not readable, else 0
+# Returns: generator of map records, one per marker (per coordinate):
+#          (marker key (int), symbol, MGI ID, chromosome,
+#           start coordinate or None, cmOffset or None)
 # Assumes: Nothing
-# Effects: Nothing
+# Effects: sets the offsets < -1 to -1 (unless readOnly)
 # Throws: Nothing
 #
-def getMap():
+# Args:
+#   readOnly  if true, nothing is updated; the offsets < -1 are
+#             returned as -1, as the update would have left them
+#             (makeGenMapFile.py --dry-run)
+#
+def iterRecords(readOnly = False):
 
     #
     # set any official/interim offsets = -1
     # if they are currently set to -999
     #
-    db.sql(updateSQL, None)
-    db.commit()
+    if not readOnly:
+        db.sql(updateSQL, None)
+        db.commit()
 
     #
     # Get all official/interim MGI markers
     # ignore DNA-MIT markers
     #
-
-    # note that this is the genetic chromosome we add to #markers
-
-    db.sql('''select m._Marker_key, m.symbol, m.chromosome, a.accid
-	      into temp markers
-	      from MRK_Marker m, ACC_Accession a
-	      where m._Organism_key = 1
-              and m._Marker_Status_key = 1
-	      and m.chromosome not in ('UN')
-	      and lower(m.symbol) not like 'd%mit%'
-              and m._Marker_key = a._Object_key
-              and a._MGIType_key = 2
-              and a._LogicalDB_key = 1
-              and a.preferred = 1
-	      and a.prefixPart = 'MGI:'
-	      ''', None)
-
-    db.sql('create index markers_idx1 on markers(_Marker_key)', None)
-
+    # and the genome coordinate of each marker, in one query:
     #
-    # copied from mrkcacheload/mrklocation.py
+    #   coordinates come from MAP_Coord_Feature first, then from the
+    #   marker's sequences (SEQ_Marker_Cache/SEQ_Coord_Cache);
+    #   one coordinate per marker: the first source, then the lowest
+    #   start coordinate (copied from mrkcacheload/mrklocation.py)
     #
-
-    hasOffset = {}
-
-    genomicChromosome = {}	# maps from marker key to genetic chromosome
-
+    #   if the genetic chromosome (markers.chromosome) and genomic
+    #   chromosome (coords.chromosome) disagree, then we do not want to
+    #   generate a cM offset, so no coordinate is returned
     #
-    # offsets for Marker with MAP_Coord_Feature
+    # the result is read through a server-side cursor,
+    # loadlib.fetchSize rows at a time
     #
 
-    results = db.sql('''select distinct m._Marker_key,
-			f.startCoordinate,
-			c.chromosome
-		from markers m, MAP_Coord_Feature f, MAP_Coordinate mc,
+    results = loadlib.fetchRows('mapRows', '''with markers as (
+		select m._Marker_key, m.symbol, m.chromosome, m.cmOffset, a.accid
+		from MRK_Marker m, ACC_Accession a
+		where m._Organism_key = 1
+		and m._Marker_Status_key = 1
+		and m.chromosome not in ('UN')
+		and lower(m.symbol) not like 'd%mit%'
+		and m._Marker_key = a._Object_key
+		and a._MGIType_key = 2
+		and a._LogicalDB_key = 1
+		and a.preferred = 1
+		and a.prefixPart = 'MGI:'
+		),
+		coords as (
+		select distinct on (_Marker_key) _Marker_key, startCoordinate, chromosome
+		from (
+		    select m._Marker_key, f.startCoordinate, c.chromosome, 1 as priority
+		    from markers m, MAP_Coord_Feature f, MAP_Coordinate mc,
 			MRK_Chromosome c
-		where m._Marker_key = f._Object_key 
-		and f._MGIType_key = 2 
-		and f._Map_key = mc._Map_key
-		and mc._Object_key = c._Chromosome_key
-		and mc._MGIType_key = 27	-- chromosome
-		''', 'auto')
-    for r in results:
-        key = r['_Marker_key']
-        value = r['startCoordinate']
-
-        if not hasOffset.has_key(key):
-            hasOffset[key] = []
-            hasOffset[key].append(value)
-	    genomicChromosome[key] = r['chromosome']
+		    where m._Marker_key = f._Object_key
+		    and f._MGIType_key = 2
+		    and f._Map_key = mc._Map_key
+		    and mc._Object_key = c._Chromosome_key
+		    and mc._MGIType_key = 27	-- chromosome
+		    union all
+		    select m._Marker_key, c.startCoordinate, c.chromosome, 2 as priority
+		    from markers m, SEQ_Marker_Cache mc, SEQ_Coord_Cache c
+		    where m._Marker_key = mc._Marker_key
+		    and mc._Qualifier_key = 615419
+		    and mc._Sequence_key = c._Sequence_key
+		    ) allCoords
+		order by _Marker_key, priority, startCoordinate
+		)
+		select m._Marker_key, m.symbol, m.accid, m.chromosome, m.cmOffset,
+		    case when c.chromosome = m.chromosome
+		    then c.startCoordinate else null end as startCoordinate
+		from markers m left outer join coords c
+		    on m._Marker_key = c._Marker_key
+		order by m._Marker_key
+		''')
 
     #
-    # offsets for Markers w/ Sequence 
+    # print out the marker/offsets
+    # the current cmOffset is printed so that makeGenMapFile.py
+    # only needs to update the markers whose offset has changed
     #
 
-    results = db.sql('''select distinct m._Marker_key,
-			c.startCoordinate,
-			c.chromosome
-		from markers m, SEQ_Marker_Cache mc, SEQ_Coord_Cache c
-		where m._Marker_key = mc._Marker_key 
-		and mc._Qualifier_key = 615419 
-		and mc._Sequence_key = c._Sequence_key
-		''', 'auto')
     for r in results:
-        key = r['_Marker_key']
-        value = r['startCoordinate']
 
-        # only one hasOffsetinate per marker
-        if not hasOffset.has_key(key):
-            hasOffset[key] = []
-            hasOffset[key].append(value)
-	    genomicChromosome[key] = r['chromosome']
+        loadmetrics.count('rowsRead')
 
-    #
-    # print out the marker/offsets
-    #
+	# change "X" to "20"
 
-    results = db.sql('select * from markers order by _Marker_key', 'auto')
+	chr = r['chromosome']
 
-    for r in results:
+	if chr == 'X':
+	    chr = '20'
 
-	key = r['_Marker_key']
+        cmOffset = r['cmOffset']
+        if readOnly and cmOffset is not None and cmOffset < -1:
+            cmOffset = -1.0
 
-	# change "X" to "20"
+        yield (r['_Marker_key'],
+               r['symbol'],
+               r['accid'],
+               chr,
+               r['startCoordinate'],
+               cmOffset)
 
-	chr = r['chromosome']
+#
+# Purpose: The map rows, as they are written to the map file
+# Returns: generator of (marker key, symbol, MGI ID, chromosome, bp, cmOffset),
+#          all as strings (see iterRecords())
+# Assumes: Nothing
+# Effects: see iterRecords()
+# Throws: Nothing
+#
+def iterMap(readOnly = False):
 
-	# if genetic and genomic chromosomes disagree, then we do not want to
-	# generate a cM offset
+    for (markerKey, symbol, accid, chr, bp, cmOffset) in iterRecords(readOnly):
+        yield (str(markerKey), symbol, accid, chr, str(bp), str(cmOffset))
 
-	chromosomeMismatch = False
-	if genomicChromosome.has_key(key):
-	    if genomicChromosome[key] != chr:
-		chromosomeMismatch = True
+#
+# Purpose: Write the MGI markers to the map file
+# Returns: 0
+# Assumes: Nothing
+# Effects: writes the map file
+# Throws: Nothing
+#
+def getMap():
 
-	if chr == 'X':
-	    chr = '20'
+    if mgiMapFormat == 'binary':
+        loadmetrics.count('rowsWritten', mgimaplib.writeMap(iterRecords(), mgiMapBinaryFile))
+        return 0
 
-	if hasOffset.has_key(key) and not chromosomeMismatch:
-	    for c in hasOffset[key]:
-                fpMap.write(str(r['_Marker_key']) + '\t' +
-                            r['symbol'] + '\t' +
-                            r['accid'] + '\t' +
-                            chr + '\t' +
-		            str(c) + '\n')
-	else:
-            fpMap.write(str(r['_Marker_key']) + '\t' +
-                        r['symbol'] + '\t' +
-                        r['accid'] + '\t' +
-                        chr + '\t' +
-		        'None' + '\n')
+    for row in iterMap():
+        fpMap.write(string.join(row, TAB) + CRT)
+        loadmetrics.count('rowsWritten')
 
     return 0
 
@@ -309,18 +362,22 @@ def getMap():
 #  MAIN
 #
 
-db.useOneConnection(1)
+if __name__ == '__main__':
 
-if initialize() != 0:
-    sys.exit(1)
+    db.useOneConnection(1)
 
-if openFiles() != 0:
-    sys.exit(1)
+    loadmetrics.start('makeMGIMapFile', db)
 
-if getMap() != 0:
-    closeFiles()
-    sys.exit(1)
+    if loadmetrics.run('initialize', initialize) != 0:
+        sys.exit(1)
+
+    if loadmetrics.run('openFiles', openFiles) != 0:
+        sys.exit(1)
 
-closeFiles()
-db.useOneConnection(0)
-sys.exit(0)
+    if loadmetrics.run('getMap', getMap) != 0:
+        closeFiles()
+        sys.exit(1)
+
+    closeFiles()
+    db.useOneConnection(0)
+    sys.exit(0)
@@ -0,0 +1,150 @@
+#!/usr/local/bin/python
+#
+#  mergeMetrics.py
+###########################################################################
+#
+#  Purpose:
+#
+#      This script will merge the metrics files of the Python stages
+#      of one genmapload run (see loadmetrics.py) and the timings of the
+#      shell stages into one run summary.
+#
+#  Usage:
+#
+#      mergeMetrics.py [-r start] [-s stage:start:end:status]...
+#
+#      -r start                  start time of the run (seconds since epoch)
+#      -s stage:start:end:status a stage run by the wrapper script
+#                                (e.g. the marker location cache refresh),
+#                                with its start/end times (seconds since
+#                                epoch) and exit status
+#
+#  Env Vars:
+#
+#      The following environment variables are set by the configuration
+#      file that is sourced by the wrapper script:
+#
+#          LOGDIR
+#          GENMAP_METRICS_FILE
+#
+#  Inputs:
+#
+#      - metrics files of the Python stages (${LOGDIR}/*.metrics.json)
+#
+#  Outputs:
+#
+#      - run summary ($GENMAP_METRICS_FILE):
+#
+#        {"started": ..., "finished": ..., "elapsed": ...,
+#         "stages": [{"script": ..., "stage": ..., "elapsed": ...,
+#                     "rowsRead": ..., "rowsWritten": ..., "rowsUpdated": ...,
+#                     "dbRoundTrips": ..., "peakRssKb": ...}, ...],
+#         "totals": {"rowsRead": ..., "rowsWritten": ..., "rowsUpdated": ...,
+#                    "dbRoundTrips": ..., "peakRssKb": ...}}
+#
+#        the stages are in the order they were started
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  An exception occurred
+#
+#  Assumes:  Nothing
+#
+#  Implementation:
+#
+#      This script will perform following steps:
+#
+#      1) Read the metrics files.
+#      2) Add the wrapper script's stages.
+#      3) Write the run summary.
+#
+#  Notes:  None
+#
+###########################################################################
+
+import sys
+import os
+import getopt
+import glob
+import time
+import json
+
+COUNTERS = ('rowsRead', 'rowsWritten', 'rowsUpdated', 'dbRoundTrips')
+
+#
+#  MAIN
+#
+
+try:
+    (opts, args) = getopt.getopt(sys.argv[1:], 'r:s:')
+except getopt.GetoptError:
+    print 'Usage: mergeMetrics.py [-r start] [-s stage:start:end:status]...'
+    sys.exit(1)
+
+logDir = os.getenv('LOGDIR')
+summaryFile = os.getenv('GENMAP_METRICS_FILE')
+
+if not logDir or not summaryFile:
+    print 'Environment variable not set: LOGDIR/GENMAP_METRICS_FILE'
+    sys.exit(1)
+
+runStart = None
+stages = []
+
+for (opt, value) in opts:
+    if opt == '-r':
+        runStart = float(value)
+    elif opt == '-s':
+        (stage, start, end, status) = value.split(':')
+        stages.append({'script' : 'genmapload.sh',
+                       'stage' : stage,
+                       'start' : float(start),
+                       'elapsed' : float(end) - float(start),
+                       'status' : int(status)})
+
+for fileName in glob.glob(os.path.join(logDir, '*.metrics.json')):
+
+    if os.path.abspath(fileName) == os.path.abspath(summaryFile):
+        continue
+
+    try:
+        fp = open(fileName, 'r')
+        metrics = json.load(fp)
+        fp.close()
+    except (IOError, ValueError), e:
+        print 'Cannot read metrics file: ' + fileName + ': ' + str(e)
+        continue
+
+    for s in metrics['stages']:
+        s['script'] = metrics['script']
+        stages.append(s)
+
+stages.sort(lambda x, y: cmp(x['start'], y['start']))
+
+totals = {}
+for c in COUNTERS:
+    totals[c] = sum([s.get(c, 0) for s in stages])
+totals['peakRssKb'] = max([s.get('peakRssKb', 0) for s in stages] + [0])
+
+finished = time.time()
+if runStart is None and stages:
+    runStart = stages[0]['start']
+
+summary = {
+    'started' : runStart,
+    'finished' : finished,
+    'elapsed' : runStart and finished - runStart,
+    'stages' : stages,
+    'totals' : totals,
+    }
+
+try:
+    fp = open(summaryFile, 'w')
+    json.dump(summary, fp, indent = 2, sort_keys = True)
+    fp.close()
+except IOError, e:
+    print 'Cannot write run summary: ' + summaryFile + ': ' + str(e)
+    sys.exit(1)
+
+sys.exit(0)
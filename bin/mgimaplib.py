@@ -0,0 +1,378 @@
+#
+#  mgimaplib.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Binary columnar format of the MGI map export
+#      (MGI_MAP_FORMAT=binary, $MGI_MAP_BINARY_FILE).
+#
+#      The text export ($MGI_MAP_FILE) holds every field as a string
+#      (with a literal 'None' for a missing bp) that makeGenMapFile.py
+#      has to split and parse again.  The binary export holds typed
+#      columns that the reader memory-maps:
+#
+#        bp       : int64   start coordinate (BP_NULL if none)
+#        cmOffset : float64 current MRK_Marker.cmOffset (NaN if null)
+#        key      : int32   marker key
+#        strings  : uint32  offsets of the symbol and MGI ID of each
+#                           marker in the string table (2 * n + 1)
+#        chr      : uint16  chromosome code (index into the chromosomes)
+#
+#  Usage:
+#
+#      import mgimaplib
+#
+#      n = mgimaplib.writeMap(records, mgiMapBinaryFile)
+#
+#      mgiMap = mgimaplib.readMap(mgiMapBinaryFile)
+#      for (markerKey, symbol, accid, chr, bp, cmOffset, position) in mgiMap.rows():
+#          ...
+#
+#      File layout (little-endian):
+#
+#        header     : magic (8s), number of markers (Q),
+#                     number of chromosomes (I), string table size (I)
+#        chromosomes: per chromosome: name (16s)
+#        (padding to 8 bytes)
+#        columns    : bp, cmOffset, key, strings, chr (see above)
+#        string table
+#
+#  Notes:
+#
+#      numpy is optional.  If it is available, the columns are zero-copy
+#      numpy views of the memory map; otherwise they are unpacked
+#      (struct) from it.
+#
+###########################################################################
+
+import sys
+import os
+import array
+import mmap
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAP_MAGIC = 'GMMGI001'
+MAP_HEADER = '<8sQII'
+MAP_CHROMOSOME = '<16s'
+
+# bp of a marker without a coordinate
+BP_NULL = -2 ** 63
+
+# column name, struct/numpy type, values per marker (+ extra values)
+COLUMNS = (('bp', 'q', 1, 0),
+           ('cmOffset', 'd', 1, 0),
+           ('key', 'i', 1, 0),
+           ('strings', 'I', 2, 1),
+           ('chr', 'H', 1, 0))
+
+# number of rows unpacked at a time by MgiMap.rows()
+rowBatchSize = 10000
+
+# array typecode of the bp column (int64): Python 2 arrays have no 'q',
+# 'l' is 8 bytes on 64-bit Linux; else None (packed with struct)
+if array.array('l').itemsize == 8:
+    BP_TYPECODE = 'l'
+else:
+    BP_TYPECODE = None
+
+#
+# Purpose: Computes where each column starts
+# Returns: dictionary of column name -> (offset, number of values, type),
+#          offset of the string table
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def layout(n, nchr):
+
+    offset = struct.calcsize(MAP_HEADER) + struct.calcsize(MAP_CHROMOSOME) * nchr
+    offset = (offset + 7) & ~7
+
+    columns = {}
+
+    for (name, type, perMarker, extra) in COLUMNS:
+        count = perMarker * n + extra
+        columns[name] = (offset, count, type)
+        offset = offset + struct.calcsize('<' + type) * count
+
+    return (columns, offset)
+
+class MgiMap:
+    #
+    # MGI map export, memory-mapped
+    #
+
+    def __init__(self, mm, n, chromosomes, stringsSize):
+        self.mm = mm
+        self.n = n
+
+        # chromosome names, by chromosome code
+        self.chromosomes = chromosomes
+
+        (self.layout, self.stringsOffset) = layout(n, len(chromosomes))
+        self.stringsSize = stringsSize
+
+        # columns (built on demand)
+        # key = column name
+        # value = numpy view or tuple of values
+        self.columns = {}
+
+    def size(self):
+        return self.n
+
+    #
+    # Purpose: One column of the map
+    # Returns: numpy view of the memory map (no copy) if numpy is
+    #          available, else a tuple of values
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def column(self, name):
+
+        if not self.columns.has_key(name):
+            (offset, count, type) = self.layout[name]
+            if numpy:
+                self.columns[name] = numpy.frombuffer(self.mm, dtype = '<' + type, count = count, offset = offset)
+            else:
+                self.columns[name] = struct.unpack_from('<%d%s' % (count, type), self.mm, offset)
+
+        return self.columns[name]
+
+    def string(self, i):
+        offsets = self.column('strings')
+        return self.mm[self.stringsOffset + offsets[i]:self.stringsOffset + offsets[i + 1]]
+
+    #
+    # Purpose: One row of the map
+    # Returns: (marker key, symbol, MGI ID, chromosome, bp, cmOffset,
+    #          position) of marker i, as rows() gives it
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def row(self, i):
+
+        bp = int(self.column('bp')[i])
+        if bp == BP_NULL:
+            bp = None
+
+        return (str(int(self.column('key')[i])),
+                self.string(2 * i),
+                self.string(2 * i + 1),
+                self.chromosomes[int(self.column('chr')[i])],
+                bpString(bp),
+                cmString(float(self.column('cmOffset')[i])),
+                bp)
+
+    #
+    # Purpose: The map rows, in export (marker key) order
+    # Returns: generator of (marker key, symbol, MGI ID, chromosome, bp,
+    #          cmOffset, position):
+    #          the first six as strings, exactly as in the text export;
+    #          position is the bp as a number (None if no coordinate)
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def rows(self):
+
+        keys = self.column('key')
+        chrs = self.column('chr')
+        bps = self.column('bp')
+        cms = self.column('cmOffset')
+        offsets = self.column('strings')
+
+        for start in range(0, self.n, rowBatchSize):
+
+            end = min(start + rowBatchSize, self.n)
+
+            if numpy:
+                batch = zip(keys[start:end].tolist(), chrs[start:end].tolist(),
+                            bps[start:end].tolist(), cms[start:end].tolist())
+                strings = offsets[2 * start:2 * end + 1].tolist()
+            else:
+                batch = zip(keys[start:end], chrs[start:end], bps[start:end], cms[start:end])
+                strings = offsets[2 * start:2 * end + 1]
+
+            base = self.stringsOffset
+            j = 0
+            for (key, chr, bp, cm) in batch:
+
+                if bp == BP_NULL:
+                    bp = None
+
+                yield (str(key),
+                       self.mm[base + strings[j]:base + strings[j + 1]],
+                       self.mm[base + strings[j + 1]:base + strings[j + 2]],
+                       self.chromosomes[chr],
+                       bpString(bp),
+                       cmString(cm),
+                       bp)
+
+                j = j + 2
+
+#
+# Purpose: Formats a bp/cmOffset as the text export has it
+# Returns: string ('None' if there is no coordinate/offset)
+#
+def bpString(bp):
+
+    if bp is None:
+        return 'None'
+
+    return str(float(bp))
+
+def cmString(cm):
+
+    # null cmOffset is NaN
+    if cm is None or cm != cm:
+        return 'None'
+
+    return str(float(cm))
+
+#
+# Purpose: Writes the MGI map export
+# Returns: number of markers written
+# Assumes: Nothing
+# Effects: replaces fileName atomically
+#          (the file is written next to fileName, then renamed)
+# Throws: IOError, OSError
+#
+# Args:
+#   records   iterable of (marker key, symbol, MGI ID, chromosome,
+#             start coordinate or None, cmOffset or None)
+#   fileName  name of the export file
+#
+def writeMap(records, fileName):
+
+    # chromosome -> code
+    chrCodes = {}
+    chromosomes = []
+
+    keys = array.array('i')
+    chrs = array.array('H')
+    cms = array.array('d')
+    if BP_TYPECODE:
+        bps = array.array(BP_TYPECODE)
+    else:
+        bps = []
+    offsets = array.array('I', [0])
+    strings = []
+    stringsSize = 0
+
+    for (markerKey, symbol, accid, chr, bp, cmOffset) in records:
+
+        if not chrCodes.has_key(chr):
+            chrCodes[chr] = len(chromosomes)
+            chromosomes.append(chr)
+
+        keys.append(markerKey)
+        chrs.append(chrCodes[chr])
+
+        if bp is None:
+            bps.append(BP_NULL)
+        else:
+            bps.append(int(bp))
+
+        if cmOffset is None:
+            cms.append(float('nan'))
+        else:
+            cms.append(float(cmOffset))
+
+        for s in (symbol, accid):
+            strings.append(s)
+            stringsSize = stringsSize + len(s)
+            offsets.append(stringsSize)
+
+    n = len(keys)
+    (columns, stringsOffset) = layout(n, len(chromosomes))
+
+    tmpFile = '%s.%d.tmp' % (fileName, os.getpid())
+    fp = open(tmpFile, 'wb')
+
+    try:
+        fp.write(struct.pack(MAP_HEADER, MAP_MAGIC, n, len(chromosomes), stringsSize))
+        for chr in chromosomes:
+            fp.write(struct.pack(MAP_CHROMOSOME, chr))
+        fp.write('\0' * (columns['bp'][0] - fp.tell()))
+
+        if BP_TYPECODE:
+            arrays = (bps, cms, keys, offsets, chrs)
+        else:
+            for i in range(0, n, rowBatchSize):
+                chunk = bps[i:i + rowBatchSize]
+                fp.write(struct.pack('<%dq' % (len(chunk)), *chunk))
+            arrays = (cms, keys, offsets, chrs)
+
+        for a in arrays:
+            if sys.byteorder == 'big':
+                a.byteswap()
+            a.tofile(fp)
+
+        fp.write(''.join(strings))
+
+        fp.flush()
+        os.fsync(fp.fileno())
+        fp.close()
+        os.rename(tmpFile, fileName)
+    except:
+        fp.close()
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+        raise
+
+    return n
+
+#
+# Purpose: Reads the MGI map export
+# Returns: MgiMap, or None if the file is not an MGI map export
+# Assumes: Nothing
+# Effects: memory-maps fileName
+# Throws: IOError if the file cannot be opened
+#
+# Args:
+#   fileName  name of the export file
+#
+def readMap(fileName):
+
+    fp = open(fileName, 'rb')
+
+    try:
+        try:
+            mm = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+        except (mmap.error, ValueError):
+            return None
+    finally:
+        fp.close()
+
+    headerSize = struct.calcsize(MAP_HEADER)
+
+    if len(mm) < headerSize:
+        mm.close()
+        return None
+
+    (magic, n, nchr, stringsSize) = struct.unpack_from(MAP_HEADER, mm, 0)
+
+    if magic != MAP_MAGIC:
+        mm.close()
+        return None
+
+    (columns, stringsOffset) = layout(n, nchr)
+
+    if len(mm) < stringsOffset + stringsSize:
+        mm.close()
+        return None
+
+    chromosomes = []
+    for i in range(nchr):
+        (chr,) = struct.unpack_from(MAP_CHROMOSOME, mm, headerSize + struct.calcsize(MAP_CHROMOSOME) * i)
+        chromosomes.append(chr.rstrip('\0'))
+
+    return MgiMap(mm, n, chromosomes, stringsSize)
@@ -0,0 +1,255 @@
+#!/usr/local/bin/python
+#
+#  refreshLocations.py
+###########################################################################
+#
+#  Purpose:
+#
+#      This script will refresh the marker location cache after a load:
+#      only the markers whose MRK_Marker.cmOffset changed (the changed
+#      marker keys file written by makeGenMapFile.py), or all markers
+#      (${MRKCACHELOAD}/mrklocation.csh) if more than
+#      GENMAP_REFRESH_THRESHOLD markers changed.
+#
+#  Usage:
+#
+#      refreshLocations.py [changed marker keys file]
+#
+#      default: $GENMAP_CHANGED_KEYS_FILE
+#
+#  Env Vars:
+#
+#      The following environment variables are set by the configuration
+#      file that is sourced by the wrapper script:
+#
+#          GENMAP_CHANGED_KEYS_FILE (optional)
+#          GENMAP_REFRESH_THRESHOLD (default 5000)
+#          MRKCACHELOAD
+#          MGD_DBUSER
+#          MGD_DBPASSWORDFILE
+#
+#  Inputs:
+#
+#      - changed marker keys file ($GENMAP_CHANGED_KEYS_FILE)
+#        one marker key per line
+#
+#  Outputs:
+#
+#      - the marker location cache of the changed markers
+#        (MRK_reloadLocation), or all of it (mrklocation.csh)
+#
+#      - metrics file ($LOGDIR/refreshLocations.metrics.json)
+#        (see loadmetrics.py)
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  An exception occurred
+#
+#  Assumes:  Nothing
+#
+#  Implementation:
+#
+#      This script will perform following steps:
+#
+#      1) Initialize variables.
+#      2) Read the changed marker keys file.
+#      3) if there is no changed marker keys file, or it has more than
+#         GENMAP_REFRESH_THRESHOLD markers, run mrklocation.csh;
+#         else stage the keys in a temp table (multi-row inserts) and
+#         reload the location of each of them with one select
+#         in one transaction
+#      4) Close files.
+#
+#  Notes:  None
+#
+###########################################################################
+
+import sys
+import os
+import subprocess
+import db
+import loadlib
+import loadmetrics
+
+# file name GENMAP_CHANGED_KEYS_FILE (or the file given on the command line)
+changedKeysFile = None
+
+# number of changed markers above which all markers are refreshed
+threshold = 5000
+
+# ${MRKCACHELOAD}/mrklocation.csh
+fullRefreshCommand = None
+
+# the changed marker keys (None if there is no changed marker keys file)
+markerKeys = None
+
+CRT = '\n'
+
+#
+# Purpose: Initialization
+# Returns: 1 if an environment variable is not set, else 0
+# Assumes: Nothing
+# Effects: sets the global variables
+# Throws: Nothing
+#
+def initialize():
+    global changedKeysFile, threshold, fullRefreshCommand
+
+    if len(sys.argv) > 1:
+        changedKeysFile = sys.argv[1]
+    else:
+        changedKeysFile = os.getenv('GENMAP_CHANGED_KEYS_FILE')
+
+    mrkCacheLoad = os.getenv('MRKCACHELOAD')
+
+    rc = 0
+
+    #
+    # Make sure the environment variables are set.
+    #
+    if not mrkCacheLoad:
+        print 'Environment variable not set: MRKCACHELOAD'
+        rc = 1
+    else:
+        fullRefreshCommand = os.path.join(mrkCacheLoad, 'mrklocation.csh')
+
+    try:
+        threshold = int(os.getenv('GENMAP_REFRESH_THRESHOLD', str(threshold)))
+    except ValueError:
+        print 'Invalid GENMAP_REFRESH_THRESHOLD: ' + os.getenv('GENMAP_REFRESH_THRESHOLD')
+        rc = 1
+
+    #
+    # Use one connection to the database
+    #
+    db.set_sqlUser(os.getenv('MGD_DBUSER'))
+    db.set_sqlPasswordFromFile(os.getenv('MGD_DBPASSWORDFILE'))
+    db.useOneConnection(1)
+
+    return rc
+
+#
+# Purpose: Reads the changed marker keys file
+# Returns: 1 if the file cannot be parsed, else 0
+#          (a missing file is not an error: all markers are refreshed)
+# Assumes: Nothing
+# Effects: sets markerKeys
+# Throws: Nothing
+#
+def openFiles():
+    global markerKeys
+
+    if not changedKeysFile:
+        return 0
+
+    try:
+        fp = open(changedKeysFile, 'r')
+    except IOError:
+        print 'Cannot open changed keys file: ' + changedKeysFile
+        return 0
+
+    keys = {}
+    lineNum = 0
+
+    for line in fp:
+
+        lineNum = lineNum + 1
+        loadmetrics.count('rowsRead')
+
+        try:
+            keys[int(line.rstrip(CRT))] = 1
+        except ValueError:
+            print 'Cannot parse changed keys file: %s: line %d' % (changedKeysFile, lineNum)
+            fp.close()
+            return 1
+
+    fp.close()
+
+    # (a resumed load may list a marker twice)
+    markerKeys = keys.keys()
+    markerKeys.sort()
+
+    return 0
+
+#
+# Purpose: Close files.
+# Returns: 0
+# Assumes: Nothing
+# Effects: closes the database connection
+# Throws: Nothing
+#
+def closeFiles():
+
+    db.useOneConnection(0)
+
+    return 0
+
+#
+# Purpose: Refreshes the marker location cache
+# Returns: 0, or the exit status of mrklocation.csh
+# Assumes: Nothing
+# Effects: reloads the location cache of the changed markers
+#          in one transaction, or runs mrklocation.csh
+# Throws: Nothing
+#
+def refresh():
+
+    if markerKeys is None:
+        print 'No changed marker keys; refresh all markers: ' + fullRefreshCommand
+        return fullRefresh()
+
+    if len(markerKeys) > threshold:
+        print '%d changed markers (GENMAP_REFRESH_THRESHOLD %d); refresh all markers: %s' % \
+              (len(markerKeys), threshold, fullRefreshCommand)
+        return fullRefresh()
+
+    print 'Refresh the location cache of %d changed markers' % (len(markerKeys))
+
+    if not markerKeys:
+        return 0
+
+    db.sql('create temp table changedKeys (_Marker_key int not null)', None)
+    loadlib.insertRows('changedKeys', [(key,) for key in markerKeys])
+
+    db.sql('select MRK_reloadLocation(_Marker_key) from changedKeys', None)
+
+    db.sql('drop table changedKeys', None)
+    db.commit()
+
+    loadmetrics.count('rowsUpdated', len(markerKeys))
+
+    return 0
+
+def fullRefresh():
+
+    sys.stdout.flush()
+
+    try:
+        return subprocess.call([fullRefreshCommand])
+    except OSError, e:
+        print 'Cannot run: ' + fullRefreshCommand + ': ' + str(e)
+        return 1
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+
+    loadmetrics.start('refreshLocations', db)
+
+    if loadmetrics.run('initialize', initialize) != 0:
+        sys.exit(1)
+
+    if loadmetrics.run('openFiles', openFiles) != 0:
+        closeFiles()
+        sys.exit(1)
+
+    if loadmetrics.run('refresh', refresh) != 0:
+        closeFiles()
+        sys.exit(1)
+
+    closeFiles()
+
+    sys.exit(0)
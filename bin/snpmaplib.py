@@ -0,0 +1,719 @@
+#
+#  snpmaplib.py
+###########################################################################
+#
+#  Purpose:
+#
+#      In-memory SNP/baseline map used to interpolate MGI marker
+#      genome coordinates to map offsets/cM positions.
+#
+#      Each chromosome is held as four typed arrays (array 'd') of
+#      the same length, one per column of the SNP map:
+#
+#        I_BP  : basepair coordinate
+#        I_FCM : female map coordinate
+#        I_MCM : male map coordinate
+#        I_ACM : sex-averaged map coordinate
+#
+#      This costs 8 bytes per value instead of one Python float per value
+#      (plus one tuple per SNP), so memory stays flat as the SNP map grows.
+#
+#  Usage:
+#
+#      import snpmaplib
+#
+#      snpMap = snpmaplib.readSnpMap(open(snpMapFile, 'r'))
+#      if snpMap.has_key(chr):
+#          cM = snpMap.convert(chr, bp)
+#
+#      All three maps can be computed from one interval search:
+#
+#          (fcM, mcM, acM) = snpMap.convertMulti(chr, bp)
+#
+#      and cM positions converted back to bp (reverse, reverseBatch)
+#      through an index over the cM column that collapses flat runs.
+#
+#      The parsed, validated map can be saved as a binary cache file
+#      (writeCache) that later runs memory-map (readCache) instead of
+#      parsing the CSV again.  The cache is keyed by the checksum of the
+#      SNP map file it was built from.
+#
+#      Cache file layout (little-endian):
+#
+#        header   : magic (8s), checksum (32s), number of chromosomes (I)
+#        directory: per chromosome: name (16s), number of SNPs (Q),
+#                   offset of its bp column (Q)
+#        data     : per chromosome: bp, fcM, mcM, acM columns,
+#                   each number of SNPs float64 values
+#
+#  Notes:
+#
+#      numpy is optional.  If it is available, convertBatch() interpolates
+#      a whole list of positions with one searchsorted over zero-copy
+#      numpy views of the arrays, and the cache columns are used directly
+#      from the memory map; otherwise convertBatch() calls convert() for
+#      each position and the cache columns are copied into arrays.
+#
+###########################################################################
+
+import sys
+import os
+import array
+import mmap
+import struct
+import hashlib
+import bisect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+I_BP = 0	# basepair coordinate
+I_FCM = 1	# female map coordinate
+I_MCM = 2	# male map coordinate
+I_ACM = 3	# sex-averaged map coordinate
+
+COMMA = ','
+
+CACHE_MAGIC = 'GMSNP001'
+CACHE_HEADER = '<8s32sI'
+CACHE_ENTRY = '<16sQQ'
+
+class SnpMap:
+    #
+    # SNP map, by chromosome
+    #
+
+    def __init__(self):
+        # key = chromosome
+        # value = [bp array, fcM array, mcM array, acM array]
+        self.maps = {}
+
+        # numpy views of self.maps (built on demand)
+        # key = chromosome
+        # value = [bp view, fcM view, mcM view, acM view]
+        self.views = {}
+
+        # memory map of the cache file the columns were read from (if any)
+        self.mmap = None
+
+        # reverse (cM->bp) indexes (built on demand, see reverseIndex())
+        # key = (chromosome, cM column)
+        # value = (cM knots, bp start of each knot, bp end of each knot)
+        self.reverseIndexes = {}
+
+    #
+    # Purpose: Adds one SNP to the end of a chromosome
+    # Returns: Nothing
+    # Assumes: SNPs are added in bp order
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def append(self, chr, bp, fcM, mcM, acM):
+
+        if not self.maps.has_key(chr):
+            self.maps[chr] = [array.array('d'), array.array('d'),
+                              array.array('d'), array.array('d')]
+
+        columns = self.maps[chr]
+        columns[I_BP].append(bp)
+        columns[I_FCM].append(fcM)
+        columns[I_MCM].append(mcM)
+        columns[I_ACM].append(acM)
+
+        self.forget(chr)
+
+    #
+    # Purpose: Sets all of the columns of a chromosome
+    # Returns: Nothing
+    # Assumes: columns are the same length and in bp order
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def setColumns(self, chr, columns):
+
+        self.maps[chr] = columns
+
+        self.forget(chr)
+
+    #
+    # Purpose: Drops the views and reverse indexes of a chromosome
+    #          whose columns have changed
+    #
+    def forget(self, chr):
+
+        if self.views.has_key(chr):
+            del self.views[chr]
+
+        for index in (I_FCM, I_MCM, I_ACM):
+            if self.reverseIndexes.has_key((chr, index)):
+                del self.reverseIndexes[(chr, index)]
+
+    def has_key(self, chr):
+        return self.maps.has_key(chr)
+
+    def chromosomes(self):
+        return self.maps.keys()
+
+    #
+    # Purpose: Number of SNPs on a chromosome
+    #
+    def size(self, chr):
+        return len(self.maps[chr][I_BP])
+
+    #
+    # Purpose: One column of a chromosome (I_BP, I_FCM, I_MCM, I_ACM)
+    # Returns: array of float
+    #
+    def column(self, chr, index):
+        return self.maps[chr][index]
+
+    #
+    # Purpose: One value of a chromosome
+    # Returns: float
+    #
+    def value(self, chr, i, index):
+        return self.maps[chr][index][i]
+
+    #
+    # Purpose: One SNP of a chromosome
+    # Returns: (bp, fcM, mcM, acM)
+    #
+    def row(self, chr, i):
+        columns = self.maps[chr]
+        return (columns[I_BP][i], columns[I_FCM][i],
+                columns[I_MCM][i], columns[I_ACM][i])
+
+    #
+    # Purpose: numpy view of one column of a chromosome (no copy)
+    # Returns: float64 numpy array
+    # Assumes: numpy is available
+    #
+    def view(self, chr, index):
+
+        if not self.views.has_key(chr):
+            self.views[chr] = [numpy.frombuffer(c, dtype = numpy.float64)
+                               if isinstance(c, array.array) else c
+                               for c in self.maps[chr]]
+
+        return self.views[chr][index]
+
+    #
+    # Purpose: Performs a binary search of the SNP (by position)
+    # Returns: the SNP interval containing the given position
+    #    imax is an index within the chromosome
+    #    the position argument (pos) is in the interval defined by the SNP
+    #    at imax and the one at imax+1.
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    # Args:
+    #   chr         (string) chromosome
+    #   pos         (numeric) The position to locate.
+    #   fromCoord   (integer) The column number in the SNP table to search in.
+    #
+    def bsearch(self, chr, pos, fromCoord):
+
+        s = self.maps[chr][fromCoord]
+        imin = 0
+        imax = len(s) - 1
+
+        # binary seach loop
+
+        while imin <= imax:
+
+            # check the middle item
+            imid = (imin + imax)/2
+            ival = s[imid]
+
+            if pos > ival:
+                # too big, check second  half of list
+                imin = imid + 1
+
+            elif pos <= ival:
+                # too little, check first half of list
+                imax = imid - 1
+
+        return imax
+
+    #
+    # Purpose: Converts (via interpolation) one type of coordinate to another
+    # Returns: the new map position
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    # Args:
+    #   chr       (string) chromosome ('1' - '20')
+    #   pos       (numeric) position to convert
+    #   fromCoord (integer) column in which to search for pos
+    #   toCoord   (integer) column to interpolate to get answer
+    #
+    def convert(self, chr, pos, fromCoord = I_BP, toCoord = I_ACM):
+
+        i = self.bsearch(chr, pos, fromCoord)
+
+        return self.interpolate(chr, i, pos, fromCoord, toCoord)
+
+    #
+    # Purpose: Converts one position to several types of coordinate
+    #          with one binary search
+    # Returns: tuple of new map positions, one per toCoords
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    # Args:
+    #   chr       (string) chromosome ('1' - '20')
+    #   pos       (numeric) position to convert
+    #   fromCoord (integer) column in which to search for pos
+    #   toCoords  (list of integer) columns to interpolate
+    #             (default female, male and sex-averaged map)
+    #
+    def convertMulti(self, chr, pos, fromCoord = I_BP, toCoords = (I_FCM, I_MCM, I_ACM)):
+
+        i = self.bsearch(chr, pos, fromCoord)
+
+        return tuple([self.interpolate(chr, i, pos, fromCoord, toCoord) for toCoord in toCoords])
+
+    #
+    # Purpose: Interpolates one position within the SNP interval i
+    #          found by bsearch()
+    # Returns: the new map position
+    #
+    def interpolate(self, chr, i, pos, fromCoord, toCoord):
+
+        fromS = self.maps[chr][fromCoord]
+        toS = self.maps[chr][toCoord]
+
+        if i == len(fromS) - 1:
+            x = float(toS[i])
+            y = float(fromS[i])
+            pos = float(pos)
+            pos2 = float(pos * x)/y
+
+            if toCoord == I_BP:
+                pos2 = int(pos2)
+        else:
+
+            from1 = float(fromS[i])
+            from2 = float(fromS[i+1])
+            f = float(pos - from1)/(from2 - from1)
+            to1 = float(toS[i])
+            to2 = float(toS[i+1])
+            pos2 = to1 + f*(to2-to1)
+            if toCoord == I_BP:
+                pos2 = int(pos2)
+
+        return pos2
+
+    #
+    # Purpose: Converts (via interpolation) a list of positions on one
+    #          chromosome from one type of coordinate to another
+    # Returns: list of new map positions, in the same order as positions
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    # Gives exactly the same answers as calling convert() for each position,
+    # including the proportional extrapolation past the last SNP and the
+    # wrap-around to the last SNP (s[-1]) for positions at or before the
+    # first.  Uses a single searchsorted when numpy is available.
+    #
+    # Args:
+    #   chr       (string) chromosome ('1' - '20')
+    #   positions list of (numeric) positions to convert
+    #   fromCoord (integer) column in which to search for pos
+    #   toCoord   (integer) column to interpolate to get answer
+    #
+    def convertBatch(self, chr, positions, fromCoord = I_BP, toCoord = I_ACM):
+
+        return self.convertBatchMulti(chr, positions, fromCoord, (toCoord,))[0]
+
+    #
+    # Purpose: Converts a list of positions on one chromosome to several
+    #          types of coordinate, locating each position's SNP interval once
+    # Returns: list of lists of new map positions: one list per toCoords,
+    #          each in the same order as positions
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    # Each list is the same as convertBatch() gives for its toCoord.
+    #
+    # Args:
+    #   chr       (string) chromosome ('1' - '20')
+    #   positions list of (numeric) positions to convert
+    #   fromCoord (integer) column in which to search for pos
+    #   toCoords  (list of integer) columns to interpolate
+    #             (default female, male and sex-averaged map)
+    #   asArrays  if true (and numpy is available), return one numpy
+    #             float64 array per toCoords instead of lists
+    #             (positions may then be a numpy array, e.g. a column
+    #             of the binary MGI map, see mgimaplib.py)
+    #
+    def convertBatchMulti(self, chr, positions, fromCoord = I_BP, toCoords = (I_FCM, I_MCM, I_ACM), asArrays = False):
+
+        if not numpy:
+            results = [[] for toCoord in toCoords]
+            for pos in positions:
+                i = self.bsearch(chr, pos, fromCoord)
+                for j in range(len(toCoords)):
+                    results[j].append(self.interpolate(chr, i, pos, fromCoord, toCoords[j]))
+            return results
+
+        fromS = self.view(chr, fromCoord)
+        n = len(fromS)
+        pos = numpy.asarray(positions, dtype = numpy.float64)
+
+        # same interval as bsearch(): last SNP strictly below pos
+        i = numpy.searchsorted(fromS, pos, side = 'left') - 1
+        last = (i == n - 1)
+
+        # i == -1 picks up the last SNP, as s[i] does in convert()
+        lo = i % n
+        hi = numpy.minimum(i + 1, n - 1)
+
+        from1 = fromS[lo]
+        from2 = fromS[hi]
+
+        results = []
+
+        # same operation order as convert() so the results are bit-identical
+        err = numpy.seterr(divide = 'ignore', invalid = 'ignore')
+        try:
+            f = (pos - from1) / (from2 - from1)
+
+            for toCoord in toCoords:
+                toS = self.view(chr, toCoord)
+                to1 = toS[lo]
+                to2 = toS[hi]
+                pos2 = numpy.where(last, (pos * to1) / from1, to1 + f * (to2 - to1))
+
+                if asArrays:
+                    results.append(pos2)
+                elif toCoord == I_BP:
+                    results.append([int(p) for p in pos2.tolist()])
+                else:
+                    results.append(pos2.tolist())
+        finally:
+            numpy.seterr(**err)
+
+        return results
+
+    #
+    # Purpose: Index of a cM column for the reverse (cM->bp) conversion
+    # Returns: (knots, starts, ends): the distinct cM values of the column,
+    #          in order, and the bp of the first and last SNP at each value
+    # Assumes: Nothing
+    # Effects: builds the index the first time it is asked for
+    # Throws: ValueError if the cM column goes down
+    #
+    # The cM columns are only non-strictly increasing: runs of SNPs share
+    # the same cM.  Searching the raw column would land on an arbitrary
+    # end of a run; collapsing each run into one knot keeps the bp range
+    # that the run covers.
+    #
+    # Args:
+    #   chr       (string) chromosome ('1' - '20')
+    #   fromCoord (integer) cM column (I_FCM, I_MCM, I_ACM)
+    #
+    def reverseIndex(self, chr, fromCoord = I_ACM):
+
+        key = (chr, fromCoord)
+
+        if self.reverseIndexes.has_key(key):
+            return self.reverseIndexes[key]
+
+        if numpy:
+            cms = self.view(chr, fromCoord)
+            bps = self.view(chr, I_BP)
+            steps = numpy.diff(cms)
+            down = numpy.flatnonzero(steps < 0)
+            if len(down):
+                raise ValueError('chromosome %s cM column %d goes down at SNP %d' % (chr, fromCoord, down[0] + 2))
+            change = numpy.flatnonzero(steps != 0)
+            first = numpy.concatenate(([0], change + 1))
+            last = numpy.concatenate((change, [len(cms) - 1]))
+            index = (cms[first], bps[first], bps[last])
+        else:
+            cms = self.maps[chr][fromCoord]
+            bps = self.maps[chr][I_BP]
+            knots = array.array('d')
+            starts = array.array('d')
+            ends = array.array('d')
+            for i in range(len(cms)):
+                if knots and cms[i] == knots[-1]:
+                    ends[-1] = bps[i]
+                elif knots and cms[i] < knots[-1]:
+                    raise ValueError('chromosome %s cM column %d goes down at SNP %d' % (chr, fromCoord, i + 1))
+                else:
+                    knots.append(cms[i])
+                    starts.append(bps[i])
+                    ends.append(bps[i])
+            index = (knots, starts, ends)
+
+        self.reverseIndexes[key] = index
+
+        return index
+
+    #
+    # Purpose: Converts (via interpolation) a cM position to bp
+    # Returns: the bp (int)
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: ValueError (see reverseIndex())
+    #
+    #   a cM shared by a run of SNPs:  the middle of the run
+    #   between two cM values:         interpolated between the last SNP
+    #                                  of the lower value and the first
+    #                                  SNP of the higher one
+    #   past the last cM:              extrapolated, as convert() does
+    #   before the first cM:           the first SNP
+    #
+    # Args:
+    #   chr       (string) chromosome ('1' - '20')
+    #   cM        (numeric) position to convert
+    #   fromCoord (integer) cM column (I_FCM, I_MCM, I_ACM)
+    #
+    def reverse(self, chr, cM, fromCoord = I_ACM):
+
+        (knots, starts, ends) = self.reverseIndex(chr, fromCoord)
+        cM = float(cM)
+        j = bisect.bisect_left(knots, cM)
+
+        if j < len(knots) and knots[j] == cM:
+            bp = (starts[j] + ends[j]) / 2
+        elif j == 0:
+            bp = starts[0]
+        elif j == len(knots):
+            bp = (cM * ends[j - 1]) / knots[j - 1]
+        else:
+            k = j - 1
+            f = (cM - knots[k]) / (knots[j] - knots[k])
+            bp = ends[k] + f * (starts[j] - ends[k])
+
+        return int(bp)
+
+    #
+    # Purpose: Converts a list of cM positions on one chromosome to bp
+    # Returns: list of bp (int), in the same order as cMs
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: ValueError (see reverseIndex())
+    #
+    # Gives exactly the same answers as calling reverse() for each position.
+    # Uses a single searchsorted when numpy is available.
+    #
+    def reverseBatch(self, chr, cMs, fromCoord = I_ACM):
+
+        if not numpy:
+            return [self.reverse(chr, cM, fromCoord) for cM in cMs]
+
+        (knots, starts, ends) = self.reverseIndex(chr, fromCoord)
+        n = len(knots)
+        cM = numpy.asarray(cMs, dtype = numpy.float64)
+
+        j = numpy.searchsorted(knots, cM, side = 'left')
+        jc = numpy.minimum(j, n - 1)
+        k = numpy.maximum(j - 1, 0)
+
+        exact = (j < n) & (knots[jc] == cM)
+
+        err = numpy.seterr(divide = 'ignore', invalid = 'ignore')
+        try:
+            f = (cM - knots[k]) / (knots[jc] - knots[k])
+            bp = numpy.where(exact, (starts[jc] + ends[jc]) / 2,
+                 numpy.where(j == 0, starts[0],
+                 numpy.where(j == n, (cM * ends[n - 1]) / knots[n - 1],
+                             ends[k] + f * (starts[jc] - ends[k]))))
+        finally:
+            numpy.seterr(**err)
+
+        return [int(p) for p in bp.tolist()]
+
+    #
+    # Purpose: Checks that every chromosome is in bp order
+    # Returns: Nothing
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: ValueError naming the first SNP that is out of order
+    #
+    def validate(self):
+
+        for chr in self.maps.keys():
+            bp = self.maps[chr][I_BP]
+            for i in range(1, len(bp)):
+                if bp[i] < bp[i - 1]:
+                    raise ValueError('chromosome %s is not in bp order at SNP %d' % (chr, i + 1))
+
+#
+# Purpose: Computes the checksum of a file
+# Returns: md5 hex digest
+# Assumes: Nothing
+# Effects: reads the file
+# Throws: IOError
+#
+def checksum(fileName):
+
+    md5 = hashlib.md5()
+    fp = open(fileName, 'rb')
+
+    try:
+        block = fp.read(1048576)
+        while block:
+            md5.update(block)
+            block = fp.read(1048576)
+    finally:
+        fp.close()
+
+    return md5.hexdigest()
+
+#
+# Purpose: Writes the SNP map to a binary cache file
+# Returns: Nothing
+# Assumes: the SNP map has been validated
+# Effects: replaces cacheFile atomically
+#          (the file is written next to cacheFile, then renamed)
+# Throws: IOError, OSError
+#
+# Args:
+#   snpMap    SnpMap
+#   cacheFile name of the cache file
+#   sum       checksum of the SNP map file that snpMap was read from
+#
+def writeCache(snpMap, cacheFile, sum):
+
+    chromosomes = snpMap.chromosomes()
+    chromosomes.sort()
+
+    offset = struct.calcsize(CACHE_HEADER) + \
+             struct.calcsize(CACHE_ENTRY) * len(chromosomes)
+
+    tmpFile = '%s.%d.tmp' % (cacheFile, os.getpid())
+    fp = open(tmpFile, 'wb')
+
+    try:
+        fp.write(struct.pack(CACHE_HEADER, CACHE_MAGIC, sum, len(chromosomes)))
+
+        for chr in chromosomes:
+            fp.write(struct.pack(CACHE_ENTRY, chr, snpMap.size(chr), offset))
+            offset = offset + 4 * 8 * snpMap.size(chr)
+
+        for chr in chromosomes:
+            for index in (I_BP, I_FCM, I_MCM, I_ACM):
+                a = array.array('d', snpMap.column(chr, index))
+                if sys.byteorder == 'big':
+                    a.byteswap()
+                a.tofile(fp)
+
+        fp.flush()
+        os.fsync(fp.fileno())
+        fp.close()
+        os.rename(tmpFile, cacheFile)
+    except:
+        fp.close()
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+        raise
+
+#
+# Purpose: Reads the SNP map from a binary cache file
+# Returns: SnpMap, or None if the cache file does not exist, is not
+#          a cache file or was built from a different SNP map file
+# Assumes: Nothing
+# Effects: memory-maps cacheFile
+# Throws: Nothing
+#
+# Args:
+#   cacheFile name of the cache file
+#   sum       checksum of the current SNP map file
+#
+def readCache(cacheFile, sum):
+
+    try:
+        fp = open(cacheFile, 'rb')
+    except IOError:
+        return None
+
+    try:
+        try:
+            mm = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+        except (mmap.error, ValueError):
+            return None
+    finally:
+        fp.close()
+
+    headerSize = struct.calcsize(CACHE_HEADER)
+    entrySize = struct.calcsize(CACHE_ENTRY)
+
+    if len(mm) < headerSize:
+        mm.close()
+        return None
+
+    (magic, cacheSum, nchr) = struct.unpack_from(CACHE_HEADER, mm, 0)
+
+    if magic != CACHE_MAGIC or cacheSum != sum \
+       or len(mm) < headerSize + entrySize * nchr:
+        mm.close()
+        return None
+
+    snpMap = SnpMap()
+    snpMap.mmap = mm
+
+    for i in range(nchr):
+
+        (chr, n, offset) = struct.unpack_from(CACHE_ENTRY, mm, headerSize + entrySize * i)
+        chr = chr.rstrip('\0')
+
+        if offset + 4 * 8 * n > len(mm):
+            mm.close()
+            return None
+
+        columns = []
+        for index in (I_BP, I_FCM, I_MCM, I_ACM):
+            start = offset + index * 8 * n
+            if numpy:
+                columns.append(numpy.frombuffer(mm, dtype = '<f8', count = n, offset = start))
+            else:
+                a = array.array('d')
+                a.fromstring(mm[start:start + 8 * n])
+                if sys.byteorder == 'big':
+                    a.byteswap()
+                columns.append(a)
+
+        snpMap.setColumns(chr, columns)
+
+    return snpMap
+
+#
+# Purpose: Reads the SNP/baseline map file, one line at a time
+# Returns: SnpMap
+# Assumes: the first line is a header
+#          the SNPs of each chromosome are in bp order
+# Effects: Nothing
+# Throws: ValueError if a line cannot be parsed
+#
+# Args:
+#   fp        open SNP map file (snpID,chr,build37,fem_cM,mal_cM,ave_cM)
+#
+def readSnpMap(fp):
+
+    snpMap = SnpMap()
+
+    # skip header line
+    fp.readline()
+
+    for line in fp:
+
+        (snpid, chr, bp, fcM, mcM, acM) = line.split(COMMA)
+
+        # chromosome 20 (X) only has a female map
+        if chr == '20':
+            mcM = acM = fcM
+
+        snpMap.append(chr, float(bp), float(fcM), float(mcM), float(acM))
+
+    return snpMap